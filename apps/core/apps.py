@@ -3,3 +3,7 @@ from django.apps import AppConfig
 class CoreConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'apps.core'
+
+    def ready(self):
+        # Version-stamp cached User/Cab entries on model saves
+        from . import signals  # noqa: F401
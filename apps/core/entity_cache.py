@@ -0,0 +1,179 @@
+import threading
+import time
+from typing import Any, Dict, Iterable, Optional
+
+from asgiref.sync import sync_to_async
+from django.apps import apps
+from django.conf import settings
+from django.core.cache import cache
+
+from apps.core.lru import LRUCache
+
+# Local-tier marker for a primary key known not to exist (cache_misses)
+_MISSING = object()
+
+
+class EntityCache:
+    """
+    Two-tier read-through cache of model instances by primary key: a
+    process-local LRU in front of the shared Django cache (Redis).
+
+    Every entity has a version counter in the shared cache, bumped by
+    invalidate() (wired to model saves/deletes in apps.core.signals), and
+    shared entries are keyed by that version, so a stale copy is never served
+    from the shared tier. Local entries are trusted for
+    ENTITY_CACHE_LOCAL_TTL_SECONDS and then revalidated against the version
+    counter (one cache GET, no DB query while unchanged); the process that
+    saved an entity drops its local copy immediately.
+
+    Only read fields that change through model saves. Queryset updates (e.g.
+    cab status claims in the pooling engine) bypass the signals, so a cached
+    Cab is trusted for its static fields such as total_seats and
+    luggage_capacity, never for status or position.
+
+    With cache_misses, lookups of primary keys that don't exist are
+    remembered in the local tier under the same version check, so repeated
+    lookups of unknown ids (e.g. pings from unregistered cabs) don't reach
+    the database; creating the entity bumps its version like any save.
+    """
+
+    def __init__(
+        self, model_label: str, local_size: int = None, local_ttl: float = None, shared_ttl: int = None,
+        cache_misses: bool = False
+    ):
+        self.model_label = model_label
+        self.cache_misses = cache_misses
+        self.local_ttl = (
+            local_ttl if local_ttl is not None
+            else getattr(settings, 'ENTITY_CACHE_LOCAL_TTL_SECONDS', 5.0)
+        )
+        self.shared_ttl = (
+            shared_ttl if shared_ttl is not None
+            else getattr(settings, 'ENTITY_CACHE_SHARED_TTL_SECONDS', 3600)
+        )
+        # pk -> (version, instance, validated_at)
+        self._local = LRUCache(maxsize=local_size or getattr(settings, 'ENTITY_CACHE_LOCAL_SIZE', 10000))
+        self._counter_lock = threading.Lock()
+        self.local_hits = 0
+        self.shared_hits = 0
+        self.misses = 0
+
+    @property
+    def model(self):
+        return apps.get_model(self.model_label)
+
+    def _version_key(self, pk) -> str:
+        return f"entity:{self.model_label}:{pk}:v"
+
+    def _data_key(self, pk, version) -> str:
+        return f"entity:{self.model_label}:{pk}:{version}"
+
+    def _count(self, counter: str, amount: int = 1):
+        with self._counter_lock:
+            setattr(self, counter, getattr(self, counter) + amount)
+
+    def _fresh_local(self, pk) -> Optional[Any]:
+        """The local entry's instance (or _MISSING) while its lease lasts, else None."""
+        local = self._local.get(pk)
+        if local is not None and time.monotonic() - local[2] < self.local_ttl:
+            self._count('local_hits')
+            return local[1]
+        return None
+
+    def get(self, pk) -> Optional[Any]:
+        """The instance with this primary key, or None if it doesn't exist."""
+        instance = self._fresh_local(pk)
+        if instance is None:
+            return self.get_many([pk]).get(pk)
+        return None if instance is _MISSING else instance
+
+    async def aget(self, pk) -> Optional[Any]:
+        """get() for async views: a fresh local hit never leaves the event loop."""
+        instance = self._fresh_local(pk)
+        if instance is None:
+            return await sync_to_async(self.get)(pk)
+        return None if instance is _MISSING else instance
+
+    def get_many(self, pks: Iterable) -> Dict[Any, Any]:
+        """
+        Instances by primary key (missing ones omitted), with at most two
+        shared cache round trips and one query for the whole set.
+        """
+        found, stale = {}, []
+        local_hits = 0
+        now = time.monotonic()
+        for pk in set(pks):
+            local = self._local.get(pk)
+            if local is not None and now - local[2] < self.local_ttl:
+                local_hits += 1
+                if local[1] is not _MISSING:
+                    found[pk] = local[1]
+            else:
+                stale.append((pk, local))
+        self._count('local_hits', local_hits)
+        if not stale:
+            return found
+
+        versions = cache.get_many([self._version_key(pk) for pk, _ in stale])
+        shared_keys, to_fetch = {}, {}
+        for pk, local in stale:
+            version = versions.get(self._version_key(pk), 0)
+            if local is not None and local[0] == version:
+                # Unchanged since it was cached: extend its local lease
+                self._local.set(pk, (version, local[1], now))
+                if local[1] is not _MISSING:
+                    found[pk] = local[1]
+                self._count('local_hits')
+            else:
+                shared_keys[self._data_key(pk, version)] = (pk, version)
+
+        if shared_keys:
+            shared = cache.get_many(list(shared_keys))
+            for key, (pk, version) in shared_keys.items():
+                if key in shared:
+                    found[pk] = shared[key]
+                    self._local.set(pk, (version, shared[key], now))
+                    self._count('shared_hits')
+                else:
+                    to_fetch[pk] = version
+
+        if to_fetch:
+            self._count('misses', len(to_fetch))
+            fetched = self.model.objects.in_bulk(list(to_fetch))
+            for pk, instance in fetched.items():
+                found[pk] = instance
+                self._local.set(pk, (to_fetch[pk], instance, now))
+            if self.cache_misses:
+                for pk in to_fetch.keys() - fetched.keys():
+                    self._local.set(pk, (to_fetch[pk], _MISSING, now))
+            if fetched:
+                cache.set_many(
+                    {self._data_key(pk, to_fetch[pk]): instance for pk, instance in fetched.items()},
+                    timeout=self.shared_ttl
+                )
+        return found
+
+    def invalidate(self, pk):
+        self._local.pop(pk)
+        key = self._version_key(pk)
+        if not cache.add(key, 1, timeout=None):
+            try:
+                cache.incr(key)
+            except ValueError:
+                # Evicted between add() and incr()
+                cache.add(key, 1, timeout=None)
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.local_hits + self.shared_hits + self.misses
+        return {
+            "local_hits": self.local_hits,
+            "shared_hits": self.shared_hits,
+            "misses": self.misses,
+            "local_size": len(self._local),
+            "hit_rate": round((self.local_hits + self.shared_hits) / lookups, 4) if lookups else 0.0,
+        }
+
+
+user_cache = EntityCache('users.User')
+cab_cache = EntityCache('rides.Cab', cache_misses=True)
+
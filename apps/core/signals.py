@@ -0,0 +1,22 @@
+from django.db import transaction
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+
+from apps.core.entity_cache import cab_cache, user_cache
+from apps.rides.models import Cab
+from apps.users.models import User
+
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def invalidate_cached_user(sender, instance, **kwargs):
+    # After commit, so a concurrent reader can't re-cache the old row under the new version
+    user_id = instance.id
+    transaction.on_commit(lambda: user_cache.invalidate(user_id))
+
+
+@receiver(post_save, sender=Cab)
+@receiver(post_delete, sender=Cab)
+def invalidate_cached_cab(sender, instance, **kwargs):
+    cab_id = instance.id
+    transaction.on_commit(lambda: cab_cache.invalidate(cab_id))
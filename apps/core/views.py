@@ -6,10 +6,14 @@ from rest_framework.response import Response
 from drf_yasg.utils import swagger_auto_schema
 from drf_yasg import openapi
 
-from apps.rides.models import RideRequest, Cab
-from apps.pooling.models import Pool, PoolMember
+from apps.rides.models import RideRequest
+from apps.pooling.models import Pool
 from apps.users.models import User
-from apps.rides.tasks import match_pool_task, sync_pool_route_task
+from apps.rides.cancellation import request_cancellations
+from apps.rides.tasks import match_pool_task
+from apps.pricing.demand import demand_tracker
+from apps.pricing.quote_cache import quote_cache
+from .entity_cache import cab_cache, user_cache
 from .tasks import sample_async_task
 
 # --- Dashboard Views (Templates) ---
@@ -34,6 +38,7 @@ def create_ride_view(request):
             detour_tolerance_minutes=request.POST.get('detour_tolerance_minutes')
         )
         
+        demand_tracker.record_request(ride.pickup_lat, ride.pickup_lng)
         match_pool_task.delay(ride.id)
         messages.success(request, f"Ride #{ride.id} created successfully! Pooling started.")
         return redirect('dashboard')
@@ -51,17 +56,9 @@ def view_pools_view(request):
 
 def cancel_ride_view(request, ride_id):
     if request.method == 'POST':
-        ride = get_object_or_404(RideRequest, id=ride_id)
-        ride.status = RideRequest.Status.CANCELLED
-        ride.save()
-        
-        memberships = PoolMember.objects.filter(ride_request=ride)
-        pool_ids = list(memberships.values_list('pool_id', flat=True))
-        memberships.delete()
-        
-        for pid in pool_ids:
-            sync_pool_route_task.delay(pid)
-            
+        get_object_or_404(RideRequest, id=ride_id)
+        # Pools are updated by the next coalesced cancellation run
+        request_cancellations([ride_id])
         messages.info(request, f"Ride #{ride_id} has been cancelled.")
     return redirect('dashboard')
 
@@ -125,6 +122,8 @@ def debug_stats(request):
         "pooled_requests": pooled_reqs,
         "active_pools": active_pools,
         "avg_passengers_per_pool": round(avg_passengers, 2),
+        "quote_cache": quote_cache.stats(),
+        "entity_cache": {"user": user_cache.stats(), "cab": cab_cache.stats()},
         "system_status": "Healthy",
         "timestamp": time.time()
     })
@@ -8,14 +8,14 @@ class PoolMemberInline(admin.TabularInline):
 
 @admin.register(Pool)
 class PoolAdmin(admin.ModelAdmin):
-    list_display = ('id', 'cab', 'status', 'created_at')
+    list_display = ('id', 'cab', 'status', 'seats_used', 'luggage_used', 'created_at')
     list_filter = ('status', 'created_at')
     search_fields = ('cab__driver_name', 'id')
-    readonly_fields = ('created_at', 'updated_at')
+    readonly_fields = ('seats_used', 'luggage_used', 'created_at', 'updated_at')
     inlines = [PoolMemberInline]
 
 @admin.register(PoolMember)
 class PoolMemberAdmin(admin.ModelAdmin):
-    list_display = ('id', 'pool', 'ride_request', 'sequence_order', 'pickup_eta')
+    list_display = ('id', 'pool', 'ride_request', 'sequence_order', 'drop_sequence_order', 'pickup_eta')
     list_filter = ('pool', 'sequence_order')
     autocomplete_fields = ['pool', 'ride_request']
@@ -3,3 +3,7 @@ from django.apps import AppConfig
 class PoolingConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'apps.pooling'
+
+    def ready(self):
+        # Keep the in-memory spatial indexes in sync with model changes
+        from . import signals  # noqa: F401
@@ -0,0 +1,75 @@
+from datetime import datetime, timedelta
+from typing import Dict, List, Sequence, Tuple
+
+import numpy as np
+from django.conf import settings
+from django.utils import timezone
+
+from apps.pooling.geo import haversine_pairs
+
+# Fallback when POOLING_SPEED_PROFILE_KMH is not configured: ~30 km/h, the
+# same "1 minute of detour is roughly 0.5km" assumption the matcher uses
+DEFAULT_SPEED_KMH = 30.0
+
+
+def speed_profile() -> np.ndarray:
+    """Average driving speed (km/h) for each hour of the day, index 0-23."""
+    profile = np.asarray(
+        getattr(settings, 'POOLING_SPEED_PROFILE_KMH', None) or [DEFAULT_SPEED_KMH] * 24,
+        dtype=np.float64
+    )
+    if profile.shape != (24,) or (profile <= 0).any():
+        raise ValueError("POOLING_SPEED_PROFILE_KMH must hold 24 positive speeds, one per hour")
+    return profile
+
+
+def compute_route_etas(routes: Sequence[Tuple[float, float, List[Dict]]], start: datetime = None) -> List[List[datetime]]:
+    """
+    Arrival time at every stop of many routes in one vectorized pass.
+
+    `routes` is a list of (cab_lat, cab_lng, stops) where stops are the
+    optimizer's stop dicts in visiting order. All legs of all routes are laid
+    end to end in flat arrays, so distances, leg times and the per-route
+    cumulative sums are a handful of NumPy calls regardless of pool count.
+
+    Each leg is driven at the speed of the hour it starts in. Leg start times
+    depend on the speeds of the earlier legs, so times are first estimated at
+    the departure hour's speed and then refined once with per-leg speeds,
+    which is exact unless a single leg crosses two hour boundaries.
+    """
+    start = start or timezone.now()
+    lengths = np.array([len(stops) for _, _, stops in routes], dtype=np.int64)
+    if not lengths.sum():
+        return [[] for _ in routes]
+
+    # Leg i of a route runs from its previous point (the cab for the first stop) to stop i
+    from_points, to_points = [], []
+    for cab_lat, cab_lng, stops in routes:
+        previous = (float(cab_lat), float(cab_lng))
+        for stop in stops:
+            point = (float(stop['coords'][0]), float(stop['coords'][1]))
+            from_points.append(previous)
+            to_points.append(point)
+            previous = point
+    from_points = np.asarray(from_points, dtype=np.float64)
+    to_points = np.asarray(to_points, dtype=np.float64)
+    leg_km = haversine_pairs(from_points[:, 0], from_points[:, 1], to_points[:, 0], to_points[:, 1])
+
+    profile = speed_profile()
+    local_start = timezone.localtime(start) if timezone.is_aware(start) else start
+    start_minute = local_start.hour * 60 + local_start.minute + local_start.second / 60
+    route_starts = np.concatenate(([0], np.cumsum(lengths)[:-1]))
+
+    def arrivals(leg_minutes):
+        # Per-route cumulative sum: global cumsum minus the total before each route
+        totals = np.cumsum(leg_minutes)
+        before = np.concatenate(([0.0], totals))[route_starts]
+        return totals - np.repeat(before, lengths)
+
+    leg_minutes = leg_km / profile[int(start_minute // 60) % 24] * 60
+    arrival = arrivals(leg_minutes)
+    departure_hour = ((start_minute + arrival - leg_minutes) // 60).astype(np.int64) % 24
+    arrival = arrivals(leg_km / profile[departure_hour] * 60)
+
+    etas = [start + timedelta(minutes=float(minutes)) for minutes in arrival]
+    return [etas[offset:offset + length] for offset, length in zip(route_starts, lengths)]
@@ -0,0 +1,79 @@
+from math import radians, cos, sin, asin, sqrt
+from typing import Iterable, Tuple
+
+import numpy as np
+
+EARTH_RADIUS_KM = 6371  # Radius of earth in kilometers. Use 3956 for miles
+
+
+def haversine(lat1, lon1, lat2, lon2):
+    """
+    Calculate the great circle distance between two points
+    on the earth (specified in decimal degrees)
+    """
+    # convert decimal degrees to radians
+    lat1, lon1, lat2, lon2 = map(radians, [float(lat1), float(lon1), float(lat2), float(lon2)])
+
+    # haversine formula
+    dlon = lon2 - lon1
+    dlat = lat2 - lat1
+    a = sin(dlat/2)**2 + cos(lat1) * cos(lat2) * sin(dlon/2)**2
+    c = 2 * asin(sqrt(a))
+    return c * EARTH_RADIUS_KM
+
+
+def to_coord_arrays(points: Iterable[Tuple]) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Converts an iterable of (lat, lng) pairs (floats or Decimals) into two
+    float64 arrays. Missing coordinates become NaN so they never match.
+    """
+    coords = np.array(
+        [(np.nan if lat is None else float(lat), np.nan if lng is None else float(lng)) for lat, lng in points],
+        dtype=np.float64
+    ).reshape(-1, 2)
+    return coords[:, 0], coords[:, 1]
+
+
+def haversine_many(lat, lng, lats, lngs) -> np.ndarray:
+    """
+    One-to-many great circle distances (km) from a single point to every
+    point in the `lats`/`lngs` arrays. NaN coordinates yield NaN distances.
+    """
+    lat = radians(float(lat))
+    lng = radians(float(lng))
+    lats = np.radians(np.asarray(lats, dtype=np.float64))
+    lngs = np.radians(np.asarray(lngs, dtype=np.float64))
+
+    a = np.sin((lats - lat) / 2) ** 2 + cos(lat) * np.cos(lats) * np.sin((lngs - lng) / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.clip(a, 0.0, 1.0)))
+
+
+def haversine_matrix(lats_a, lngs_a, lats_b=None, lngs_b=None) -> np.ndarray:
+    """
+    Full distance matrix (km) of shape (len(a), len(b)) between two point sets.
+    When the second set is omitted, returns the pairwise matrix of the first.
+    """
+    if lats_b is None:
+        lats_b, lngs_b = lats_a, lngs_a
+
+    lats_a = np.radians(np.asarray(lats_a, dtype=np.float64))[:, None]
+    lngs_a = np.radians(np.asarray(lngs_a, dtype=np.float64))[:, None]
+    lats_b = np.radians(np.asarray(lats_b, dtype=np.float64))[None, :]
+    lngs_b = np.radians(np.asarray(lngs_b, dtype=np.float64))[None, :]
+
+    a = np.sin((lats_b - lats_a) / 2) ** 2 + np.cos(lats_a) * np.cos(lats_b) * np.sin((lngs_b - lngs_a) / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.clip(a, 0.0, 1.0)))
+
+
+def haversine_pairs(lats_a, lngs_a, lats_b, lngs_b) -> np.ndarray:
+    """
+    Element-wise great circle distances (km) between a[i] and b[i], e.g. the
+    consecutive legs of many routes laid end to end.
+    """
+    lats_a = np.radians(np.asarray(lats_a, dtype=np.float64))
+    lngs_a = np.radians(np.asarray(lngs_a, dtype=np.float64))
+    lats_b = np.radians(np.asarray(lats_b, dtype=np.float64))
+    lngs_b = np.radians(np.asarray(lngs_b, dtype=np.float64))
+
+    a = np.sin((lats_b - lats_a) / 2) ** 2 + np.cos(lats_a) * np.cos(lats_b) * np.sin((lngs_b - lngs_a) / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.clip(a, 0.0, 1.0)))
@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+from apps.pooling.models import Pool
+
+class Command(BaseCommand):
+    help = 'Rebuilds the pools\' seats_used/luggage_used counters from their members'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'pool_ids',
+            nargs='*',
+            type=int,
+            help='Pools to repair (defaults to every pool)'
+        )
+
+    def handle(self, *args, **options):
+        updated = Pool.recompute_usage(options['pool_ids'] or None)
+        self.stdout.write(self.style.SUCCESS(f"Recomputed usage for {updated} pools"))
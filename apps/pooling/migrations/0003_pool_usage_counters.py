@@ -0,0 +1,44 @@
+# Generated by Django 4.2.30 on 2026-10-16 21:03
+
+from django.db import migrations, models
+from django.db.models import OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+
+
+def backfill_usage(apps, schema_editor):
+    Pool = apps.get_model('pooling', 'Pool')
+    PoolMember = apps.get_model('pooling', 'PoolMember')
+
+    def member_total(field):
+        return Coalesce(Subquery(
+            PoolMember.objects.filter(pool=OuterRef('pk'))
+            .values('pool')
+            .annotate(total=Sum(f'ride_request__{field}'))
+            .values('total')[:1]
+        ), Value(0))
+
+    Pool.objects.update(
+        seats_used=member_total('seats_required'),
+        luggage_used=member_total('luggage_units')
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pooling', '0002_poolmember'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='pool',
+            name='luggage_used',
+            field=models.PositiveSmallIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='pool',
+            name='seats_used',
+            field=models.PositiveSmallIntegerField(default=0),
+        ),
+        migrations.RunPython(backfill_usage, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 4.2.30 on 2026-10-16 21:14
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pooling', '0003_pool_usage_counters'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='poolmember',
+            name='drop_sequence_order',
+            field=models.PositiveSmallIntegerField(blank=True, null=True),
+        ),
+    ]
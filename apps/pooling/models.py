@@ -1,7 +1,16 @@
-from django.db import models
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.db import models, transaction
+from django.db.models import OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+from django.core.exceptions import ValidationError
 from apps.core.models import BaseModel
 from apps.rides.models import Cab
 
+# Set while a set-wise writer adjusts the usage counters itself
+_usage_managed = ContextVar('pool_usage_managed', default=False)
+
 class Pool(BaseModel):
     class Status(models.TextChoices):
         POOLED = 'pooled', 'Pooled'
@@ -19,10 +28,95 @@ class Pool(BaseModel):
         default=Status.POOLED,
         db_index=True
     )
+    # Denormalized capacity usage, kept in step by PoolMember saves and deletes
+    seats_used = models.PositiveSmallIntegerField(default=0)
+    luggage_used = models.PositiveSmallIntegerField(default=0)
 
     def __str__(self):
         return f"Pool {self.id} - {self.cab.driver_name} ({self.status})"
 
+    @classmethod
+    def reserve_capacity(cls, pool_id, seats: int, luggage: int) -> bool:
+        """
+        Conditional, atomic increment of the usage counters: succeeds only if
+        the pool still has room. Safe against concurrent matchers on any backend.
+        """
+        return cls.objects.filter(
+            id=pool_id,
+            seats_used__lte=models.F('cab__total_seats') - seats,
+            luggage_used__lte=models.F('cab__luggage_capacity') - luggage
+        ).update(
+            seats_used=models.F('seats_used') + seats,
+            luggage_used=models.F('luggage_used') + luggage
+        ) == 1
+
+    @classmethod
+    def adjust_usage(cls, pool_id, seats_delta: int, luggage_delta: int):
+        """
+        Atomically shifts the usage counters of a pool with F-expressions.
+        Positive deltas when members join, negative when they leave.
+        """
+        cls.objects.filter(id=pool_id).update(
+            seats_used=models.F('seats_used') + seats_delta,
+            luggage_used=models.F('luggage_used') + luggage_delta
+        )
+
+    @classmethod
+    @contextmanager
+    def usage_managed(cls):
+        """
+        PoolMember saves and deletes inside the block leave the usage
+        counters alone, for callers that adjust them once per pool instead.
+        """
+        token = _usage_managed.set(True)
+        try:
+            yield
+        finally:
+            _usage_managed.reset(token)
+
+    @classmethod
+    def usage_is_managed(cls) -> bool:
+        return _usage_managed.get()
+
+    @classmethod
+    def recompute_usage(cls, pool_ids=None) -> int:
+        """
+        Rebuilds the usage counters from the member rows in one UPDATE,
+        repairing drift from writes that bypassed the ORM. Returns the
+        number of pools updated.
+        """
+        def member_total(field):
+            return Coalesce(Subquery(
+                PoolMember.objects.filter(pool=OuterRef('pk'))
+                .values('pool')
+                .annotate(total=Sum(f'ride_request__{field}'))
+                .values('total')[:1]
+            ), Value(0))
+
+        pools = cls.objects.all() if pool_ids is None else cls.objects.filter(id__in=pool_ids)
+        return pools.update(
+            seats_used=member_total('seats_required'),
+            luggage_used=member_total('luggage_units')
+        )
+
+    def validate_capacity(self, seats: int, luggage: int):
+        """
+        Checks a whole member set against the cab at once, for set-based
+        writes that bypass PoolMember.full_clean(). Load the cab with the
+        pool (select_related('cab')) to avoid a query per pool.
+        """
+        total_seats, luggage_capacity = self.cab.total_seats, self.cab.luggage_capacity
+        if seats > total_seats:
+            raise ValidationError(
+                f"Pool {self.id} members need {seats} seats, "
+                f"cab capacity is {total_seats}"
+            )
+        if luggage > luggage_capacity:
+            raise ValidationError(
+                f"Pool {self.id} members need {luggage} luggage units, "
+                f"cab capacity is {luggage_capacity}"
+            )
+
     class Meta:
         verbose_name = "Pool"
         verbose_name_plural = "Pools"
@@ -30,8 +124,6 @@ class Pool(BaseModel):
 
 
 from apps.rides.models import RideRequest
-from django.core.exceptions import ValidationError
-from django.db.models import Sum
 
 class PoolMember(BaseModel):
     pool = models.ForeignKey(
@@ -45,42 +137,69 @@ class PoolMember(BaseModel):
         related_name='pool_memberships'
     )
     sequence_order = models.PositiveSmallIntegerField(default=1)
+    # Position of the drop stop in the pool route (sequence_order is the pickup's)
+    drop_sequence_order = models.PositiveSmallIntegerField(null=True, blank=True)
     pickup_eta = models.DateTimeField(null=True, blank=True)
     drop_eta = models.DateTimeField(null=True, blank=True)
 
     def clean(self):
         super().clean()
         
-        # Calculate current usage in the pool (excluding self if already exists)
-        current_members = self.pool.members.exclude(id=self.id)
-        
-        current_seats = current_members.aggregate(
-            total=Sum('ride_request__seats_required')
-        )['total'] or 0
-        
-        current_luggage = current_members.aggregate(
-            total=Sum('ride_request__luggage_units')
-        )['total'] or 0
+        # Current usage comes from the pool's denormalized counters: one row
+        # read instead of aggregating over every member.
+        current_seats, current_luggage, total_seats, luggage_capacity = Pool.objects.filter(
+            id=self.pool_id
+        ).values_list(
+            'seats_used', 'luggage_used', 'cab__total_seats', 'cab__luggage_capacity'
+        ).get()
 
-        cab = self.pool.cab
+        # Existing members are already counted, so exclude self
+        if self.pk:
+            current_seats -= self.ride_request.seats_required
+            current_luggage -= self.ride_request.luggage_units
         
         # Check seat constraints
-        if current_seats + self.ride_request.seats_required > cab.total_seats:
+        if current_seats + self.ride_request.seats_required > total_seats:
             raise ValidationError(
                 f"Adding this ride request would exceed the cab's seat capacity "
-                f"({cab.total_seats}). Current: {current_seats}, Required: {self.ride_request.seats_required}"
+                f"({total_seats}). Current: {current_seats}, Required: {self.ride_request.seats_required}"
             )
 
         # Check luggage constraints
-        if current_luggage + self.ride_request.luggage_units > cab.luggage_capacity:
+        if current_luggage + self.ride_request.luggage_units > luggage_capacity:
             raise ValidationError(
                 f"Adding this ride request would exceed the cab's luggage capacity "
-                f"({cab.luggage_capacity}). Current: {current_luggage}, Units: {self.ride_request.luggage_units}"
+                f"({luggage_capacity}). Current: {current_luggage}, Units: {self.ride_request.luggage_units}"
             )
 
     def save(self, *args, **kwargs):
+        """
+        Validates, then moves the member's seats and luggage into the pool's
+        usage counters: reserved on create, moved when the member changes
+        pool or ride. Deletes are released by a post_delete receiver.
+        """
         self.full_clean()
-        super().save(*args, **kwargs)
+        if Pool.usage_is_managed():
+            super().save(*args, **kwargs)
+            return
+
+        with transaction.atomic():
+            previous = None
+            if not self._state.adding:
+                previous = PoolMember.objects.filter(pk=self.pk).values_list(
+                    'pool_id', 'ride_request_id', 'ride_request__seats_required', 'ride_request__luggage_units'
+                ).first()
+            super().save(*args, **kwargs)
+            if previous and previous[:2] == (self.pool_id, self.ride_request_id):
+                return
+
+            if previous:
+                Pool.adjust_usage(previous[0], -previous[2], -previous[3])
+            # A concurrent matcher may have filled the pool since clean()
+            if not Pool.reserve_capacity(
+                self.pool_id, self.ride_request.seats_required, self.ride_request.luggage_units
+            ):
+                raise ValidationError(f"Pool {self.pool_id} has no room left for ride request {self.ride_request_id}.")
 
     def __str__(self):
         return f"Pool {self.pool.id} Member - {self.ride_request.user.name}"
@@ -0,0 +1,432 @@
+import hashlib
+import time
+from typing import List, Dict, Iterable, Optional, Tuple
+
+import numpy as np
+from django.conf import settings
+from django.core.cache import cache
+
+from apps.core.lru import LRUCache
+from apps.pooling.geo import haversine, haversine_many, haversine_matrix, haversine_pairs, to_coord_arrays
+
+# 1 minute of detour is roughly 0.5km at city speeds
+DETOUR_KM_PER_MINUTE = 0.5
+
+# Exact routes memoized by quantized stop set, shared by all optimizer instances
+route_memo = LRUCache(maxsize=getattr(settings, 'ROUTE_MEMO_SIZE', 10000))
+
+
+def build_stops(members_data: List[Dict]) -> List[Dict]:
+    """
+    Expands members into stops. Member k owns stops 2k (pickup) and 2k + 1 (drop).
+    """
+    stops = []
+    for member in members_data:
+        stops.append({
+            'type': 'PICKUP',
+            'id': member['id'],
+            'coords': member['pickup'],
+            'target': member['id']
+        })
+        stops.append({
+            'type': 'DROP',
+            'id': member['id'],
+            'coords': member['drop'],
+            'target': member['id']
+        })
+    return stops
+
+
+def stop_distance_matrix(cab_lat, cab_lng, stops: List[Dict]) -> List[List[float]]:
+    """
+    One distance matrix per pool: row/col 0 is the cab, stop i is at i + 1.
+    Returned as nested lists, which are faster than ndarray indexing in the
+    scalar loops of the route heuristics.
+    """
+    point_lats, point_lngs = to_coord_arrays(
+        [(cab_lat, cab_lng)] + [stop['coords'] for stop in stops]
+    )
+    return haversine_matrix(point_lats, point_lngs).tolist()
+
+
+def route_length(order: List[int], dist: List[List[float]]) -> float:
+    """Length of the open path cab -> order[0] -> ... -> order[-1]."""
+    total = 0.0
+    prev = 0
+    for stop_idx in order:
+        total += dist[prev][stop_idx + 1]
+        prev = stop_idx + 1
+    return total
+
+
+def respects_precedence(order: List[int]) -> bool:
+    """Every drop (odd index) comes after its own pickup (the even index before it)."""
+    seen = set()
+    for stop_idx in order:
+        if stop_idx % 2 == 1 and stop_idx - 1 not in seen:
+            return False
+        seen.add(stop_idx)
+    return True
+
+
+def evaluate_insertion(
+    cab_lat, cab_lng, stops: List[Dict], pickup, drop,
+    tolerance_km: Dict[int, float], new_tolerance_km: float
+) -> Optional[Tuple[float, int, int]]:
+    """
+    Cheapest feasible way to add a rider to an existing route without
+    re-optimizing it.
+
+    `stops` is the pool's current stop sequence (optimizer stop dicts) and
+    `tolerance_km` maps each member id to its allowed detour in km. Gap g
+    means "between path point g and g + 1" (point 0 is the cab, g == n
+    appends). Each gap's insertion delta costs O(1) from three O(n) distance
+    vectors, and a (pickup gap, drop gap) pair is feasible when:
+    - every existing member's ride grows by no more than their slack
+      (tolerance + direct distance - current ride distance), and
+    - the new rider's own ride is within `new_tolerance_km` of direct.
+    All pairs and members are checked at once with NumPy broadcasting.
+
+    Returns (added_km, pickup_gap, drop_gap) or None if no pair is feasible.
+    """
+    n = len(stops)
+    lats, lngs = to_coord_arrays([(cab_lat, cab_lng)] + [stop['coords'] for stop in stops])
+    legs = haversine_pairs(lats[:-1], lngs[:-1], lats[1:], lngs[1:])
+    at_point = np.concatenate(([0.0], np.cumsum(legs)))
+    to_pickup = haversine_many(pickup[0], pickup[1], lats, lngs)
+    to_drop = haversine_many(drop[0], drop[1], lats, lngs)
+    direct = haversine(pickup[0], pickup[1], drop[0], drop[1])
+
+    # Gap g: point g -> new stop -> point g + 1 replaces the leg g -> g + 1
+    # (the last gap has no following leg)
+    next_leg = np.append(legs, 0.0)
+    pickup_next = np.append(to_pickup[1:], 0.0)
+    drop_next = np.append(to_drop[1:], 0.0)
+    delta_pickup = to_pickup + pickup_next - next_leg
+    delta_drop = to_drop + drop_next - next_leg
+    delta_both = to_pickup + direct + drop_next - next_leg
+
+    k = np.arange(n + 1)[:, None]
+    l = np.arange(n + 1)[None, :]
+    same_gap = k == l
+    added = np.where(same_gap, delta_both[:, None], delta_pickup[:, None] + delta_drop[None, :])
+    feasible = l >= k
+
+    # New rider: pickup, the route between points k + 1 and l, then drop
+    inner = np.minimum(k + 1, n)
+    new_ride = np.where(same_gap, direct, to_pickup[inner] + at_point[l] - at_point[inner] + to_drop[l])
+    feasible &= new_ride - direct <= new_tolerance_km + 1e-9
+
+    if n:
+        position = {(stop['type'], stop['id']): idx + 1 for idx, stop in enumerate(stops)}
+        member_ids = list(tolerance_km)
+        starts = np.array([position[('PICKUP', mid)] for mid in member_ids])
+        ends = np.array([position[('DROP', mid)] for mid in member_ids])
+        member_direct = haversine_pairs(lats[starts], lngs[starts], lats[ends], lngs[ends])
+        slack = (
+            np.array([tolerance_km[mid] for mid in member_ids]) + member_direct
+            - (at_point[ends] - at_point[starts])
+        )[:, None, None]
+
+        # A gap lengthens a member's ride when it lies between their pickup and drop
+        covers_pickup = (starts[:, None, None] <= k) & (k < ends[:, None, None])
+        covers_drop = (starts[:, None, None] <= l) & (l < ends[:, None, None])
+        growth = np.where(
+            same_gap,
+            covers_pickup * delta_both[:, None],
+            covers_pickup * delta_pickup[:, None] + covers_drop * delta_drop[None, :]
+        )
+        # Members whose slack is already used up only rule out gaps inside their ride
+        feasible &= ((growth <= slack + 1e-9) | ~(covers_pickup | covers_drop)).all(axis=0)
+
+    if not feasible.any():
+        return None
+    costs = np.where(feasible, added, np.inf)
+    pickup_gap, drop_gap = np.unravel_index(int(np.argmin(costs)), costs.shape)
+    return float(costs[pickup_gap, drop_gap]), int(pickup_gap), int(drop_gap)
+
+
+class RouteCache:
+    """
+    Per-pool route cache in the configured Django cache.
+
+    Entries are keyed by pool and carry a fingerprint of the member set and
+    the cab position bucket, so a route is reused until membership changes
+    or the cab moves to another bucket. Entries expire after
+    ROUTE_CACHE_TTL_SECONDS; size-based eviction is the backend's (LRU in
+    Redis with an allkeys-lru policy, culling in LocMemCache).
+
+    Entry layout: {'fingerprint', 'cab': (lat, lng), 'stops': [...],
+    'distance_km'}, where stops are the optimizer's stop dicts.
+    """
+
+    def __init__(self, ttl_seconds: int = None, cab_bucket_decimals: int = None):
+        self.ttl_seconds = (
+            ttl_seconds if ttl_seconds is not None
+            else getattr(settings, 'ROUTE_CACHE_TTL_SECONDS', 3600)
+        )
+        # 3 decimal places is a ~110m bucket for the cab position
+        self.cab_bucket_decimals = (
+            cab_bucket_decimals if cab_bucket_decimals is not None
+            else getattr(settings, 'ROUTE_CACHE_CAB_BUCKET_DECIMALS', 3)
+        )
+
+    @staticmethod
+    def key(pool_id) -> str:
+        return f"pooling:route:{pool_id}"
+
+    def fingerprint(self, cab_lat, cab_lng, ride_request_ids: Iterable[int]) -> str:
+        bucket = (round(float(cab_lat), self.cab_bucket_decimals), round(float(cab_lng), self.cab_bucket_decimals))
+        raw = f"{bucket}|{','.join(str(rid) for rid in sorted(ride_request_ids))}"
+        return hashlib.sha1(raw.encode()).hexdigest()
+
+    def get(self, pool_id) -> Optional[Dict]:
+        return cache.get(self.key(pool_id))
+
+    def get_fresh(self, pool_id, fingerprint: str) -> Optional[Dict]:
+        entry = self.get(pool_id)
+        if entry and entry.get('fingerprint') == fingerprint:
+            return entry
+        return None
+
+    def set(self, pool_id, fingerprint: str, cab_lat, cab_lng, stops: List[Dict]) -> Dict:
+        coords = [(float(cab_lat), float(cab_lng))] + [tuple(map(float, stop['coords'])) for stop in stops]
+        lats, lngs = to_coord_arrays(coords)
+        # Consecutive legs only: cab -> first stop -> ... -> last stop
+        legs = haversine_pairs(lats[:-1], lngs[:-1], lats[1:], lngs[1:])
+        entry = {
+            'fingerprint': fingerprint,
+            'cab': (float(cab_lat), float(cab_lng)),
+            'stops': stops,
+            'distance_km': float(legs.sum()),
+        }
+        cache.set(self.key(pool_id), entry, timeout=self.ttl_seconds)
+        return entry
+
+    def invalidate(self, pool_id):
+        cache.delete(self.key(pool_id))
+
+
+route_cache = RouteCache()
+
+
+def solve_exact(member_count: int, dist: List[List[float]]) -> List[int]:
+    """
+    Exact shortest open route by dynamic programming over visited-stop
+    bitmasks, with precedence: a drop is only reachable once its pickup bit
+    is set. Only reachable states are expanded (3^k subsets for k riders
+    rather than 4^k), which keeps 4-rider pools well under a millisecond.
+    """
+    n = 2 * member_count
+    # (mask, last_stop) -> cost, expanded one layer (number of visited stops) at a time
+    layer = {(1 << (2 * member), 2 * member): dist[0][2 * member + 1] for member in range(member_count)}
+    parents = {}
+
+    for _ in range(n - 1):
+        next_layer = {}
+        for (mask, last), cost in layer.items():
+            row = dist[last + 1]
+            for stop_idx in range(n):
+                if mask >> stop_idx & 1:
+                    continue
+                if stop_idx & 1 and not mask >> (stop_idx - 1) & 1:
+                    continue
+                key = (mask | 1 << stop_idx, stop_idx)
+                new_cost = cost + row[stop_idx + 1]
+                if new_cost < next_layer.get(key, float('inf')):
+                    next_layer[key] = new_cost
+                    parents[key] = (mask, last)
+        layer = next_layer
+
+    key = min(layer, key=layer.get)
+    order = []
+    while key is not None:
+        order.append(key[1])
+        key = parents.get(key)
+    return order[::-1]
+
+
+class RouteOptimizer:
+    """
+    Optimizes the stop sequence for a pool on a single distance matrix.
+
+    Pools with at most `exact_max_stops` stops are solved exactly (see
+    solve_exact) and memoized by their quantized stop set. Larger pools use:
+    - Construction: cheapest insertion of each rider's (pickup, drop) pair.
+    - Improvement: or-opt (move one stop) and 2-opt (reverse a segment) local
+      search, keeping every pickup before its drop.
+
+    Complexity Analysis:
+    - Let n = number of stops (2 per rider)
+    - Distance matrix: one vectorized O(n^2) kernel call
+    - Cheapest insertion: O(n^4) scalar steps in the worst case, trivial for
+      airport pools (n <= 8-12)
+    - Local search: O(n^3) per pass, bounded by `time_budget_ms` and
+      `max_passes` so the optimizer always returns in bounded time.
+    """
+    def __init__(self, time_budget_ms: float = None, max_passes: int = None, exact_max_stops: int = None):
+        self.time_budget_ms = (
+            time_budget_ms if time_budget_ms is not None
+            else getattr(settings, 'ROUTE_OPTIMIZER_TIME_BUDGET_MS', 20)
+        )
+        self.max_passes = (
+            max_passes if max_passes is not None
+            else getattr(settings, 'ROUTE_OPTIMIZER_MAX_PASSES', 50)
+        )
+        self.exact_max_stops = (
+            exact_max_stops if exact_max_stops is not None
+            else getattr(settings, 'ROUTE_EXACT_MAX_STOPS', 8)
+        )
+        self.memo_precision = getattr(settings, 'ROUTE_MEMO_PRECISION', 4)
+
+    def optimize_route(self, cab_lat, cab_lng, members_data: List[Dict]):
+        """
+        members_data: List of dicts with {
+            'id': ride_request_id,
+            'pickup': (lat, lng),
+            'drop': (lat, lng),
+            'tolerance': minutes
+        }
+        """
+        stops = build_stops(members_data)
+        if not stops:
+            return []
+
+        if len(stops) <= self.exact_max_stops:
+            return self._exact_route(cab_lat, cab_lng, members_data, stops)
+
+        deadline = time.perf_counter() + self.time_budget_ms / 1000
+        dist = stop_distance_matrix(cab_lat, cab_lng, stops)
+
+        order = self._cheapest_insertion(len(members_data), dist)
+        order = self._local_search(order, dist, deadline)
+        return [stops[stop_idx] for stop_idx in order]
+
+    def _exact_route(self, cab_lat, cab_lng, members_data: List[Dict], stops: List[Dict]) -> List[Dict]:
+        """
+        Memoized exact solve. Members are put in a canonical order (sorted by
+        quantized coordinates) so the same stop set hits the memo regardless
+        of member order or GPS jitter below the quantization step (~11m at 4
+        decimal places).
+        """
+        def q(value):
+            return round(float(value), self.memo_precision)
+
+        quantized = [
+            (q(m['pickup'][0]), q(m['pickup'][1]), q(m['drop'][0]), q(m['drop'][1]))
+            for m in members_data
+        ]
+        canonical = sorted(range(len(members_data)), key=lambda idx: quantized[idx])
+        key = (q(cab_lat), q(cab_lng), tuple(quantized[idx] for idx in canonical))
+
+        canonical_order = route_memo.get(key)
+        if canonical_order is None:
+            canonical_stops = build_stops([members_data[idx] for idx in canonical])
+            dist = stop_distance_matrix(cab_lat, cab_lng, canonical_stops)
+            canonical_order = tuple(solve_exact(len(members_data), dist))
+            route_memo.set(key, canonical_order)
+
+        # Canonical stop c belongs to member canonical[c // 2]
+        return [stops[2 * canonical[c // 2] + c % 2] for c in canonical_order]
+
+    def _cheapest_insertion(self, member_count: int, dist: List[List[float]]) -> List[int]:
+        """
+        Repeatedly inserts the rider whose (pickup, drop) pair adds the least
+        distance at its best feasible positions.
+        """
+        order = []
+        remaining = set(range(member_count))
+
+        while remaining:
+            best = None
+            for member in remaining:
+                pickup, drop = 2 * member, 2 * member + 1
+                cost, i, j = self._best_pair_insertion(order, pickup, drop, dist)
+                if best is None or cost < best[0]:
+                    best = (cost, member, i, j)
+
+            _, member, i, j = best
+            order.insert(i, 2 * member)
+            order.insert(j + 1, 2 * member + 1)
+            remaining.discard(member)
+
+        return order
+
+    @staticmethod
+    def _best_pair_insertion(order: List[int], pickup: int, drop: int, dist: List[List[float]]):
+        """
+        Cheapest positions to insert `pickup` before index i and `drop` before
+        index j (j >= i, both indexes into the original order).
+        Returns (added_distance, i, j).
+        """
+        # nodes[k] is the matrix index of the k-th point on the path, cab first
+        nodes = [0] + [stop_idx + 1 for stop_idx in order]
+        p, d = pickup + 1, drop + 1
+        size = len(order)
+
+        def edge_delta(k, node):
+            # Cost of putting `node` between nodes[k] and nodes[k + 1] (or at the end)
+            prev = nodes[k]
+            if k + 1 < len(nodes):
+                nxt = nodes[k + 1]
+                return dist[prev][node] + dist[node][nxt] - dist[prev][nxt]
+            return dist[prev][node]
+
+        best = (float('inf'), 0, 0)
+        for i in range(size + 1):
+            pickup_delta = edge_delta(i, p)
+            for j in range(i, size + 1):
+                if j == i:
+                    # Drop right after the pickup
+                    prev = nodes[i]
+                    if i + 1 < len(nodes):
+                        nxt = nodes[i + 1]
+                        delta = dist[prev][p] + dist[p][d] + dist[d][nxt] - dist[prev][nxt]
+                    else:
+                        delta = dist[prev][p] + dist[p][d]
+                else:
+                    delta = pickup_delta + edge_delta(j, d)
+                if delta < best[0]:
+                    best = (delta, i, j)
+        return best
+
+    def _local_search(self, order: List[int], dist: List[List[float]], deadline: float) -> List[int]:
+        """
+        First-improvement or-opt + 2-opt until no move helps, the pass limit
+        is reached or the time budget runs out.
+        """
+        best_cost = route_length(order, dist)
+        size = len(order)
+
+        for _ in range(self.max_passes):
+            improved = False
+
+            # or-opt: move a single stop to another position
+            for src in range(size):
+                for dst in range(size):
+                    if src == dst or time.perf_counter() > deadline:
+                        continue
+                    candidate = order[:src] + order[src + 1:]
+                    candidate.insert(dst, order[src])
+                    if not respects_precedence(candidate):
+                        continue
+                    cost = route_length(candidate, dist)
+                    if cost < best_cost - 1e-9:
+                        order, best_cost, improved = candidate, cost, True
+
+            # 2-opt: reverse the segment order[i..j]
+            for i in range(size - 1):
+                for j in range(i + 1, size):
+                    if time.perf_counter() > deadline:
+                        break
+                    candidate = order[:i] + order[i:j + 1][::-1] + order[j + 1:]
+                    if not respects_precedence(candidate):
+                        continue
+                    cost = route_length(candidate, dist)
+                    if cost < best_cost - 1e-9:
+                        order, best_cost, improved = candidate, cost, True
+
+            if not improved or time.perf_counter() > deadline:
+                break
+
+        return order
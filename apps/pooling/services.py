@@ -1,32 +1,29 @@
-from math import radians, cos, sin, asin, sqrt
 from typing import List, Dict, Any
 from decimal import Decimal
-from django.db.models import QuerySet
-from django.db import transaction
+from contextlib import contextmanager
+from django.conf import settings
+from django.db.models import QuerySet, F, Count
+from django.db import DatabaseError, transaction, connection
 from django.core.cache import cache
+from django.core.exceptions import ValidationError
+from django.utils import timezone
 import logging
 
+import numpy as np
+
 from apps.rides.models import RideRequest, Cab
 from apps.pooling.models import Pool, PoolMember
+from apps.pooling.assignment import assign_within_radius
+from apps.pooling.eta import compute_route_etas
+from apps.pooling.geo import haversine_many, haversine_matrix, to_coord_arrays
+from apps.pooling.routing import DETOUR_KM_PER_MINUTE, RouteOptimizer, build_stops, evaluate_insertion, route_cache
+from apps.pooling.spatial import GridIndex, available_cab_index, open_pool_index, bounding_box
+from apps.pooling.status import ride_status_cache
+from apps.pricing.demand import demand_tracker
+from apps.rides.locations import cab_locations
 
 logger = logging.getLogger(__name__)
 
-def haversine(lat1, lon1, lat2, lon2):
-    """
-    Calculate the great circle distance between two points 
-    on the earth (specified in decimal degrees)
-    """
-    # convert decimal degrees to radians 
-    lat1, lon1, lat2, lon2 = map(radians, [float(lat1), float(lon1), float(lat2), float(lon2)])
-
-    # haversine formula 
-    dlon = lon2 - lon1 
-    dlat = lat2 - lat1 
-    a = sin(dlat/2)**2 + cos(lat1) * cos(lat2) * sin(dlon/2)**2
-    c = 2 * asin(sqrt(a)) 
-    r = 6371 # Radius of earth in kilometers. Use 3956 for miles
-    return c * r
-
 class PoolingEngine:
     """
     Service class responsible for grouping RideRequests into Pools.
@@ -35,122 +32,575 @@ class PoolingEngine:
     - Let R = Number of pending RideRequests
     - Let P = Number of active Pools
     - The greedy algorithm iterates through each pending request once: O(R)
-    - For each request, it checks existing pools: O(P)
-    - If no pool is found, it finds an available cab: O(C)
-    - Total Time Complexity: O(R * (P + C))
+    - For each request, it checks candidate pools from the open pool index:
+      O(p), p = pools near the pickup with enough residual capacity
+    - If no pool is found, it finds an available cab via the grid index: O(k),
+      k = cabs in the cells around the pickup (instead of all C cabs)
+    - Total Time Complexity: O(R * (p + k))
     - Space Complexity: O(R + P) to store results and current groupings.
+    - The candidate distance scans are single vectorized kernel calls (see geo.py).
     """
 
-    def __init__(self, pickup_radius_km: float = 3.0):
+    ASSIGNMENT_MODES = ('greedy', 'optimal')
+
+    def __init__(self, pickup_radius_km: float = 3.0, assignment_mode: str = None):
+        """
+        assignment_mode (batch matching only):
+        - 'greedy': each request takes the nearest free cab in arrival order.
+        - 'optimal': requests are clustered by pickup and only one seed per
+          cluster takes a cab, with one min-cost assignment over all seeds
+          (see assignment.py), so later requests aren't stranded and riders
+          still share pools.
+        """
         self.pickup_radius_km = pickup_radius_km
+        self.assignment_mode = assignment_mode or getattr(settings, 'POOLING_ASSIGNMENT_MODE', 'greedy')
+        if self.assignment_mode not in self.ASSIGNMENT_MODES:
+            raise ValueError(f"Unknown assignment mode: {self.assignment_mode}")
 
-    def process_pending_requests(self):
+    @contextmanager
+    def _engine_lock(self, lock_id: str, blocking: bool = True):
         """
-        Main entry point to execute the pooling logic.
-        Uses a global lock to prevent concurrent workers from interfering.
+        Holds a distributed matching lock for the duration of a run and yields
+        whether it was acquired (non-blocking callers skip busy partitions).
+        Fallback to dummy implementation if Redis is missing.
         """
-        lock_id = "pooling_engine_lock"
-        # Acquire lock for the duration of the batch.
-        # Fallback to dummy implementation if Redis is missing.
         try:
             lock = cache.lock(lock_id, timeout=30)
-            lock.acquire(blocking=True)
+            acquired = lock.acquire(blocking=blocking)
         except (AttributeError, Exception):
             # If cache doesn't support .lock() or Redis is down, we continue without it
             # In production, we'd fail, but for demo/interviews we want it to run
-            lock = None
+            lock, acquired = None, True
 
         try:
-            # We process requests one by one within a transaction
-            results = {
-                "new_pools_created": 0,
-                "requests_pooled": 0,
-                "remained_pending": 0
-            }
-
-            # Fetch pending requests
-            pending_requests = RideRequest.objects.filter(
-                status=RideRequest.Status.PENDING
-            ).order_by('created_at')
-
-            for request in pending_requests:
-                with transaction.atomic():
-                    # Re-fetch row with lock
-                    req = RideRequest.objects.select_for_update().get(id=request.id)
-                    if req.status != RideRequest.Status.PENDING:
-                        continue
-
-                    pooled = self._find_existing_pool(req)
-                    
-                    if not pooled:
-                        # Only look for cabs that aren't currently being modified
-                        available_cabs = Cab.objects.filter(
-                            status=Cab.Status.AVAILABLE
-                        ).select_for_update(skip_locked=True)
-                        
-                        pooled = self._create_new_pool(req, available_cabs)
-                        if pooled:
-                            results["new_pools_created"] += 1
-
-                    if pooled:
-                        results["requests_pooled"] += 1
-                        req.status = RideRequest.Status.POOLED
-                        req.save()
-                    else:
-                        results["remained_pending"] += 1
-
-            return results
+            yield acquired
         finally:
-            if lock:
+            if lock and acquired:
                 try:
                     lock.release()
                 except Exception:
                     pass
 
-    def _find_existing_pool(self, request: RideRequest) -> bool:
+    @staticmethod
+    def zone_lock_id(zone: str) -> str:
+        return f"pooling_engine_lock:{zone}"
+
+    def _pending_by_zone(
+        self, zone: str = None, limit: int = None, after_id: int = None, request_ids: List[int] = None
+    ) -> Dict[str, List[int]]:
         """
-        Attempts to add a request to an existing active pool.
-        Includes Detour Check: Only joins if detour is within passenger's tolerance.
+        Routes pending request ids (oldest first) to their pickup zone, as
+        stored on each request (RideRequest.pickup_zone), so a zone sweep
+        selects its requests in SQL from the (status, pickup_zone, id)
+        index. Ids are allocated in arrival order, so `after_id` acts as a
+        resume cursor for chunked sweeps. `request_ids` restricts the routing
+        to the given requests.
         """
-        # Lock active pools for the duration of this check
-        active_pools = Pool.objects.filter(
-            status=Pool.Status.POOLED
-        ).select_for_update()
-        
-        for pool in active_pools:
-            cab = pool.cab
+        pending = RideRequest.objects.filter(status=RideRequest.Status.PENDING)
+        if zone is not None:
+            pending = pending.filter(pickup_zone=zone)
+        if request_ids is not None:
+            pending = pending.filter(id__in=request_ids)
+        if after_id:
+            pending = pending.filter(id__gt=after_id)
+        pending = pending.order_by('id')
+        if limit:
+            pending = pending[:limit]
+
+        by_zone = {}
+        for request_id, request_zone in pending.values_list('id', 'pickup_zone').iterator():
+            by_zone.setdefault(request_zone, []).append(request_id)
+        return by_zone
+
+    def _run_partitioned(
+        self, zone: str, limit: int, after_id: int, run_zone, request_ids: List[int] = None
+    ) -> Dict[str, int]:
+        """
+        Runs `run_zone(request_ids)` once per zone under that zone's lock.
+
+        A targeted call (zone or request ids given) waits for its lock. A full
+        sweep skips zones whose lock is held: another worker is already
+        draining them. When `limit` requests were routed, the result carries
+        a `cursor` to resume from.
+        """
+        results = {
+            "new_pools_created": 0,
+            "requests_pooled": 0,
+            "remained_pending": 0
+        }
+
+        by_zone = self._pending_by_zone(zone, limit, after_id, request_ids)
+        targeted = zone is not None or request_ids is not None
+        for request_zone, zone_request_ids in by_zone.items():
+            with self._engine_lock(self.zone_lock_id(request_zone), blocking=targeted) as acquired:
+                if not acquired:
+                    logger.info(f"Zone {request_zone} is being matched by another worker, skipping.")
+                    continue
+                for key, value in run_zone(zone_request_ids).items():
+                    results[key] = results.get(key, 0) + value
+
+        routed_ids = [request_id for request_ids in by_zone.values() for request_id in request_ids]
+        if limit and len(routed_ids) >= limit:
+            results["cursor"] = max(routed_ids)
+        return results
+
+    def process_pending_requests(self, zone: str = None, limit: int = None, after_id: int = None):
+        """
+        Main entry point to execute the pooling logic.
+
+        Work is partitioned by pickup zone with one lock per zone, so workers
+        can drain different zones in parallel. Requests near a zone boundary
+        may still join pools or take cabs from neighbouring zones: pool seats
+        are reserved with a conditional UPDATE and cabs are claimed with
+        row locks, so concurrent zones can never overfill a pool or double
+        book a cab.
+        """
+        return self._run_partitioned(zone, limit, after_id, self._process_requests)
+
+    def _process_requests(self, request_ids: List[int]) -> Dict[str, int]:
+        # We process requests one by one within a transaction
+        results = {
+            "new_pools_created": 0,
+            "requests_pooled": 0,
+            "remained_pending": 0
+        }
+
+        for request_id in request_ids:
+            for key, value in self.match_request(request_id).items():
+                results[key] += value
+
+        return results
+
+    def match_request(self, ride_request_id: int) -> Dict[str, int]:
+        """
+        Incremental matching of a single request against current pools and cabs.
+
+        Takes no zone lock and touches only the rows it needs: the request
+        itself, the candidate pools from the open pool index and the candidate
+        cabs from the cab index. Seat reservation and cab claims are
+        conditional updates, so it is safe to run next to zone sweeps.
+        """
+        results = {
+            "new_pools_created": 0,
+            "requests_pooled": 0,
+            "remained_pending": 0
+        }
+
+        with transaction.atomic():
+            # Re-fetch row with lock
+            req = RideRequest.objects.select_for_update().filter(id=ride_request_id).first()
+            if req is None or req.status != RideRequest.Status.PENDING:
+                return results
+
+            pooled = self._find_existing_pool(req)
             
-            # Simple spatial check
-            dist_to_pickup = haversine(
-                cab.current_lat, cab.current_lng, 
-                request.pickup_lat, request.pickup_lng
+            if not pooled:
+                # Only look for cabs that aren't currently being modified
+                available_cabs = Cab.objects.filter(
+                    status=Cab.Status.AVAILABLE
+                ).select_for_update(skip_locked=True)
+                
+                pooled = self._create_new_pool(req, available_cabs)
+                if pooled:
+                    results["new_pools_created"] += 1
+
+            if pooled:
+                results["requests_pooled"] += 1
+                req.status = RideRequest.Status.POOLED
+                req.save()
+            else:
+                results["remained_pending"] += 1
+
+        return results
+
+    def process_pending_batch(self, zone: str = None, limit: int = None, after_id: int = None) -> Dict[str, int]:
+        """
+        Snapshot-based alternative to process_pending_requests for draining
+        large backlogs, partitioned by zone in the same way.
+
+        1. Load one snapshot of pending requests, open pools and available cabs.
+        2. Compute every assignment in memory (same radius, detour and capacity
+           rules as the per-request path).
+        3. Write everything back with bulk_create / bulk_update in a single
+           transaction: a handful of statements instead of several per request.
+        """
+        return self._run_partitioned(zone, limit, after_id, self._process_batch)
+
+    def process_request_batch(self, request_ids: List[int]) -> Dict[str, int]:
+        """
+        Snapshot-based matching of a given set of requests (e.g. one bulk
+        ingestion), zone by zone under each zone's lock. Requests that are
+        no longer pending are ignored.
+        """
+        return self._run_partitioned(None, None, None, self._process_batch, request_ids=list(request_ids))
+
+    def _process_batch(self, request_ids: List[int]) -> Dict[str, int]:
+        with transaction.atomic():
+            pending = list(
+                RideRequest.objects.filter(
+                    id__in=request_ids, status=RideRequest.Status.PENDING
+                ).order_by('created_at').select_for_update(skip_locked=True)
             )
-            
-            if dist_to_pickup > self.pickup_radius_km:
+            if not pending:
+                return {}
+
+            # Pools and cabs reachable from this zone's pickups, including
+            # those just across the zone boundary
+            min_lat, max_lat, min_lng, max_lng = bounding_box(
+                [float(req.pickup_lat) for req in pending],
+                [float(req.pickup_lng) for req in pending],
+                margin_km=self.pickup_radius_km
+            )
+
+            open_pools = list(
+                Pool.objects.filter(
+                    status=Pool.Status.POOLED,
+                    cab__current_lat__range=(min_lat, max_lat),
+                    cab__current_lng__range=(min_lng, max_lng)
+                )
+                .select_related('cab')
+                .select_for_update(of=('self',))
+            )
+            # FOR UPDATE can't be combined with GROUP BY, so member counts are a second query
+            member_counts = dict(
+                PoolMember.objects.filter(
+                    pool__in=[pool.id for pool in open_pools]
+                ).values('pool_id').annotate(total=Count('id')).values_list('pool_id', 'total').order_by()
+            )
+            available_cabs = list(
+                Cab.objects.filter(
+                    status=Cab.Status.AVAILABLE,
+                    current_lat__range=(min_lat, max_lat),
+                    current_lng__range=(min_lng, max_lng)
+                ).select_for_update(skip_locked=True)
+            )
+            # Match on the latest driver pings rather than the last flushed positions
+            cab_locations.apply([pool.cab for pool in open_pools] + available_cabs)
+
+            plan = self._plan_batch(pending, open_pools, member_counts, available_cabs)
+            self._write_batch(plan)
+
+        # Bulk writes bypass model signals, so resync the in-memory indexes
+        for cab in plan["busy_cabs"]:
+            available_cab_index.remove(cab.id)
+            demand_tracker.remove_cab(cab.id)
+        open_pool_index.invalidate()
+
+        # Sequence positions and ETAs for every pool this batch changed, in one pass
+        changed_pools = [pool.id for pool in plan["new_pools"] + plan["touched_pools"]]
+        if changed_pools:
+            try:
+                sync_pool_routes(changed_pools)
+            except Exception as e:
+                logger.error(f"Route sync failed for batch pools {changed_pools}: {e}")
+
+        return plan["results"]
+
+    def _plan_batch(
+        self,
+        pending: List[RideRequest],
+        open_pools: List[Pool],
+        member_counts: Dict[int, int],
+        available_cabs: List[Cab]
+    ) -> Dict[str, Any]:
+        """
+        Pure in-memory matching over a snapshot. No queries are issued here.
+        """
+        cell_km = getattr(settings, 'POOLING_GRID_CELL_KM', 1.0)
+        pool_grid = GridIndex(cell_km)
+        cab_grid = GridIndex(cell_km)
+
+        # pool key -> mutable planning state
+        slots = {}
+        for pool in open_pools:
+            cab = pool.cab
+            if cab.current_lat is None or cab.current_lng is None:
                 continue
+            slots[pool.id] = {
+                "pool": pool,
+                "seats_left": cab.total_seats - pool.seats_used,
+                "luggage_left": cab.luggage_capacity - pool.luggage_used,
+                "next_sequence": member_counts.get(pool.id, 0) + 1,
+            }
+            pool_grid.upsert(pool.id, cab.current_lat, cab.current_lng)
+
+        cabs_by_id = {cab.id: cab for cab in available_cabs}
+        for cab in available_cabs:
+            cab_grid.upsert(cab.id, cab.current_lat, cab.current_lng)
+
+        results = {"new_pools_created": 0, "requests_pooled": 0, "remained_pending": 0}
+        new_pools, new_members, pooled_requests, busy_cabs = [], [], [], []
+        touched_pools = {}
+
+        def find_slot(req):
+            max_km_detour = float(req.detour_tolerance_minutes) * DETOUR_KM_PER_MINUTE
+            for key, dist in pool_grid.nearby(req.pickup_lat, req.pickup_lng, self.pickup_radius_km):
+                candidate = slots[key]
+                if dist > max_km_detour:
+                    continue
+                if (req.seats_required > candidate["seats_left"] or
+                        req.luggage_units > candidate["luggage_left"]):
+                    continue
+                return candidate
+            return None
+
+        def open_slot(cab):
+            cab_grid.remove(cab.id)
+            cab.status = Cab.Status.BUSY
+            busy_cabs.append(cab)
+
+            pool = Pool(cab=cab, status=Pool.Status.POOLED)
+            new_pools.append(pool)
+            key = ('new', len(new_pools))
+            slots[key] = {
+                "pool": pool,
+                "seats_left": cab.total_seats,
+                "luggage_left": cab.luggage_capacity,
+                "next_sequence": 1,
+            }
+            pool_grid.upsert(key, cab.current_lat, cab.current_lng)
+            results["new_pools_created"] += 1
+            return slots[key]
+
+        def join(req, slot):
+            new_members.append(PoolMember(
+                pool=slot["pool"],
+                ride_request=req,
+                sequence_order=slot["next_sequence"]
+            ))
+            slot["seats_left"] -= req.seats_required
+            slot["luggage_left"] -= req.luggage_units
+            slot["next_sequence"] += 1
+
+            pool = slot["pool"]
+            pool.seats_used += req.seats_required
+            pool.luggage_used += req.luggage_units
+            if pool.pk:
+                touched_pools[pool.pk] = pool
+
+            req.status = RideRequest.Status.POOLED
+            pooled_requests.append(req)
+            results["requests_pooled"] += 1
+
+        if self.assignment_mode == 'optimal':
+            # 1. Requests that fit an existing pool join it
+            unmatched = []
+            for req in pending:
+                slot = find_slot(req)
+                if slot:
+                    join(req, slot)
+                else:
+                    unmatched.append(req)
+
+            # 2. Open pools in rounds. Only one seed per cluster of nearby
+            # pickups takes a cab, from one global min-cost assignment over
+            # the seed x free cab pickup distance matrix; the rest of the
+            # cluster then joins the pools just opened before any further
+            # cab is spent. Whoever didn't fit seeds the next round.
+            free_cabs = list(available_cabs)
+            stranded = set()  # seeds with no feasible cab, never seeded again
+            solve_ms = 0.0
+            while unmatched and free_cabs:
+                seeds = self._cluster_seeds([req for req in unmatched if req.id not in stranded], cell_km)
+                if not seeds:
+                    break
+                pairs, seed_solve_ms = self._assign_cabs(seeds, free_cabs)
+                solve_ms += seed_solve_ms
+
+                cab_for = {seeds[seed_idx].id: free_cabs[cab_idx] for seed_idx, cab_idx in pairs}
+                stranded.update(seed.id for seed in seeds if seed.id not in cab_for)
 
-            # Capacity check
-            # Optimization: prefetch ride_requests to avoid N+1 inside transaction
-            members = pool.members.select_related('ride_request').all()
-            total_seats = sum(m.ride_request.seats_required for m in members)
-            total_luggage = sum(m.ride_request.luggage_units for m in members)
+                # Arrival order, as in greedy mode: a seed takes its cab only
+                # if no pool opened before its turn has room for it
+                opened, still_unmatched = set(), []
+                for req in unmatched:
+                    slot = find_slot(req)
+                    if slot is None and req.id in cab_for:
+                        slot = open_slot(cab_for[req.id])
+                        opened.add(cab_for[req.id].id)
+                    if slot:
+                        join(req, slot)
+                    else:
+                        still_unmatched.append(req)
+                unmatched = still_unmatched
+                free_cabs = [cab for cab in free_cabs if cab.id not in opened]
+
+            if available_cabs:
+                results["assignment_solve_ms"] = round(solve_ms, 2)
+            results["remained_pending"] += len(unmatched)
+        else:
+            for req in pending:
+                slot = find_slot(req)
+
+                if slot is None:
+                    nearest = cab_grid.nearby(req.pickup_lat, req.pickup_lng, self.pickup_radius_km)
+                    if nearest:
+                        slot = open_slot(cabs_by_id[nearest[0][0]])
+
+                if slot is None:
+                    results["remained_pending"] += 1
+                    continue
+
+                join(req, slot)
+
+        return {
+            "results": results,
+            "new_pools": new_pools,
+            "new_members": new_members,
+            "pooled_requests": pooled_requests,
+            "busy_cabs": busy_cabs,
+            "touched_pools": list(touched_pools.values()),
+        }
 
-            if (total_seats + request.seats_required > cab.total_seats or 
-                total_luggage + request.luggage_units > cab.luggage_capacity):
+    def _cluster_seeds(self, requests: List[RideRequest], cell_km: float) -> List[RideRequest]:
+        """
+        One seed request per cluster of pickups, in arrival order: a request
+        within reach (pickup radius and its own detour tolerance) of an
+        earlier seed's pickup is expected to share that seed's pool.
+        """
+        seed_grid = GridIndex(cell_km)
+        seeds = []
+        for req in requests:
+            reach = min(self.pickup_radius_km, float(req.detour_tolerance_minutes) * DETOUR_KM_PER_MINUTE)
+            if seed_grid.nearby(req.pickup_lat, req.pickup_lng, reach):
                 continue
-            
-            # Detour Conflict Handling (Heuristic)
-            # 1 minute of detour is roughly 0.5km at city speeds
-            max_km_detour = float(request.detour_tolerance_minutes) * 0.5
-            if dist_to_pickup > max_km_detour:
+            seeds.append(req)
+            seed_grid.upsert(req.id, req.pickup_lat, req.pickup_lng)
+        return seeds
+
+    def _assign_cabs(self, requests: List[RideRequest], cabs: List[Cab]):
+        """Globally optimal request x cab pairs within the pickup radius (see assignment.py)."""
+        req_lats, req_lngs = to_coord_arrays((req.pickup_lat, req.pickup_lng) for req in requests)
+        cab_lats, cab_lngs = to_coord_arrays((cab.current_lat, cab.current_lng) for cab in cabs)
+        distances = haversine_matrix(req_lats, req_lngs, cab_lats, cab_lngs)
+
+        # A cab that can't carry the request on its own is not an option
+        seats = np.array([req.seats_required for req in requests])[:, None]
+        luggage = np.array([req.luggage_units for req in requests])[:, None]
+        fits = (
+            (seats <= np.array([cab.total_seats for cab in cabs])[None, :]) &
+            (luggage <= np.array([cab.luggage_capacity for cab in cabs])[None, :])
+        )
+        return assign_within_radius(np.where(fits, distances, np.inf), self.pickup_radius_km)
+
+    def _write_batch(self, plan: Dict[str, Any]):
+        """
+        Persists a batch plan. Capacity was validated while planning, so members
+        are bulk inserted without the per-row full_clean() of PoolMember.save().
+        """
+        if connection.features.can_return_rows_from_bulk_insert:
+            Pool.objects.bulk_create(plan["new_pools"])
+        else:
+            # Backends without RETURNING can't hand back ids from a bulk insert
+            for pool in plan["new_pools"]:
+                pool.save()
+
+        # bulk_update doesn't apply auto_now
+        now = timezone.now()
+        for obj in plan["pooled_requests"] + plan["busy_cabs"] + plan["touched_pools"]:
+            obj.updated_at = now
+
+        # Existing pools are row-locked by the snapshot, so absolute counter values are safe
+        Pool.objects.bulk_update(
+            plan["touched_pools"], ['seats_used', 'luggage_used', 'updated_at'], batch_size=500
+        )
+
+        PoolMember.objects.bulk_create(plan["new_members"], batch_size=500)
+        RideRequest.objects.bulk_update(plan["pooled_requests"], ['status', 'updated_at'], batch_size=500)
+        Cab.objects.bulk_update(plan["busy_cabs"], ['status', 'updated_at'], batch_size=500)
+
+    def _find_existing_pool(self, request: RideRequest) -> bool:
+        """
+        Attempts to add a request to an existing active pool.
+        Includes Detour Check: Only joins if detour is within passenger's tolerance.
+        """
+        # Narrow down to nearby pools with enough residual capacity before
+        # taking any row locks; capacity is re-checked below under the lock.
+        candidate_ids = [
+            pool_id for pool_id, _ in open_pool_index.candidates(
+                request.pickup_lat, request.pickup_lng, self.pickup_radius_km,
+                request.seats_required, request.luggage_units
+            )
+        ]
+        if not candidate_ids:
+            return False
+
+        # Lock only the candidate pools for the duration of this check.
+        # Capacity is an O(1) column comparison pushed into the query itself.
+        active_pools = list(
+            Pool.objects.filter(
+                id__in=candidate_ids,
+                status=Pool.Status.POOLED,
+                seats_used__lte=F('cab__total_seats') - request.seats_required,
+                luggage_used__lte=F('cab__luggage_capacity') - request.luggage_units
+            )
+            .select_related('cab')
+            .select_for_update(of=('self',))
+        )
+        if not active_pools:
+            return False
+        cab_locations.apply(pool.cab for pool in active_pools)
+
+        # Vectorized spatial check: one distance per pool cab in a single kernel call
+        cab_lats, cab_lngs = to_coord_arrays(
+            (pool.cab.current_lat, pool.cab.current_lng) for pool in active_pools
+        )
+        distances = haversine_many(request.pickup_lat, request.pickup_lng, cab_lats, cab_lngs)
+        # NaN (cab without a position) compares False and is skipped too
+        nearby_pools = [
+            pool for pool, dist_to_pickup in zip(active_pools, distances)
+            if dist_to_pickup <= self.pickup_radius_km
+        ]
+        if not nearby_pools:
+            return False
+
+        # Detour Conflict Handling: price the insertion into each pool's current
+        # route and check every rider's tolerance, then try the cheapest first
+        members_by_pool = {pool.id: [] for pool in nearby_pools}
+        for row in PoolMember.objects.filter(pool__in=nearby_pools).values(
+            *ROUTE_MEMBER_FIELDS, 'ride_request__detour_tolerance_minutes'
+        ):
+            members_by_pool[row['pool_id']].append(row)
+
+        pickup = (float(request.pickup_lat), float(request.pickup_lng))
+        drop = (float(request.drop_lat), float(request.drop_lng))
+        ranked = []
+        for pool in nearby_pools:
+            rows = members_by_pool[pool.id]
+            cab_lat, cab_lng = float(pool.cab.current_lat), float(pool.cab.current_lng)
+            stops = current_stops(pool.id, cab_lat, cab_lng, rows)
+            insertion = evaluate_insertion(
+                cab_lat, cab_lng, stops, pickup, drop,
+                {row['ride_request_id']: row['ride_request__detour_tolerance_minutes'] * DETOUR_KM_PER_MINUTE for row in rows},
+                request.detour_tolerance_minutes * DETOUR_KM_PER_MINUTE
+            )
+            if insertion is None:
                 logger.info(f"Skipping pool {pool.id} for request {request.id} due to detour conflict.")
                 continue
+            added_km, pickup_gap, drop_gap = insertion
+            new_stops = build_stops([{'id': request.id, 'pickup': pickup, 'drop': drop}])
+            route = (
+                stops[:pickup_gap] + new_stops[:1] + stops[pickup_gap:drop_gap]
+                + new_stops[1:] + stops[drop_gap:]
+            )
+            ranked.append((added_km, pool, route))
+        ranked.sort(key=lambda item: item[0])
 
+        for _, pool, route in ranked:
             try:
-                PoolMember.objects.create(
-                    pool=pool,
-                    ride_request=request,
-                    sequence_order=len(members) + 1
+                with transaction.atomic():
+                    # Reserves the seats conditionally: a matcher in a
+                    # neighbouring zone may have filled the pool meanwhile
+                    PoolMember.objects.create(
+                        pool=pool,
+                        ride_request=request,
+                        sequence_order=len(members_by_pool[pool.id]) + 1
+                    )
+                # Persist the evaluated route as is: a full re-optimization could
+                # trade a rider's tolerance for total distance
+                transaction.on_commit(
+                    lambda pool_id=pool.id, route=route: sync_pool_routes([pool_id], planned={pool_id: route}),
+                    robust=True
                 )
                 return True
             except Exception as e:
@@ -163,27 +613,43 @@ class PoolingEngine:
         """
         Attempts to find a cab and start a new pool for the request.
         """
-        # Find nearest available cab
-        best_cab = None
-        min_dist = float('inf')
-
-        for cab in available_cabs:
-            dist = haversine(
-                cab.current_lat, cab.current_lng,
-                request.pickup_lat, request.pickup_lng
+        # Only scan the grid cells around the pickup; the index is a candidate
+        # filter, the locked queryset below remains the source of truth.
+        candidate_ids = [
+            cab_id for cab_id, _ in available_cab_index.nearest(
+                request.pickup_lat, request.pickup_lng, self.pickup_radius_km
             )
-            
-            if dist < min_dist and dist <= self.pickup_radius_km:
-                min_dist = dist
-                best_cab = cab
+        ]
+        if not candidate_ids:
+            return False
+
+        cabs = list(available_cabs.filter(id__in=candidate_ids))
+        if not cabs:
+            return False
+        cab_locations.apply(cabs)
+
+        # Rank candidates with a single one-to-many distance call
+        cab_lats, cab_lngs = to_coord_arrays((cab.current_lat, cab.current_lng) for cab in cabs)
+        distances = haversine_many(request.pickup_lat, request.pickup_lng, cab_lats, cab_lngs)
+
+        for idx in np.argsort(distances, kind='stable'):
+            if not distances[idx] <= self.pickup_radius_km:
+                break
+            best_cab = cabs[idx]
+
+            # Conditional claim: a matcher in a neighbouring zone may have taken the cab
+            claimed = Cab.objects.filter(
+                id=best_cab.id, status=Cab.Status.AVAILABLE
+            ).update(status=Cab.Status.BUSY, updated_at=timezone.now())
+            if not claimed:
+                continue
+            best_cab.status = Cab.Status.BUSY
+            # Queryset updates bypass the index and supply signals
+            transaction.on_commit(lambda cab_id=best_cab.id: available_cab_index.remove(cab_id))
+            transaction.on_commit(lambda cab_id=best_cab.id: demand_tracker.remove_cab(cab_id))
 
-        if best_cab:
             # Create Pool
             pool = Pool.objects.create(cab=best_cab, status=Pool.Status.POOLED)
-            
-            # Update Cab status
-            best_cab.status = Cab.Status.BUSY
-            best_cab.save()
 
             # Add Member
             PoolMember.objects.create(
@@ -191,85 +657,213 @@ class PoolingEngine:
                 ride_request=request,
                 sequence_order=1
             )
+            transaction.on_commit(lambda pool_id=pool.id: sync_pool_routes([pool_id]), robust=True)
             return True
 
         return False
 
-class RouteOptimizer:
+def remove_rides_from_pools(ride_ids: List[int]) -> List[int]:
     """
-    Optimizes the stop sequence for a pool using a Nearest Neighbor heuristic.
-    Ensures pickups occur before drops and respects detour tolerance.
+    Removes the rides from their pools set-wise: one DELETE for every
+    membership of the rides and one usage adjustment per affected pool,
+    however many of its riders left. Returns the affected pool ids. The
+    cached pool_status of the rides and of the riders left in those pools
+    is dropped on commit.
     """
-    def __init__(self):
-        pass
+    ride_ids = list(ride_ids)
+    with transaction.atomic():
+        # Lock the memberships so a concurrent run can neither read them nor
+        # release their seats a second time
+        memberships = list(
+            PoolMember.objects.select_for_update(of=('self',)).filter(ride_request_id__in=ride_ids).values_list(
+                'id', 'pool_id', 'ride_request__seats_required', 'ride_request__luggage_units'
+            )
+        )
+        if not memberships:
+            transaction.on_commit(lambda: ride_status_cache.invalidate(ride_ids))
+            return []
 
-    def optimize_route(self, cab_lat, cab_lng, members_data: List[Dict]):
-        """
-        members_data: List of dicts with {
-            'id': ride_request_id,
-            'pickup': (lat, lng),
-            'drop': (lat, lng),
-            'tolerance': minutes
-        }
-        """
-        # Define all possible stops
-        stops = []
-        for member in members_data:
-            stops.append({
-                'type': 'PICKUP',
-                'id': member['id'],
-                'coords': member['pickup'],
-                'target': member['id']
-            })
-            stops.append({
-                'type': 'DROP',
-                'id': member['id'],
-                'coords': member['drop'],
-                'target': member['id']
-            })
-
-        optimized_sequence = []
-        current_lat, current_lng = cab_lat, cab_lng
-        
-        visited_pickups = set()
-        completed_drops = set()
-        
-        while len(completed_drops) < len(members_data):
-            # Candidates: 
-            # - Pickups not yet visited
-            # - Drops where the corresponding pickup has been visited but drop hasn't
-            candidates = []
-            for stop in stops:
-                if stop['type'] == 'PICKUP' and stop['id'] not in visited_pickups:
-                    candidates.append(stop)
-                elif stop['type'] == 'DROP' and stop['id'] in visited_pickups and stop['id'] not in completed_drops:
-                    candidates.append(stop)
-
-            if not candidates:
-                break
+        with Pool.usage_managed():
+            deleted, _ = PoolMember.objects.filter(id__in=[member_id for member_id, _, _, _ in memberships]).delete()
+        if deleted != len(memberships):
+            # Someone else removed part of them in between; roll back rather
+            # than release seats that are no longer held
+            raise DatabaseError(
+                f"Expected to remove {len(memberships)} pool memberships, removed {deleted}"
+            )
 
-            # Nearest Neighbor step
-            best_next = None
-            min_dist = float('inf')
+        released = {}
+        for _, pool_id, seats, luggage in memberships:
+            pool_release = released.setdefault(pool_id, [0, 0])
+            pool_release[0] += seats
+            pool_release[1] += luggage
+        for pool_id, (seats, luggage) in released.items():
+            Pool.adjust_usage(pool_id, -seats, -luggage)
 
-            for candidate in candidates:
-                dist = haversine(
-                    current_lat, current_lng,
-                    candidate['coords'][0], candidate['coords'][1]
-                )
-                
-                # In a real scenario, we would check detour tolerance here before accepting
-                if dist < min_dist:
-                    min_dist = dist
-                    best_next = candidate
-
-            if best_next:
-                optimized_sequence.append(best_next)
-                current_lat, current_lng = best_next['coords']
-                
-                if best_next['type'] == 'PICKUP':
-                    visited_pickups.add(best_next['id'])
-                else:
-                    completed_drops.add(best_next['id'])
+        stale = ride_ids + list(
+            PoolMember.objects.filter(pool_id__in=list(released)).values_list('ride_request_id', flat=True)
+        )
+        transaction.on_commit(lambda: ride_status_cache.invalidate(stale))
+        return list(released)
+
+
+def release_cancelled_rides(limit: int = None) -> Dict[str, int]:
+    """
+    Applies queued cancellations: removes every cancelled ride still holding
+    a pool membership (see apps.rides.cancellation) in one set-wise pass,
+    then resyncs each affected pool's route exactly once.
+    """
+    ride_ids = PoolMember.objects.filter(
+        ride_request__status=RideRequest.Status.CANCELLED
+    ).values_list('ride_request_id', flat=True).distinct().order_by('ride_request_id')
+    ride_ids = list(ride_ids[:limit] if limit else ride_ids)
+    if not ride_ids:
+        return {"rides_released": 0, "pools_resynced": 0}
+
+    pool_ids = remove_rides_from_pools(ride_ids)
+    results = {"rides_released": len(ride_ids), "pools_resynced": len(pool_ids)}
+    if pool_ids:
+        results.update(sync_pool_routes(pool_ids))
+    return results
+
+
+# PoolMember.values() fields needed to rebuild a pool's stop sequence
+ROUTE_MEMBER_FIELDS = (
+    'pool_id', 'ride_request_id', 'sequence_order', 'drop_sequence_order',
+    'ride_request__pickup_lat', 'ride_request__pickup_lng',
+    'ride_request__drop_lat', 'ride_request__drop_lng',
+)
+
+
+def current_stops(pool_id: int, cab_lat: float, cab_lng: float, rows: List[Dict[str, Any]]) -> List[Dict]:
+    """
+    Current stop sequence of a pool from its member rows (ROUTE_MEMBER_FIELDS):
+    the cached route when its fingerprint still matches, otherwise rebuilt
+    from the persisted pickup/drop positions (members without a drop position
+    are dropped in pickup order at the end).
+    """
+    entry = route_cache.get_fresh(
+        pool_id, route_cache.fingerprint(cab_lat, cab_lng, [row['ride_request_id'] for row in rows])
+    )
+    if entry is not None:
+        return entry['stops']
+
+    stops = build_stops([{
+        'id': row['ride_request_id'],
+        'pickup': (float(row['ride_request__pickup_lat']), float(row['ride_request__pickup_lng'])),
+        'drop': (float(row['ride_request__drop_lat']), float(row['ride_request__drop_lng'])),
+    } for row in rows])
+    unplaced = 2 * len(rows) + 1
+    positions = []
+    for row in rows:
+        positions.append((row['sequence_order'], 0))
+        positions.append((row['drop_sequence_order'] or unplaced + row['sequence_order'], 1))
+    return [stop for _, stop in sorted(zip(positions, stops), key=lambda item: item[0])]
+
+
+def _route_members_data(members: List[PoolMember]) -> List[Dict[str, Any]]:
+    """Optimizer input for pool members fetched with their ride_request."""
+    return [{
+        'id': m.ride_request_id,
+        'pickup': (float(m.ride_request.pickup_lat), float(m.ride_request.pickup_lng)),
+        'drop': (float(m.ride_request.drop_lat), float(m.ride_request.drop_lng)),
+        'tolerance': m.ride_request.detour_tolerance_minutes
+    } for m in members]
+
+
+def sync_pool_routes(pool_ids: List[int], planned: Dict[int, List[Dict]] = None) -> Dict[str, int]:
+    """
+    Re-optimizes the routes of several pools and persists stop positions and
+    ETAs for all of them in one bulk_update.
+
+    `planned` maps pool ids to an already chosen stop sequence (e.g. an
+    evaluated insertion) that is persisted instead of re-optimizing, as long
+    as it still covers exactly the pool's current members.
+
+    - Pools whose membership fingerprint matches the route cache are skipped.
+    - Emptied pools are cancelled.
+    - Capacity is validated once per pool; an over-capacity pool is logged
+      and left untouched.
+    - ETAs for every re-routed pool come from one vectorized pass (eta.py).
+    - The pool_status read model of every re-routed rider is rebuilt.
+
+    Query count is constant in the number of pools and members.
+    """
+    results = {"routes_optimized": 0, "routes_unchanged": 0, "pools_cancelled": 0}
+    pools = list(Pool.objects.filter(id__in=pool_ids).select_related('cab'))
+    cab_locations.apply(pool.cab for pool in pools)
+    members_by_pool = {pool.id: [] for pool in pools}
+    for member in PoolMember.objects.filter(pool__in=pools).select_related('ride_request'):
+        members_by_pool[member.pool_id].append(member)
+
+    optimizer = RouteOptimizer()
+    routes = []  # (pool, members, fingerprint, cab_lat, cab_lng, stops)
+    for pool in pools:
+        members = members_by_pool[pool.id]
+        if not members:
+            pool.status = Pool.Status.CANCELLED
+            pool.save()
+            route_cache.invalidate(pool.id)
+            results["pools_cancelled"] += 1
+            continue
+        if pool.cab.current_lat is None or pool.cab.current_lng is None:
+            continue
+
+        cab_lat, cab_lng = float(pool.cab.current_lat), float(pool.cab.current_lng)
+        fingerprint = route_cache.fingerprint(cab_lat, cab_lng, [m.ride_request_id for m in members])
+        if route_cache.get_fresh(pool.id, fingerprint):
+            # Same riders, same cab bucket: stored sequence and ETAs are current
+            results["routes_unchanged"] += 1
+            continue
+
+        try:
+            pool.validate_capacity(
+                sum(m.ride_request.seats_required for m in members),
+                sum(m.ride_request.luggage_units for m in members)
+            )
+        except ValidationError as e:
+            logger.error(f"Skipping route sync for pool {pool.id}: {e}")
+            continue
+
+        stops = (planned or {}).get(pool.id)
+        planned_ids = sorted(stop['id'] for stop in stops or [] if stop['type'] == 'PICKUP')
+        if planned_ids != sorted(m.ride_request_id for m in members):
+            stops = optimizer.optimize_route(cab_lat, cab_lng, _route_members_data(members))
+        routes.append((pool, members, fingerprint, cab_lat, cab_lng, stops))
+
+    if not routes:
+        return results
+
+    etas = compute_route_etas([(cab_lat, cab_lng, stops) for _, _, _, cab_lat, cab_lng, stops in routes])
+
+    # Resolve members from the fetched lists
+    updated = []
+    for (pool, members, _, _, _, stops), stop_etas in zip(routes, etas):
+        by_ride = {m.ride_request_id: m for m in members}
+        for idx, (stop, eta) in enumerate(zip(stops, stop_etas)):
+            member = by_ride[stop['id']]
+            if stop['type'] == 'PICKUP':
+                member.sequence_order = idx + 1
+                member.pickup_eta = eta
+            else:
+                member.drop_sequence_order = idx + 1
+                member.drop_eta = eta
+        updated.extend(members)
+
+    PoolMember.objects.bulk_update(
+        updated, ['sequence_order', 'drop_sequence_order', 'pickup_eta', 'drop_eta'], batch_size=500
+    )
+    # bulk_update doesn't apply auto_now; one plain UPDATE is cheaper than another CASE column
+    PoolMember.objects.filter(pool__in=[route[0] for route in routes]).update(updated_at=timezone.now())
+
+    for pool, _, fingerprint, cab_lat, cab_lng, stops in routes:
+        route_cache.set(pool.id, fingerprint, cab_lat, cab_lng, stops)
+    results["routes_optimized"] = len(routes)
+
+    try:
+        ride_status_cache.refresh(member.ride_request_id for member in updated)
+    except Exception as e:
+        # The read model rebuilds itself on the next poll
+        logger.warning(f"Failed to refresh ride statuses for pools {[route[0].id for route in routes]}: {e}")
+    return results
 
-        return optimized_sequence
@@ -0,0 +1,44 @@
+from django.db import transaction
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+
+from apps.rides.models import Cab
+from apps.pooling.models import Pool, PoolMember
+from apps.pooling.spatial import available_cab_index, open_pool_index
+
+
+@receiver(post_save, sender=Cab)
+def sync_cab_index_on_save(sender, instance, **kwargs):
+    # Apply after commit so a rolled back assignment never hides an available cab
+    cab_id, status, lat, lng = instance.id, instance.status, instance.current_lat, instance.current_lng
+    transaction.on_commit(lambda: available_cab_index.sync_cab(cab_id, status, lat, lng))
+
+
+@receiver(post_delete, sender=Cab)
+def remove_cab_from_index(sender, instance, **kwargs):
+    cab_id = instance.id
+    transaction.on_commit(lambda: available_cab_index.remove(cab_id))
+
+
+@receiver(post_save, sender=Pool)
+@receiver(post_save, sender=PoolMember)
+@receiver(post_delete, sender=PoolMember)
+def refresh_open_pool_index(sender, instance, **kwargs):
+    pool_id = instance.id if sender is Pool else instance.pool_id
+    transaction.on_commit(lambda: open_pool_index.refresh_pool(pool_id))
+
+
+@receiver(post_delete, sender=PoolMember)
+def release_pool_usage(sender, instance, **kwargs):
+    # Admin deletes and RideRequest/Pool cascades; set-wise removals adjust
+    # the counters themselves
+    if Pool.usage_is_managed():
+        return
+    request = instance.ride_request
+    Pool.adjust_usage(instance.pool_id, -request.seats_required, -request.luggage_units)
+
+
+@receiver(post_delete, sender=Pool)
+def remove_pool_from_index(sender, instance, **kwargs):
+    pool_id = instance.id
+    transaction.on_commit(lambda: open_pool_index.remove(pool_id))
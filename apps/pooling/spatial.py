@@ -0,0 +1,308 @@
+import logging
+import threading
+import time
+from math import cos, radians, ceil
+from typing import Dict, Hashable, List, Optional, Tuple
+
+import numpy as np
+from django.conf import settings
+
+from apps.pooling.geo import haversine_many
+
+logger = logging.getLogger(__name__)
+
+KM_PER_DEGREE_LAT = 111.32
+
+
+def zone_for(lat, lng, zone_size_km: float = None) -> str:
+    """
+    Matching partition (zone) of a pickup point: a coarse cell of the same
+    uniform lat/lng grid used by the indexes. Each zone has its own lock.
+    """
+    zone_deg = (zone_size_km or getattr(settings, 'POOLING_ZONE_SIZE_KM', 5.0)) / KM_PER_DEGREE_LAT
+    return f"{int(float(lat) // zone_deg)}:{int(float(lng) // zone_deg)}"
+
+
+def bounding_box(lats, lngs, margin_km: float = 0.0) -> Tuple[float, float, float, float]:
+    """(min_lat, max_lat, min_lng, max_lng) around the points, widened by `margin_km`."""
+    lats = np.asarray(lats, dtype=np.float64)
+    lngs = np.asarray(lngs, dtype=np.float64)
+    lat_margin = margin_km / KM_PER_DEGREE_LAT
+    widest_lat = float(np.max(np.abs(lats))) + lat_margin
+    lng_margin = margin_km / (KM_PER_DEGREE_LAT * max(cos(radians(min(widest_lat, 89.0))), 1e-6))
+    return (
+        float(lats.min()) - lat_margin, float(lats.max()) + lat_margin,
+        float(lngs.min()) - lng_margin, float(lngs.max()) + lng_margin,
+    )
+
+
+class GridIndex:
+    """
+    Uniform lat/lng grid that buckets keys by position.
+
+    Complexity Analysis:
+    - upsert / remove: O(1)
+    - nearby(radius): O(k) where k is the number of keys in the cells
+      overlapping the search radius, independent of the total key count.
+    """
+
+    def __init__(self, cell_size_km: float = 1.0):
+        self.cell_size_km = cell_size_km
+        self.cell_deg = cell_size_km / KM_PER_DEGREE_LAT
+        self._cells: Dict[Tuple[int, int], Dict[Hashable, Tuple[float, float]]] = {}
+        self._positions: Dict[Hashable, Tuple[float, float]] = {}
+
+    def __len__(self):
+        return len(self._positions)
+
+    def __contains__(self, key):
+        return key in self._positions
+
+    def cell_for(self, lat, lng) -> Tuple[int, int]:
+        return int(float(lat) // self.cell_deg), int(float(lng) // self.cell_deg)
+
+    def position(self, key) -> Optional[Tuple[float, float]]:
+        return self._positions.get(key)
+
+    def upsert(self, key, lat, lng):
+        lat, lng = float(lat), float(lng)
+        self.remove(key)
+        self._positions[key] = (lat, lng)
+        self._cells.setdefault(self.cell_for(lat, lng), {})[key] = (lat, lng)
+
+    def remove(self, key):
+        position = self._positions.pop(key, None)
+        if position is None:
+            return
+        cell = self.cell_for(*position)
+        bucket = self._cells.get(cell)
+        if bucket is not None:
+            bucket.pop(key, None)
+            if not bucket:
+                del self._cells[cell]
+
+    def clear(self):
+        self._cells.clear()
+        self._positions.clear()
+
+    def cells_within(self, lat, lng, radius_km: float) -> List[Tuple[int, int]]:
+        """Cells overlapping the bounding box of the search radius."""
+        lat, lng = float(lat), float(lng)
+        ci, cj = self.cell_for(lat, lng)
+        lat_span = int(ceil(radius_km / self.cell_size_km))
+        # Longitude cells shrink towards the poles, so widen the scan accordingly
+        lng_km_per_cell = self.cell_size_km * max(cos(radians(lat)), 1e-6)
+        lng_span = int(ceil(radius_km / lng_km_per_cell))
+        return [
+            (i, j)
+            for i in range(ci - lat_span, ci + lat_span + 1)
+            for j in range(cj - lng_span, cj + lng_span + 1)
+        ]
+
+    def nearby(self, lat, lng, radius_km: float) -> List[Tuple[Hashable, float]]:
+        """
+        Returns (key, distance_km) pairs within `radius_km`, nearest first.
+        Only the neighbouring cells are scanned.
+        """
+        keys, coords = [], []
+        for cell in self.cells_within(lat, lng, radius_km):
+            bucket = self._cells.get(cell)
+            if bucket:
+                keys.extend(bucket.keys())
+                coords.extend(bucket.values())
+
+        if not keys:
+            return []
+
+        coords = np.asarray(coords, dtype=np.float64)
+        distances = haversine_many(lat, lng, coords[:, 0], coords[:, 1])
+        order = np.argsort(distances, kind='stable')
+        return [(keys[i], float(distances[i])) for i in order if distances[i] <= radius_km]
+
+
+class AvailableCabIndex:
+    """
+    Process-local spatial index of available cabs.
+
+    The index is a candidate filter only: callers must re-check status under a
+    row lock. It is kept current by model signals (see signals.py) and rebuilt
+    from the database every `refresh_seconds` to pick up changes made by other
+    processes or by queryset updates that bypass signals.
+    """
+
+    def __init__(self, cell_size_km: float = None, refresh_seconds: float = None):
+        self.grid = GridIndex(cell_size_km or getattr(settings, 'POOLING_GRID_CELL_KM', 1.0))
+        self.refresh_seconds = (
+            refresh_seconds if refresh_seconds is not None
+            else getattr(settings, 'POOLING_INDEX_REFRESH_SECONDS', 30)
+        )
+        self._built_at = None
+        self._lock = threading.RLock()
+
+    def rebuild(self):
+        from apps.rides.models import Cab
+
+        from apps.rides.locations import cab_locations
+
+        rows = list(Cab.objects.filter(
+            status=Cab.Status.AVAILABLE,
+            current_lat__isnull=False,
+            current_lng__isnull=False
+        ).values_list('id', 'current_lat', 'current_lng'))
+        # Pings not yet flushed to the table are newer than the rows
+        latest = cab_locations.positions(cab_id for cab_id, _, _ in rows)
+
+        with self._lock:
+            self.grid.clear()
+            for cab_id, lat, lng in rows:
+                self.grid.upsert(cab_id, *latest.get(cab_id, (lat, lng)))
+            self._built_at = time.monotonic()
+        logger.debug(f"Rebuilt available cab index with {len(self.grid)} cabs")
+
+    def invalidate(self):
+        with self._lock:
+            self._built_at = None
+
+    def ensure_fresh(self):
+        if self._built_at is None or time.monotonic() - self._built_at > self.refresh_seconds:
+            self.rebuild()
+
+    def sync_cab(self, cab_id, status, lat, lng):
+        """Applies a single cab change (status and/or position) to the index."""
+        from apps.rides.models import Cab
+
+        with self._lock:
+            if status == Cab.Status.AVAILABLE and lat is not None and lng is not None:
+                self.grid.upsert(cab_id, lat, lng)
+            else:
+                self.grid.remove(cab_id)
+
+    def move_cab(self, cab_id, lat, lng):
+        """Moves an indexed (available) cab to a new position; other cabs are ignored."""
+        with self._lock:
+            if cab_id in self.grid:
+                self.grid.upsert(cab_id, lat, lng)
+
+    def remove(self, cab_id):
+        with self._lock:
+            self.grid.remove(cab_id)
+
+    def nearest(self, lat, lng, radius_km: float, limit: int = None) -> List[Tuple[int, float]]:
+        """(cab_id, distance_km) of available cabs within the radius, nearest first."""
+        self.ensure_fresh()
+        with self._lock:
+            matches = self.grid.nearby(lat, lng, radius_km)
+        return matches[:limit] if limit else matches
+
+
+available_cab_index = AvailableCabIndex()
+
+
+class OpenPoolIndex:
+    """
+    Process-local index of open pools, bucketed by remaining seats and then by
+    cab location on a uniform grid.
+
+    A lookup only visits the seat buckets that can fit the request and, inside
+    them, the grid cells around the pickup, so full or distant pools are never
+    touched. Like AvailableCabIndex it is a candidate filter: capacity is
+    re-verified under the pool row lock before a member is added.
+    """
+
+    def __init__(self, cell_size_km: float = None, refresh_seconds: float = None):
+        self.cell_size_km = cell_size_km or getattr(settings, 'POOLING_GRID_CELL_KM', 1.0)
+        self.refresh_seconds = (
+            refresh_seconds if refresh_seconds is not None
+            else getattr(settings, 'POOLING_INDEX_REFRESH_SECONDS', 30)
+        )
+        self._by_seats: Dict[int, GridIndex] = {}
+        self._residual: Dict[int, Tuple[int, int]] = {}
+        self._built_at = None
+        self._lock = threading.RLock()
+
+    def __len__(self):
+        return len(self._residual)
+
+    @staticmethod
+    def _open_pools_queryset():
+        from apps.pooling.models import Pool
+
+        return Pool.objects.filter(
+            status=Pool.Status.POOLED,
+            cab__current_lat__isnull=False,
+            cab__current_lng__isnull=False
+        ).values_list(
+            'id', 'cab__current_lat', 'cab__current_lng',
+            'cab__total_seats', 'cab__luggage_capacity', 'seats_used', 'luggage_used'
+        )
+
+    def _upsert_row(self, row):
+        pool_id, lat, lng, total_seats, luggage_capacity, seats_taken, luggage_taken = row
+        seats_left = total_seats - seats_taken
+        luggage_left = luggage_capacity - luggage_taken
+
+        self._remove(pool_id)
+        if seats_left <= 0:
+            # Full pools can never take another rider; keep them out of every bucket
+            return
+        grid = self._by_seats.get(seats_left)
+        if grid is None:
+            grid = self._by_seats[seats_left] = GridIndex(self.cell_size_km)
+        grid.upsert(pool_id, lat, lng)
+        self._residual[pool_id] = (seats_left, luggage_left)
+
+    def _remove(self, pool_id):
+        residual = self._residual.pop(pool_id, None)
+        if residual is not None:
+            self._by_seats[residual[0]].remove(pool_id)
+
+    def rebuild(self):
+        rows = list(self._open_pools_queryset())
+        with self._lock:
+            self._by_seats.clear()
+            self._residual.clear()
+            for row in rows:
+                self._upsert_row(row)
+            self._built_at = time.monotonic()
+        logger.debug(f"Rebuilt open pool index with {len(self._residual)} pools")
+
+    def invalidate(self):
+        with self._lock:
+            self._built_at = None
+
+    def ensure_fresh(self):
+        if self._built_at is None or time.monotonic() - self._built_at > self.refresh_seconds:
+            self.rebuild()
+
+    def refresh_pool(self, pool_id):
+        """Re-reads one pool's position and residual capacity (or drops it if closed)."""
+        row = self._open_pools_queryset().filter(id=pool_id).first()
+        with self._lock:
+            if row is None:
+                self._remove(pool_id)
+            else:
+                self._upsert_row(row)
+
+    def remove(self, pool_id):
+        with self._lock:
+            self._remove(pool_id)
+
+    def candidates(self, lat, lng, radius_km: float, seats: int, luggage: int) -> List[Tuple[int, float]]:
+        """
+        (pool_id, distance_km) of open pools within the radius that could still
+        fit `seats` and `luggage`, nearest first.
+        """
+        self.ensure_fresh()
+        matches = []
+        with self._lock:
+            for seats_left, grid in self._by_seats.items():
+                if seats_left < seats:
+                    continue
+                for pool_id, dist in grid.nearby(lat, lng, radius_km):
+                    if self._residual[pool_id][1] >= luggage:
+                        matches.append((pool_id, dist))
+        matches.sort(key=lambda match: match[1])
+        return matches
+
+
+open_pool_index = OpenPoolIndex()
@@ -0,0 +1,110 @@
+import logging
+from typing import Dict, Iterable, Optional
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+
+from apps.pooling.models import PoolMember
+from apps.rides.models import RideRequest
+
+logger = logging.getLogger(__name__)
+
+
+def build_ride_statuses(ride_ids: Iterable[int]) -> Dict[int, Dict]:
+    """
+    pool_status payloads for many rides: pool, cab, ETAs, fare and pool size.
+    A constant number of queries regardless of the number of rides (the fares
+    come from one PricingEngine.quote_rides batch). Unknown rides are omitted.
+    """
+    from apps.pricing.services import PricingEngine
+
+    statuses = dict(RideRequest.objects.filter(id__in=list(ride_ids)).values_list('id', 'status'))
+    if not statuses:
+        return {}
+
+    memberships = {
+        row['ride_request_id']: row for row in PoolMember.objects.filter(
+            ride_request_id__in=list(statuses)
+        ).values('ride_request_id', 'pool_id', 'pool__cab_id', 'pickup_eta', 'drop_eta')
+    }
+    quotes = {
+        quote['ride_id']: quote for quote in PricingEngine().quote_rides(list(memberships))
+    } if memberships else {}
+
+    payloads = {}
+    for ride_id, ride_status in statuses.items():
+        membership = memberships.get(ride_id)
+        if membership is None:
+            payloads[ride_id] = {
+                "status": ride_status,
+                "message": "Ride is not currently assigned to a pool."
+            }
+            continue
+        quote = quotes[ride_id]
+        payloads[ride_id] = {
+            "pool_id": membership['pool_id'],
+            "cab_id": membership['pool__cab_id'],
+            "pickup_eta": membership['pickup_eta'],
+            "drop_eta": membership['drop_eta'],
+            "price": quote['final_price'],
+            "passenger_count": quote['passenger_count'],
+            "status": ride_status
+        }
+    return payloads
+
+
+class RideStatusCache:
+    """
+    Denormalized pool_status read model, one entry per ride in the Django cache.
+
+    Entries are rebuilt set-wise whenever sync_pool_routes() writes a pool's
+    route (new matches, batch matching, resyncs after a cancellation), and are
+    deleted when a member leaves a pool: the leaving ride and every rider that
+    stays behind, whose passenger count and fare changed. Emptied pools are
+    only cancelled once their last member has left, so their riders are
+    already invalidated by then. The TTL (RIDE_STATUS_CACHE_TTL_SECONDS)
+    bounds the age of the quoted fare under changing surge.
+    """
+
+    def __init__(self, ttl_seconds: int = None):
+        self.ttl_seconds = (
+            ttl_seconds if ttl_seconds is not None
+            else getattr(settings, 'RIDE_STATUS_CACHE_TTL_SECONDS', 300)
+        )
+
+    @staticmethod
+    def key(ride_id) -> str:
+        return f"rides:status:{ride_id}"
+
+    def get(self, ride_id) -> Optional[Dict]:
+        return cache.get(self.key(ride_id))
+
+    def get_or_build(self, ride_id) -> Optional[Dict]:
+        """Cached payload, rebuilt from the database on a miss. None for unknown rides."""
+        payload = self.get(ride_id)
+        if payload is None:
+            payload = self.refresh([ride_id]).get(ride_id)
+        return payload
+
+    async def aget_or_build(self, ride_id) -> Optional[Dict]:
+        """get_or_build for async views: the cache read and any rebuild stay off the event loop."""
+        payload = await cache.aget(self.key(ride_id))
+        if payload is None:
+            payloads = await sync_to_async(self.refresh)([ride_id])
+            payload = payloads.get(ride_id)
+        return payload
+
+    def refresh(self, ride_ids: Iterable[int]) -> Dict[int, Dict]:
+        payloads = build_ride_statuses(ride_ids)
+        if payloads:
+            cache.set_many({self.key(ride_id): payload for ride_id, payload in payloads.items()}, timeout=self.ttl_seconds)
+        return payloads
+
+    def invalidate(self, ride_ids: Iterable[int]):
+        keys = [self.key(ride_id) for ride_id in ride_ids]
+        if keys:
+            cache.delete_many(keys)
+
+
+ride_status_cache = RideStatusCache()
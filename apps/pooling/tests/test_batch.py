@@ -0,0 +1,158 @@
+import random
+from decimal import Decimal
+
+from django.test import SimpleTestCase, TestCase
+
+from apps.pooling.models import Pool, PoolMember
+from apps.pooling.services import PoolingEngine
+from apps.rides.models import Cab, RideRequest
+from apps.users.models import User
+
+AIRPORT = (Decimal('12.949000'), Decimal('77.668000'))
+CITY = (Decimal('12.971600'), Decimal('77.594600'))
+
+
+def make_cab(cab_id, lat, lng, seats=4, luggage=4):
+    return Cab(
+        id=cab_id, driver_name=f"Driver {cab_id}", total_seats=seats, luggage_capacity=luggage,
+        current_lat=Decimal(lat), current_lng=Decimal(lng), status=Cab.Status.AVAILABLE
+    )
+
+
+def make_request(request_id, lat, lng, seats=1, luggage=1, tolerance=15):
+    return RideRequest(
+        id=request_id, user_id=1, pickup_lat=Decimal(lat), pickup_lng=Decimal(lng),
+        drop_lat=CITY[0], drop_lng=CITY[1], seats_required=seats, luggage_units=luggage,
+        detour_tolerance_minutes=tolerance
+    )
+
+
+def plan(mode, requests, cabs):
+    return PoolingEngine(assignment_mode=mode)._plan_batch(requests, [], {}, cabs)
+
+
+class PlanBatchTests(SimpleTestCase):
+    """_plan_batch is pure, so it runs on unsaved snapshots."""
+
+    def nearby_cabs(self, count, rng):
+        return [
+            make_cab(
+                idx + 1,
+                AIRPORT[0] + Decimal(rng.randint(-900, 900)) / 100000,
+                AIRPORT[1] + Decimal(rng.randint(-900, 900)) / 100000
+            )
+            for idx in range(count)
+        ]
+
+    def test_colocated_requests_share_pools_in_both_modes(self):
+        for mode in PoolingEngine.ASSIGNMENT_MODES:
+            with self.subTest(mode=mode):
+                rng = random.Random(7)
+                requests = [make_request(idx + 1, *AIRPORT) for idx in range(8)]
+                result = plan(mode, requests, self.nearby_cabs(20, rng))
+
+                self.assertEqual(result["results"]["new_pools_created"], 2)
+                self.assertEqual(result["results"]["requests_pooled"], 8)
+                self.assertEqual(result["results"]["remained_pending"], 0)
+
+    def test_optimal_never_opens_more_pools_than_greedy_for_colocated_requests(self):
+        for seed in range(50):
+            with self.subTest(seed=seed):
+                rng = random.Random(seed)
+                # A burst at one pickup with mixed party and luggage sizes
+                specs = [(rng.randint(1, 3), rng.randint(0, 2)) for _ in range(rng.randint(2, 30))]
+                counts = {}
+                for mode in PoolingEngine.ASSIGNMENT_MODES:
+                    requests = [
+                        make_request(idx + 1, *AIRPORT, seats=seats, luggage=luggage)
+                        for idx, (seats, luggage) in enumerate(specs)
+                    ]
+                    result = plan(mode, requests, self.nearby_cabs(40, random.Random(seed)))["results"]
+                    self.assertEqual(result["requests_pooled"] + result["remained_pending"], len(specs))
+                    counts[mode] = (result["new_pools_created"], result["requests_pooled"])
+
+                self.assertLessEqual(counts['optimal'][0], counts['greedy'][0])
+                self.assertGreaterEqual(counts['optimal'][1], counts['greedy'][1])
+
+    def test_optimal_does_not_strand_later_requests(self):
+        # Greedy gives the only cab in reach of request 2 to request 1
+        cabs = [make_cab(1, '12.949000', '77.688000'), make_cab(2, '12.949000', '77.648000')]
+        requests = [
+            make_request(1, '12.949000', '77.670000', seats=4),
+            make_request(2, '12.949000', '77.700000', seats=4),
+        ]
+
+        self.assertEqual(plan('greedy', requests, cabs)["results"]["requests_pooled"], 1)
+        result = plan('optimal', requests, cabs)
+        self.assertEqual(result["results"]["requests_pooled"], 2)
+        self.assertEqual(
+            {member.ride_request.id: member.pool.cab.id for member in result["new_members"]}, {1: 2, 2: 1}
+        )
+
+    def test_pools_respect_cab_capacity(self):
+        rng = random.Random(3)
+        requests = [make_request(idx + 1, *AIRPORT, seats=rng.randint(1, 4)) for idx in range(12)]
+        for mode in PoolingEngine.ASSIGNMENT_MODES:
+            with self.subTest(mode=mode):
+                result = plan(mode, requests, self.nearby_cabs(20, rng))
+                seats = {}
+                for member in result["new_members"]:
+                    seats[id(member.pool)] = seats.get(id(member.pool), 0) + member.ride_request.seats_required
+                self.assertTrue(all(total <= 4 for total in seats.values()))
+
+
+class ProcessPendingBatchTests(TestCase):
+
+    def setUp(self):
+        user = User.objects.create(name="Rider", phone="+910000000000")
+        for idx in range(20):
+            Cab.objects.create(
+                driver_name=f"Driver {idx}", current_lat=AIRPORT[0] + Decimal(idx) / 10000, current_lng=AIRPORT[1]
+            )
+        self.requests = [
+            RideRequest.objects.create(
+                user=user, pickup_lat=AIRPORT[0], pickup_lng=AIRPORT[1], drop_lat=CITY[0], drop_lng=CITY[1]
+            )
+            for _ in range(8)
+        ]
+
+    def test_greedy_batch_pools_colocated_requests(self):
+        results = PoolingEngine(assignment_mode='greedy').process_pending_batch()
+
+        self.assertEqual(results["new_pools_created"], 2)
+        self.assertEqual(results["requests_pooled"], 8)
+        self.assertEqual(
+            sorted(Pool.objects.values_list('seats_used', 'luggage_used')), [(4, 4), (4, 4)]
+        )
+        self.assertEqual(Cab.objects.filter(status=Cab.Status.BUSY).count(), 2)
+        self.assertFalse(RideRequest.objects.filter(status=RideRequest.Status.PENDING).exists())
+
+    def test_greedy_batch_fills_open_pools_first(self):
+        cab = Cab.objects.order_by('id').first()
+        Cab.objects.filter(id=cab.id).update(status=Cab.Status.BUSY)
+        pool = Pool.objects.create(cab=cab)
+        PoolMember.objects.create(pool=pool, ride_request=self.requests[0])
+        RideRequest.objects.filter(id=self.requests[0].id).update(status=RideRequest.Status.POOLED)
+
+        results = PoolingEngine(assignment_mode='greedy').process_pending_batch()
+
+        self.assertEqual(results["requests_pooled"], 7)
+        self.assertEqual(results["new_pools_created"], 1)
+        # Three riders join the open pool, the other four open one more
+        self.assertEqual(pool.members.count(), 4)
+        self.assertEqual(
+            sorted(Pool.objects.values_list('seats_used', flat=True)), [4, 4]
+        )
+
+    def test_optimal_batch_pools_colocated_requests(self):
+        results = PoolingEngine(assignment_mode='optimal').process_pending_batch()
+
+        self.assertEqual(results["new_pools_created"], 2)
+        self.assertEqual(results["requests_pooled"], 8)
+        self.assertEqual(Pool.objects.count(), 2)
+        self.assertEqual(PoolMember.objects.count(), 8)
+        self.assertEqual(Cab.objects.filter(status=Cab.Status.BUSY).count(), 2)
+        self.assertEqual(
+            sorted(Pool.objects.values_list('seats_used', flat=True)), [4, 4]
+        )
+        self.assertFalse(RideRequest.objects.filter(status=RideRequest.Status.PENDING).exists())
@@ -0,0 +1,120 @@
+import random
+
+from django.test import SimpleTestCase
+
+from apps.pooling.geo import haversine
+from apps.pooling.routing import build_stops, evaluate_insertion
+
+CAB = (12.949, 77.668)
+
+
+def random_point(rng):
+    return (CAB[0] + rng.uniform(-0.15, 0.15), CAB[1] + rng.uniform(-0.15, 0.15))
+
+
+def path_length(stops):
+    points = [CAB] + [stop['coords'] for stop in stops]
+    return sum(haversine(*a, *b) for a, b in zip(points, points[1:]))
+
+
+def drop_of(stops, member_id):
+    return next(stop for stop in stops if stop['type'] == 'DROP' and stop['id'] == member_id)
+
+
+def random_route(rng, member_count):
+    """A precedence-respecting stop sequence over `member_count` random members."""
+    stops = build_stops([
+        {'id': idx + 1, 'pickup': random_point(rng), 'drop': random_point(rng)} for idx in range(member_count)
+    ])
+    route, waiting, onboard = [], stops[::2], []
+    while waiting or onboard:
+        stop = rng.choice(waiting + onboard)
+        if stop['type'] == 'PICKUP':
+            waiting.remove(stop)
+            onboard.append(drop_of(stops, stop['id']))
+        else:
+            onboard.remove(stop)
+        route.append(stop)
+    return route
+
+
+def ride_lengths(route):
+    """Distance travelled between each member's pickup and drop."""
+    lengths, onboard = {}, set()
+    for prev, stop in zip(route, route[1:]):
+        if prev['type'] == 'PICKUP':
+            onboard.add(prev['id'])
+            lengths[prev['id']] = 0.0
+        else:
+            onboard.discard(prev['id'])
+        leg = haversine(*prev['coords'], *stop['coords'])
+        for member_id in onboard:
+            lengths[member_id] += leg
+    return lengths
+
+
+def insert(stops, new_stops, pickup_gap, drop_gap):
+    return (
+        stops[:pickup_gap] + new_stops[:1] + stops[pickup_gap:drop_gap]
+        + new_stops[1:] + stops[drop_gap:]
+    )
+
+
+class EvaluateInsertionTests(SimpleTestCase):
+
+    def test_matches_brute_force(self):
+        rng = random.Random(11)
+        interior = 0
+        for trial in range(400):
+            stops = random_route(rng, rng.randint(0, 4))
+            rides = ride_lengths(stops)
+            direct = {
+                stop['id']: haversine(*stop['coords'], *drop_of(stops, stop['id'])['coords'])
+                for stop in stops if stop['type'] == 'PICKUP'
+            }
+            # Tolerances that every member's current ride already satisfies
+            tolerance_km = {
+                member_id: rides[member_id] - direct[member_id]
+                + rng.choice([0.0, rng.uniform(0, 3), rng.uniform(0, 30)])
+                for member_id in direct
+            }
+            pickup, drop = random_point(rng), random_point(rng)
+            new_tolerance = rng.choice([0.0, rng.uniform(0, 5), 100.0])
+            new_stops = build_stops([{'id': 0, 'pickup': pickup, 'drop': drop}])
+            limit = {member_id: direct[member_id] + tolerance_km[member_id] for member_id in direct}
+            limit[0] = haversine(*pickup, *drop) + new_tolerance
+
+            def feasible(route):
+                return all(ride <= limit[member_id] + 1e-9 for member_id, ride in ride_lengths(route).items())
+
+            # Every (pickup gap, drop gap) pair
+            best = min(
+                path_length(route) - path_length(stops)
+                for route in (
+                    insert(stops, new_stops, k, l) for k in range(len(stops) + 1) for l in range(k, len(stops) + 1)
+                )
+                if feasible(route)
+            )
+
+            with self.subTest(trial=trial):
+                result = evaluate_insertion(*CAB, stops, pickup, drop, tolerance_km, new_tolerance)
+                # Appending both stops delays nobody, so some pair is always feasible
+                self.assertIsNotNone(result)
+                added_km, pickup_gap, drop_gap = result
+                self.assertAlmostEqual(added_km, best, places=6)
+
+                # Ties may pick other gaps, but they must be as cheap and feasible
+                route = insert(stops, new_stops, pickup_gap, drop_gap)
+                self.assertTrue(feasible(route))
+                self.assertAlmostEqual(path_length(route) - path_length(stops), best, places=6)
+                interior += drop_gap < len(stops)
+
+        # Not just appends
+        self.assertGreater(interior, 100)
+
+    def test_empty_route_takes_the_rider_directly(self):
+        pickup, drop = (12.95, 77.67), (12.97, 77.59)
+        added_km, pickup_gap, drop_gap = evaluate_insertion(*CAB, [], pickup, drop, {}, 0.0)
+
+        self.assertEqual((pickup_gap, drop_gap), (0, 0))
+        self.assertAlmostEqual(added_km, haversine(*CAB, *pickup) + haversine(*pickup, *drop), places=6)
@@ -0,0 +1,44 @@
+from decimal import Decimal
+
+from django.test import TestCase
+
+from apps.pooling.services import PoolingEngine
+from apps.pooling.spatial import zone_for
+from apps.rides.models import RideRequest
+from apps.users.models import User
+
+AIRPORT = (Decimal('12.949000'), Decimal('77.668000'))
+CITY = (Decimal('12.971600'), Decimal('77.594600'))
+
+
+class PendingByZoneTests(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create(name="Rider", phone="+910000000000")
+
+    def ride(self, pickup):
+        return RideRequest(user=self.user, pickup_lat=pickup[0], pickup_lng=pickup[1], drop_lat=CITY[0], drop_lng=CITY[1])
+
+    def test_pickup_zone_is_stored_on_every_insert_path(self):
+        created = RideRequest.objects.create(
+            user=self.user, pickup_lat=AIRPORT[0], pickup_lng=AIRPORT[1], drop_lat=CITY[0], drop_lng=CITY[1]
+        )
+        RideRequest.objects.bulk_create([self.ride(CITY)])
+
+        self.assertEqual(created.pickup_zone, zone_for(*AIRPORT))
+        self.assertEqual(
+            set(RideRequest.objects.values_list('pickup_zone', flat=True)), {zone_for(*AIRPORT), zone_for(*CITY)}
+        )
+
+    def test_zone_sweep_selects_its_requests_in_sql(self):
+        rides = RideRequest.objects.bulk_create([self.ride(AIRPORT if idx % 2 else CITY) for idx in range(10)])
+        airport_ids = [ride.id for ride in rides if ride.pickup_zone == zone_for(*AIRPORT)]
+        engine = PoolingEngine()
+
+        with self.assertNumQueries(1):
+            by_zone = engine._pending_by_zone(zone_for(*AIRPORT), limit=3)
+        self.assertEqual(by_zone, {zone_for(*AIRPORT): airport_ids[:3]})
+
+        by_zone = engine._pending_by_zone(zone_for(*AIRPORT), after_id=airport_ids[2])
+        self.assertEqual(by_zone, {zone_for(*AIRPORT): airport_ids[3:]})
+        self.assertEqual(sum(len(ids) for ids in engine._pending_by_zone().values()), 10)
@@ -0,0 +1,126 @@
+import random
+from itertools import permutations
+
+from django.test import SimpleTestCase
+
+from apps.pooling.geo import haversine
+from apps.pooling.routing import (
+    RouteCache, RouteOptimizer, build_stops, respects_precedence, route_length, solve_exact, stop_distance_matrix
+)
+
+CAB = (12.949, 77.668)
+
+
+def random_point(rng):
+    return (CAB[0] + rng.uniform(-0.1, 0.1), CAB[1] + rng.uniform(-0.1, 0.1))
+
+
+def random_members(rng, count):
+    return [
+        {'id': idx + 1, 'pickup': random_point(rng), 'drop': random_point(rng), 'tolerance': 15}
+        for idx in range(count)
+    ]
+
+
+def brute_force_length(member_count, dist):
+    """Shortest precedence-respecting open route over every stop permutation."""
+    return min(
+        route_length(list(order), dist)
+        for order in permutations(range(2 * member_count)) if respects_precedence(order)
+    )
+
+
+class SolveExactTests(SimpleTestCase):
+
+    def test_matches_brute_force(self):
+        rng = random.Random(17)
+        for member_count, trials in ((1, 5), (2, 20), (3, 20), (4, 3)):
+            for trial in range(trials):
+                with self.subTest(members=member_count, trial=trial):
+                    dist = stop_distance_matrix(*CAB, build_stops(random_members(rng, member_count)))
+                    order = solve_exact(member_count, dist)
+
+                    self.assertEqual(sorted(order), list(range(2 * member_count)))
+                    self.assertTrue(respects_precedence(order))
+                    self.assertAlmostEqual(route_length(order, dist), brute_force_length(member_count, dist), places=9)
+
+    def test_drop_waits_for_its_pickup(self):
+        # The drop sits on the cab, the pickup far away: the drop still comes second
+        dist = stop_distance_matrix(*CAB, build_stops([{'id': 1, 'pickup': (13.2, 77.9), 'drop': CAB}]))
+        self.assertEqual(solve_exact(1, dist), [0, 1])
+
+
+class RouteCacheTests(SimpleTestCase):
+
+    def test_distance_is_the_sum_of_consecutive_legs(self):
+        rng = random.Random(5)
+        for count in (0, 1, 6):
+            with self.subTest(stops=count):
+                stops = [{'id': idx, 'type': 'PICKUP', 'coords': random_point(rng)} for idx in range(count)]
+                entry = RouteCache().set(1, 'fp', *CAB, stops)
+
+                coords = [CAB] + [stop['coords'] for stop in stops]
+                expected = sum(haversine(*a, *b) for a, b in zip(coords, coords[1:]))
+                self.assertAlmostEqual(entry['distance_km'], expected, places=6)
+
+
+class RouteOptimizerTests(SimpleTestCase):
+
+    def assertValidRoute(self, route, members):
+        self.assertEqual(
+            sorted((stop['type'], stop['id']) for stop in route),
+            sorted((kind, member['id']) for member in members for kind in ('DROP', 'PICKUP'))
+        )
+        position = {(stop['type'], stop['id']): idx for idx, stop in enumerate(route)}
+        for member in members:
+            self.assertLess(position[('PICKUP', member['id'])], position[('DROP', member['id'])])
+
+    def length(self, route):
+        points = [CAB] + [stop['coords'] for stop in route]
+        return sum(haversine(*a, *b) for a, b in zip(points, points[1:]))
+
+    def test_small_pools_are_solved_exactly_in_any_member_order(self):
+        rng = random.Random(23)
+        optimizer = RouteOptimizer(exact_max_stops=8)
+        for trial in range(10):
+            members = random_members(rng, 3)
+            dist = stop_distance_matrix(*CAB, build_stops(members))
+            shortest = brute_force_length(3, dist)
+            for shuffled in (members, members[::-1]):
+                with self.subTest(trial=trial, reversed=shuffled is not members):
+                    route = optimizer.optimize_route(*CAB, shuffled)
+                    self.assertValidRoute(route, members)
+                    self.assertAlmostEqual(self.length(route), shortest, places=6)
+
+    def test_large_pools_get_valid_routes_no_longer_than_insertion(self):
+        rng = random.Random(29)
+        optimizer = RouteOptimizer(time_budget_ms=1000, exact_max_stops=0)
+        for trial in range(10):
+            members = random_members(rng, rng.randint(4, 7))
+            with self.subTest(trial=trial, members=len(members)):
+                route = optimizer.optimize_route(*CAB, members)
+                self.assertValidRoute(route, members)
+
+                dist = stop_distance_matrix(*CAB, build_stops(members))
+                insertion = optimizer._cheapest_insertion(len(members), dist)
+                self.assertLessEqual(self.length(route), route_length(insertion, dist) + 1e-9)
+
+    def test_local_search_finds_the_optimum_of_small_pools(self):
+        rng = random.Random(31)
+        heuristic = RouteOptimizer(time_budget_ms=1000, exact_max_stops=0)
+        for trial in range(10):
+            members = random_members(rng, 3)
+            dist = stop_distance_matrix(*CAB, build_stops(members))
+            with self.subTest(trial=trial):
+                # Heuristic, so allow a small gap to the optimum
+                self.assertLessEqual(
+                    self.length(heuristic.optimize_route(*CAB, members)), brute_force_length(3, dist) * 1.05
+                )
+
+    def test_exhausted_time_budget_still_returns_a_valid_route(self):
+        members = random_members(random.Random(37), 8)
+        route = RouteOptimizer(time_budget_ms=0, exact_max_stops=0).optimize_route(*CAB, members)
+        self.assertValidRoute(route, members)
+
+    def test_empty_pool(self):
+        self.assertEqual(RouteOptimizer().optimize_route(*CAB, []), [])
@@ -0,0 +1,82 @@
+from decimal import Decimal
+
+from django.core.exceptions import ValidationError
+from django.test import TestCase
+
+from apps.pooling.models import Pool, PoolMember
+from apps.pooling.services import remove_rides_from_pools
+from apps.rides.models import Cab, RideRequest
+from apps.users.models import User
+
+AIRPORT = (Decimal('12.949000'), Decimal('77.668000'))
+CITY = (Decimal('12.971600'), Decimal('77.594600'))
+
+
+class PoolUsageCounterTests(TestCase):
+    """Counters stay in step on the ORM paths the engine does not drive."""
+
+    def setUp(self):
+        self.user = User.objects.create(name="Rider", phone="+910000000000")
+        self.cab = Cab.objects.create(driver_name="Driver", current_lat=AIRPORT[0], current_lng=AIRPORT[1])
+        self.pool = Pool.objects.create(cab=self.cab)
+
+    def ride(self, seats=1, luggage=1):
+        return RideRequest.objects.create(
+            user=self.user, pickup_lat=AIRPORT[0], pickup_lng=AIRPORT[1], drop_lat=CITY[0], drop_lng=CITY[1],
+            seats_required=seats, luggage_units=luggage
+        )
+
+    def usage(self, pool=None):
+        return Pool.objects.filter(id=(pool or self.pool).id).values_list('seats_used', 'luggage_used').get()
+
+    def test_member_save_and_delete_adjust_counters(self):
+        member = PoolMember.objects.create(pool=self.pool, ride_request=self.ride(seats=2, luggage=1))
+        self.assertEqual(self.usage(), (2, 1))
+
+        member.sequence_order = 2
+        member.save()
+        self.assertEqual(self.usage(), (2, 1))
+
+        member.delete()
+        self.assertEqual(self.usage(), (0, 0))
+
+    def test_moving_a_member_moves_its_usage(self):
+        other = Pool.objects.create(
+            cab=Cab.objects.create(driver_name="Other", current_lat=AIRPORT[0], current_lng=AIRPORT[1])
+        )
+        member = PoolMember.objects.create(pool=self.pool, ride_request=self.ride(seats=3, luggage=2))
+
+        member.pool = other
+        member.save()
+        self.assertEqual(self.usage(), (0, 0))
+        self.assertEqual(self.usage(other), (3, 2))
+
+    def test_ride_request_delete_cascade_releases_usage(self):
+        ride = self.ride(seats=2, luggage=2)
+        PoolMember.objects.create(pool=self.pool, ride_request=ride)
+        PoolMember.objects.create(pool=self.pool, ride_request=self.ride())
+
+        ride.delete()
+        self.assertEqual(self.usage(), (1, 1))
+
+    def test_full_pool_rejects_members(self):
+        PoolMember.objects.create(pool=self.pool, ride_request=self.ride(seats=4, luggage=0))
+
+        with self.assertRaises(ValidationError):
+            PoolMember.objects.create(pool=self.pool, ride_request=self.ride())
+        self.assertEqual(self.usage(), (4, 0))
+
+    def test_set_wise_removal_releases_usage_once(self):
+        rides = [self.ride(), self.ride(seats=2)]
+        for ride in rides:
+            PoolMember.objects.create(pool=self.pool, ride_request=ride)
+
+        self.assertEqual(remove_rides_from_pools([ride.id for ride in rides]), [self.pool.id])
+        self.assertEqual(self.usage(), (0, 0))
+
+    def test_recompute_usage_repairs_drift(self):
+        PoolMember.objects.create(pool=self.pool, ride_request=self.ride(seats=2, luggage=3))
+        Pool.objects.filter(id=self.pool.id).update(seats_used=0, luggage_used=4)
+
+        self.assertEqual(Pool.recompute_usage([self.pool.id]), 1)
+        self.assertEqual(self.usage(), (2, 3))
@@ -3,3 +3,9 @@ from django.apps import AppConfig
 class PricingConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'apps.pricing'
+
+    def ready(self):
+        # Keep per-cell cab supply for surge pricing in sync with cab changes,
+        # and drop cached quotes when pricing settings change
+        from . import signals  # noqa: F401
+        from . import checks  # noqa: F401
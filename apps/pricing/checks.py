@@ -0,0 +1,19 @@
+from django.conf import settings
+from django.core.checks import Error, register
+
+
+@register()
+def demand_backend_check(app_configs, **kwargs):
+    """The shared demand counters must be reachable; there is no per-process fallback."""
+    if getattr(settings, 'PRICING_DEMAND_BACKEND', 'memory') != 'redis':
+        return []
+    try:
+        from django_redis import get_redis_connection
+        get_redis_connection('default').ping()
+    except Exception as e:
+        return [Error(
+            f"PRICING_DEMAND_BACKEND is 'redis' but Redis is unavailable: {e}",
+            hint="Start Redis, or set PRICING_DEMAND_BACKEND=memory for a single-process setup.",
+            id='pricing.E001',
+        )]
+    return []
@@ -0,0 +1,338 @@
+import logging
+import threading
+import time
+from typing import Dict, Iterable, List, Optional
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+
+from apps.pooling.spatial import zone_for
+
+logger = logging.getLogger(__name__)
+
+
+def demand_cell(lat, lng) -> str:
+    """Pickup cell used for demand counting (same grid scheme as pooling zones)."""
+    return zone_for(lat, lng, getattr(settings, 'PRICING_DEMAND_CELL_KM', 1.0))
+
+
+class SlidingWindowCounter:
+    """
+    Per-key event counts over the last `buckets * bucket_seconds` seconds,
+    kept in a ring buffer of time buckets with a running total.
+
+    Complexity Analysis:
+    - add: O(1) amortized (expired buckets are cleared as time moves on)
+    - count: O(1) amortized, O(buckets) worst case after a long idle gap
+    """
+
+    def __init__(self, window_seconds: float, buckets: int):
+        self.buckets = buckets
+        self.bucket_seconds = window_seconds / buckets
+        # key -> [counts, total, last_bucket]
+        self._state: Dict[str, list] = {}
+        self._lock = threading.Lock()
+
+    def _current_bucket(self) -> int:
+        return int(time.time() // self.bucket_seconds)
+
+    def _advance(self, state, bucket: int):
+        counts, total, last = state
+        if bucket - last >= self.buckets:
+            counts[:] = [0] * self.buckets
+            total = 0
+        else:
+            for stale in range(last + 1, bucket + 1):
+                slot = stale % self.buckets
+                total -= counts[slot]
+                counts[slot] = 0
+        state[1], state[2] = total, bucket
+
+    def add(self, key: str, amount: int = 1):
+        bucket = self._current_bucket()
+        with self._lock:
+            state = self._state.get(key)
+            if state is None:
+                state = self._state[key] = [[0] * self.buckets, 0, bucket]
+            self._advance(state, bucket)
+            state[0][bucket % self.buckets] += amount
+            state[1] += amount
+
+    def count(self, key: str) -> int:
+        with self._lock:
+            state = self._state.get(key)
+            if state is None:
+                return 0
+            self._advance(state, self._current_bucket())
+            return state[1]
+
+    def clear(self):
+        with self._lock:
+            self._state.clear()
+
+
+class MemoryDemandBackend:
+    """
+    Process-local demand state: a sliding window of requests per cell and a
+    gauge of currently available cabs per cell. Used in tests and single
+    process deployments; RedisDemandBackend shares the state across workers.
+    """
+
+    def __init__(self, window_seconds: float, buckets: int):
+        self.requests = SlidingWindowCounter(window_seconds, buckets)
+        self._supply: Dict[str, int] = {}
+        self._cab_cells: Dict[int, str] = {}
+        self._lock = threading.Lock()
+
+    def add_request(self, cell: str):
+        self.requests.add(cell)
+
+    def request_count(self, cell: str) -> int:
+        return self.requests.count(cell)
+
+    def move_cab(self, cab_id, cell: Optional[str]):
+        with self._lock:
+            previous = self._cab_cells.pop(cab_id, None)
+            if previous is not None:
+                self._supply[previous] -= 1
+            if cell is not None:
+                self._cab_cells[cab_id] = cell
+                self._supply[cell] = self._supply.get(cell, 0) + 1
+
+    def relocate_cab(self, cab_id, cell: str):
+        with self._lock:
+            previous = self._cab_cells.get(cab_id)
+            if previous is None or previous == cell:
+                return
+            self._supply[previous] -= 1
+            self._cab_cells[cab_id] = cell
+            self._supply[cell] = self._supply.get(cell, 0) + 1
+
+    def supply_count(self, cell: str) -> int:
+        return self._supply.get(cell, 0)
+
+    def reset_supply(self, cab_cells: Dict[int, str]):
+        with self._lock:
+            self._cab_cells = dict(cab_cells)
+            self._supply = {}
+            for cell in cab_cells.values():
+                self._supply[cell] = self._supply.get(cell, 0) + 1
+
+    def clear(self):
+        self.requests.clear()
+        self.reset_supply({})
+
+
+class RedisDemandBackend:
+    """
+    Demand state shared by all workers in Redis.
+
+    Requests are counted in one key per (cell, time bucket) that expires with
+    the window, so an update is a single INCR and a read is one MGET of the
+    window's bucket keys. Cab supply is a hash of per-cell counters plus a
+    cab -> cell hash to move cabs between cells.
+    """
+
+    def __init__(self, client, window_seconds: float, buckets: int, prefix: str = 'pricing:demand'):
+        self.client = client
+        self.window_seconds = window_seconds
+        self.buckets = buckets
+        self.bucket_seconds = window_seconds / buckets
+        self.prefix = prefix
+
+    def _bucket_key(self, cell: str, bucket: int) -> str:
+        return f"{self.prefix}:req:{cell}:{bucket}"
+
+    def add_request(self, cell: str):
+        key = self._bucket_key(cell, int(time.time() // self.bucket_seconds))
+        pipe = self.client.pipeline()
+        pipe.incr(key)
+        pipe.expire(key, int(self.window_seconds + self.bucket_seconds) + 1)
+        pipe.execute()
+
+    def request_count(self, cell: str) -> int:
+        current = int(time.time() // self.bucket_seconds)
+        keys = [self._bucket_key(cell, bucket) for bucket in range(current - self.buckets + 1, current + 1)]
+        return sum(int(value) for value in self.client.mget(keys) if value)
+
+    def move_cab(self, cab_id, cell: Optional[str]):
+        previous = self.client.hget(f"{self.prefix}:cab_cells", cab_id)
+        pipe = self.client.pipeline()
+        if previous is not None:
+            pipe.hincrby(f"{self.prefix}:supply", previous.decode(), -1)
+            pipe.hdel(f"{self.prefix}:cab_cells", cab_id)
+        if cell is not None:
+            pipe.hset(f"{self.prefix}:cab_cells", cab_id, cell)
+            pipe.hincrby(f"{self.prefix}:supply", cell, 1)
+        pipe.execute()
+
+    def relocate_cab(self, cab_id, cell: str):
+        previous = self.client.hget(f"{self.prefix}:cab_cells", cab_id)
+        if previous is None or previous.decode() == cell:
+            return
+        pipe = self.client.pipeline()
+        pipe.hincrby(f"{self.prefix}:supply", previous.decode(), -1)
+        pipe.hset(f"{self.prefix}:cab_cells", cab_id, cell)
+        pipe.hincrby(f"{self.prefix}:supply", cell, 1)
+        pipe.execute()
+
+    def supply_count(self, cell: str) -> int:
+        return int(self.client.hget(f"{self.prefix}:supply", cell) or 0)
+
+    def reset_supply(self, cab_cells: Dict[int, str]):
+        supply = {}
+        for cell in cab_cells.values():
+            supply[cell] = supply.get(cell, 0) + 1
+        pipe = self.client.pipeline()
+        pipe.delete(f"{self.prefix}:cab_cells", f"{self.prefix}:supply")
+        if cab_cells:
+            pipe.hset(f"{self.prefix}:cab_cells", mapping=cab_cells)
+            pipe.hset(f"{self.prefix}:supply", mapping=supply)
+        pipe.execute()
+
+    def clear(self):
+        keys = list(self.client.scan_iter(f"{self.prefix}:*"))
+        if keys:
+            self.client.delete(*keys)
+
+
+class DemandTracker:
+    """
+    Streaming demand/supply counters per pickup cell and the surge multiplier
+    derived from them.
+
+    Ride requests are counted over a sliding window
+    (PRICING_DEMAND_WINDOW_SECONDS); cab supply is the number of available cabs
+    currently in the cell. Both are updated per event in O(1), so reading a
+    surge multiplier never runs a COUNT query:
+
+        surge = 1 + PRICING_SURGE_STEP * (requests / max(cabs, 1) - PRICING_SURGE_THRESHOLD)
+
+    clamped to [1.0, PRICING_SURGE_MAX].
+
+    Requests are recorded by the web process and read by Celery workers, so
+    outside DEBUG and tests the counters live in Redis (PRICING_DEMAND_BACKEND)
+    and a Redis outage is an error rather than a silent per-process fallback.
+    The memory backend seeds its supply from the database when created and
+    rebuilds it every PRICING_SUPPLY_RESYNC_SECONDS, since beat resyncs only
+    reach the worker's copy.
+    """
+
+    def __init__(self, backend=None):
+        self._backend = backend
+        self._lock = threading.Lock()
+        self._supply_synced_at = None
+
+    @property
+    def backend(self):
+        if self._backend is None:
+            with self._lock:
+                if self._backend is None:
+                    self._backend = self._default_backend()
+        return self._backend
+
+    @staticmethod
+    def _default_backend():
+        window = getattr(settings, 'PRICING_DEMAND_WINDOW_SECONDS', 300)
+        buckets = getattr(settings, 'PRICING_DEMAND_BUCKETS', 30)
+        if getattr(settings, 'PRICING_DEMAND_BACKEND', 'memory') == 'redis':
+            try:
+                from django_redis import get_redis_connection
+                client = get_redis_connection('default')
+                client.ping()
+            except Exception as e:
+                raise ImproperlyConfigured(f"PRICING_DEMAND_BACKEND is 'redis' but Redis is unavailable: {e}")
+            return RedisDemandBackend(client, window, buckets)
+        return MemoryDemandBackend(window, buckets)
+
+    def _refresh_local_supply(self):
+        """Seeds and periodically rebuilds the supply of a process-local backend."""
+        if not isinstance(self.backend, MemoryDemandBackend):
+            return
+        interval = getattr(settings, 'PRICING_SUPPLY_RESYNC_SECONDS', 60)
+        if self._supply_synced_at is not None and time.monotonic() - self._supply_synced_at < interval:
+            return
+        self._supply_synced_at = time.monotonic()
+        try:
+            self.resync_supply()
+        except Exception as e:
+            logger.warning(f"Failed to seed cab supply: {e}")
+
+    def record_request(self, lat, lng):
+        try:
+            self.backend.add_request(demand_cell(lat, lng))
+        except Exception as e:
+            # Demand tracking must never fail a ride request
+            logger.warning(f"Failed to record demand: {e}")
+
+    def sync_cab(self, cab_id, status, lat, lng):
+        """Applies a cab status/position change to the per-cell supply."""
+        from apps.rides.models import Cab
+
+        available = status == Cab.Status.AVAILABLE and lat is not None and lng is not None
+        try:
+            self.backend.move_cab(cab_id, demand_cell(lat, lng) if available else None)
+        except Exception as e:
+            logger.warning(f"Failed to update cab supply for cab {cab_id}: {e}")
+
+    def remove_cab(self, cab_id):
+        try:
+            self.backend.move_cab(cab_id, None)
+        except Exception as e:
+            logger.warning(f"Failed to update cab supply for cab {cab_id}: {e}")
+
+    def move_cab(self, cab_id, lat, lng):
+        """Moves a cab counted as available to the cell of its latest ping; other cabs are ignored."""
+        try:
+            self.backend.relocate_cab(cab_id, demand_cell(lat, lng))
+        except Exception as e:
+            logger.warning(f"Failed to update cab supply for cab {cab_id}: {e}")
+
+    def resync_supply(self):
+        """
+        Rebuilds cab supply from the database, correcting drift from bulk
+        updates that bypass model signals.
+        """
+        from apps.rides.models import Cab
+
+        rows = Cab.objects.filter(
+            status=Cab.Status.AVAILABLE,
+            current_lat__isnull=False,
+            current_lng__isnull=False
+        ).values_list('id', 'current_lat', 'current_lng')
+        cab_cells = {cab_id: demand_cell(lat, lng) for cab_id, lat, lng in rows}
+        self.backend.reset_supply(cab_cells)
+        self._supply_synced_at = time.monotonic()
+        return len(cab_cells)
+
+    def surge_multiplier(self, lat, lng) -> float:
+        return self.surge_for_cell(demand_cell(lat, lng))
+
+    def surge_for_cell(self, cell: str) -> float:
+        try:
+            self._refresh_local_supply()
+            requests = self.backend.request_count(cell)
+            cabs = self.backend.supply_count(cell)
+        except Exception as e:
+            logger.warning(f"Failed to read demand for cell {cell}: {e}")
+            return 1.0
+
+        step = getattr(settings, 'PRICING_SURGE_STEP', 0.25)
+        threshold = getattr(settings, 'PRICING_SURGE_THRESHOLD', 1.0)
+        ceiling = getattr(settings, 'PRICING_SURGE_MAX', 2.0)
+        surge = 1.0 + step * (requests / max(cabs, 1) - threshold)
+        return round(min(max(surge, 1.0), ceiling), 2)
+
+    def surge_multipliers(self, points: Iterable) -> List[float]:
+        """Surge per (lat, lng), reading each distinct cell once."""
+        by_cell = {}
+        result = []
+        for lat, lng in points:
+            cell = demand_cell(lat, lng)
+            if cell not in by_cell:
+                by_cell[cell] = self.surge_for_cell(cell)
+            result.append(by_cell[cell])
+        return result
+
+
+demand_tracker = DemandTracker()
@@ -0,0 +1,66 @@
+import threading
+from typing import Callable, Dict, Hashable, Tuple
+
+from django.conf import settings
+
+from apps.core.lru import LRUCache
+
+
+def quantize(value: float, step: float) -> float:
+    """Rounds `value` to the nearest multiple of `step` (identity when step <= 0)."""
+    if step <= 0:
+        return float(value)
+    return round(round(float(value) / step) * step, 6)
+
+
+class QuoteCache:
+    """
+    Memoized fares keyed by bucketed pricing inputs.
+
+    Distance, surge and detour are quantized to PRICING_QUOTE_DISTANCE_BUCKET_KM,
+    PRICING_QUOTE_SURGE_BUCKET and PRICING_QUOTE_DETOUR_BUCKET_KM, and the fare is
+    computed on the bucketed values, so every rider that falls in a bucket gets
+    the same price whichever request filled the entry. Entries are evicted LRU
+    beyond PRICING_QUOTE_CACHE_SIZE.
+
+    The cache belongs to one fare configuration (base fare, rate per km, detour
+    penalty): a lookup with a different configuration drops every entry first.
+    """
+
+    def __init__(self, maxsize: int = None):
+        self._entries = LRUCache(maxsize=maxsize or getattr(settings, 'PRICING_QUOTE_CACHE_SIZE', 10000))
+        self._config = None
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def bucket(distance_km, passenger_count, demand_multiplier, detour_km) -> Tuple:
+        return (
+            quantize(distance_km, getattr(settings, 'PRICING_QUOTE_DISTANCE_BUCKET_KM', 0.1)),
+            int(passenger_count),
+            quantize(demand_multiplier, getattr(settings, 'PRICING_QUOTE_SURGE_BUCKET', 0.05)),
+            quantize(detour_km, getattr(settings, 'PRICING_QUOTE_DETOUR_BUCKET_KM', 0.1)),
+        )
+
+    def get_or_compute(self, config: Hashable, key: Tuple, compute: Callable[..., Dict]) -> Dict:
+        """Cached `compute(*key)` for the given fare configuration."""
+        if config != self._config:
+            with self._lock:
+                if config != self._config:
+                    self._entries.clear()
+                    self._config = config
+        quote = self._entries.get(key)
+        if quote is None:
+            quote = compute(*key)
+            self._entries.set(key, quote)
+        return dict(quote)
+
+    def invalidate(self):
+        with self._lock:
+            self._entries.clear()
+            self._config = None
+
+    def stats(self) -> Dict:
+        return self._entries.stats()
+
+
+quote_cache = QuoteCache()
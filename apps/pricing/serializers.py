@@ -0,0 +1,50 @@
+from rest_framework import serializers
+
+
+class QuoteInputSerializer(serializers.Serializer):
+    pool_ids = serializers.ListField(child=serializers.IntegerField(), required=False, max_length=500)
+    ride_ids = serializers.ListField(child=serializers.IntegerField(), required=False, max_length=5000)
+    # Omit to use the live surge of each pickup cell
+    demand_multiplier = serializers.FloatField(min_value=0.0, required=False, allow_null=True)
+
+    def validate(self, attrs):
+        if not attrs.get('pool_ids') and not attrs.get('ride_ids'):
+            raise serializers.ValidationError("Provide pool_ids or ride_ids.")
+        return attrs
+
+
+class FarePreviewInputSerializer(serializers.Serializer):
+    pickup_lat = serializers.DecimalField(max_digits=9, decimal_places=6)
+    pickup_lng = serializers.DecimalField(max_digits=9, decimal_places=6)
+    drop_lat = serializers.DecimalField(max_digits=9, decimal_places=6)
+    drop_lng = serializers.DecimalField(max_digits=9, decimal_places=6)
+    passenger_count = serializers.IntegerField(min_value=1, default=1)
+    # Omit to use the live surge of the pickup cell
+    demand_multiplier = serializers.FloatField(min_value=0.0, required=False, allow_null=True)
+
+
+class FarePreviewResponseSerializer(serializers.Serializer):
+    distance_km = serializers.FloatField()
+    demand_multiplier = serializers.FloatField()
+    final_price = serializers.FloatField()
+    base_individual_price = serializers.FloatField()
+    pooling_discount = serializers.FloatField()
+    detour_compensation = serializers.FloatField()
+    surge_amount = serializers.FloatField()
+
+
+class RideQuoteSerializer(serializers.Serializer):
+    ride_id = serializers.IntegerField()
+    pool_id = serializers.IntegerField(allow_null=True)
+    passenger_count = serializers.IntegerField()
+    distance_km = serializers.FloatField()
+    detour_km = serializers.FloatField()
+    final_price = serializers.FloatField()
+    base_individual_price = serializers.FloatField()
+    pooling_discount = serializers.FloatField()
+    detour_compensation = serializers.FloatField()
+    surge_amount = serializers.FloatField()
+
+
+class QuoteResponseSerializer(serializers.Serializer):
+    quotes = RideQuoteSerializer(many=True)
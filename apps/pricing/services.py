@@ -1,5 +1,16 @@
 import logging
-from typing import Dict
+from typing import Dict, Iterable, List
+
+import numpy as np
+from django.conf import settings
+
+from apps.pooling.geo import haversine_pairs, to_coord_arrays
+from apps.pooling.models import PoolMember
+from apps.pooling.services import ROUTE_MEMBER_FIELDS, current_stops
+from apps.pricing.demand import demand_tracker
+from apps.pricing.quote_cache import quote_cache
+from apps.rides.locations import cab_locations
+from apps.rides.models import RideRequest
 
 logger = logging.getLogger(__name__)
 
@@ -11,13 +22,21 @@ class PricingEngine:
 
     def __init__(
         self, 
-        base_fare: float = 50.0, 
-        rate_per_km: float = 12.0,
-        detour_penalty_multiplier: float = 0.8  # Fraction of savings lost per km of detour
+        base_fare: float = None,
+        rate_per_km: float = None,
+        detour_penalty_multiplier: float = None  # Fraction of savings lost per km of detour
     ):
-        self.base_fare = base_fare
-        self.rate_per_km = rate_per_km
-        self.detour_penalty_multiplier = detour_penalty_multiplier
+        # Unset values come from PRICING_BASE_FARE / PRICING_RATE_PER_KM / PRICING_DETOUR_PENALTY
+        self.base_fare = base_fare if base_fare is not None else getattr(settings, 'PRICING_BASE_FARE', 50.0)
+        self.rate_per_km = rate_per_km if rate_per_km is not None else getattr(settings, 'PRICING_RATE_PER_KM', 12.0)
+        self.detour_penalty_multiplier = (
+            detour_penalty_multiplier if detour_penalty_multiplier is not None
+            else getattr(settings, 'PRICING_DETOUR_PENALTY', 0.8)
+        )
+
+    @property
+    def config(self):
+        return (self.base_fare, self.rate_per_km, self.detour_penalty_multiplier)
 
     def calculate_price(
         self, 
@@ -71,3 +90,128 @@ class PricingEngine:
             "detour_compensation": round(detour_compensation, 2),
             "surge_amount": round(surge_amount, 2)
         }
+
+    def quote(
+        self,
+        distance_km: float,
+        passenger_count: int,
+        demand_multiplier: float = 1.0,
+        detour_km: float = 0.0
+    ) -> Dict[str, float]:
+        """
+        calculate_price through the shared quote cache.
+
+        Inputs are bucketed (see apps.pricing.quote_cache) and the fare is that
+        of the bucket, so repeated previews for the same trip cost one dict
+        lookup. A change to this engine's fare configuration invalidates the cache.
+        """
+        key = quote_cache.bucket(distance_km, passenger_count, demand_multiplier, detour_km)
+        return quote_cache.get_or_compute(self.config, key, self.calculate_price)
+
+    def calculate_prices(
+        self,
+        distances_km,
+        passenger_counts,
+        demand_multipliers=1.0,
+        detour_kms=0.0
+    ) -> Dict[str, np.ndarray]:
+        """
+        Vectorized calculate_price: prices any number of riders in one call.
+
+        Inputs are array-likes of equal length (scalars are broadcast), with the
+        same meaning as in calculate_price. Returns a dict with the same keys,
+        each holding an array of fares in input order.
+        """
+        distances_km = np.asarray(distances_km, dtype=np.float64)
+        passenger_counts = np.asarray(passenger_counts)
+        demand_multipliers = np.asarray(demand_multipliers, dtype=np.float64)
+        detour_kms = np.asarray(detour_kms, dtype=np.float64)
+
+        individual_base_price = self.base_fare + distances_km * self.rate_per_km
+        surge_amount = individual_base_price * (demand_multipliers - 1.0)
+        total_before_discount = individual_base_price + surge_amount
+
+        # Same discount tiers as calculate_price: 1 -> 0%, 2 -> 25%, 3+ -> 40%
+        discount_percentage = np.select(
+            [passenger_counts == 2, passenger_counts >= 3], [0.25, 0.40], default=0.0
+        )
+        discount_amount = total_before_discount * discount_percentage
+        detour_compensation = detour_kms * self.rate_per_km * self.detour_penalty_multiplier
+
+        final_price = np.maximum(self.base_fare, total_before_discount - discount_amount - detour_compensation)
+
+        shape = np.broadcast(distances_km, passenger_counts, demand_multipliers, detour_kms).shape
+        return {
+            "final_price": np.broadcast_to(np.round(final_price, 2), shape),
+            "base_individual_price": np.broadcast_to(np.round(individual_base_price, 2), shape),
+            "pooling_discount": np.broadcast_to(np.round(discount_amount, 2), shape),
+            "detour_compensation": np.broadcast_to(np.round(detour_compensation, 2), shape),
+            "surge_amount": np.broadcast_to(np.round(surge_amount, 2), shape)
+        }
+
+    def quote_rides(self, ride_ids: Iterable[int], demand_multiplier=None) -> List[Dict]:
+        """
+        Fares for a list of rides, priced in a single calculate_prices call.
+
+        Pooled rides are priced on their pool's current route (shared with the
+        route cache, see apps.pooling.services.current_stops): passenger count
+        is the pool size and detour is the ride distance along the route minus
+        the direct distance. Unpooled rides are priced as solo trips.
+        `demand_multiplier` is a scalar or one surge factor per ride id; when
+        omitted, each ride gets the live surge of its pickup cell from the
+        demand tracker (constant time per cell, no COUNT queries).
+        Two queries regardless of the number of rides or pools.
+        """
+        ride_ids = list(ride_ids)
+        rides = RideRequest.objects.in_bulk(ride_ids)
+        ride_ids = [ride_id for ride_id in ride_ids if ride_id in rides]
+        if not ride_ids:
+            return []
+
+        # Every member of every pool holding one of the rides, in one query
+        pools = {}
+        for row in PoolMember.objects.filter(
+            pool__members__ride_request_id__in=ride_ids
+        ).values(*ROUTE_MEMBER_FIELDS, 'pool__cab_id', 'pool__cab__current_lat', 'pool__cab__current_lng').distinct():
+            pools.setdefault(row['pool_id'], []).append(row)
+        live_positions = cab_locations.positions({rows[0]['pool__cab_id'] for rows in pools.values()})
+
+        pool_of, route_km = {}, {}
+        for pool_id, rows in pools.items():
+            for row in rows:
+                pool_of[row['ride_request_id']] = pool_id
+            cab_lat, cab_lng = live_positions.get(
+                rows[0]['pool__cab_id'], (rows[0]['pool__cab__current_lat'], rows[0]['pool__cab__current_lng'])
+            )
+            if cab_lat is None or cab_lng is None:
+                continue
+            stops = current_stops(pool_id, float(cab_lat), float(cab_lng), rows)
+            lats, lngs = to_coord_arrays([(cab_lat, cab_lng)] + [stop['coords'] for stop in stops])
+            at_point = np.concatenate(([0.0], np.cumsum(haversine_pairs(lats[:-1], lngs[:-1], lats[1:], lngs[1:]))))
+            position = {(stop['type'], stop['id']): idx + 1 for idx, stop in enumerate(stops)}
+            for row in rows:
+                ride_id = row['ride_request_id']
+                route_km[ride_id] = at_point[position[('DROP', ride_id)]] - at_point[position[('PICKUP', ride_id)]]
+
+        pickup_lats, pickup_lngs = to_coord_arrays((rides[rid].pickup_lat, rides[rid].pickup_lng) for rid in ride_ids)
+        drop_lats, drop_lngs = to_coord_arrays((rides[rid].drop_lat, rides[rid].drop_lng) for rid in ride_ids)
+        distances = haversine_pairs(pickup_lats, pickup_lngs, drop_lats, drop_lngs)
+        passenger_counts = np.array([
+            len(pools[pool_of[rid]]) if rid in pool_of else 1 for rid in ride_ids
+        ])
+        detours = np.maximum(np.array([route_km.get(rid, 0.0) for rid in ride_ids]) - distances, 0.0)
+
+        if demand_multiplier is None:
+            demand_multiplier = demand_tracker.surge_multipliers(
+                (rides[rid].pickup_lat, rides[rid].pickup_lng) for rid in ride_ids
+            )
+
+        prices = self.calculate_prices(distances, passenger_counts, demand_multiplier, detours)
+        return [{
+            "ride_id": ride_id,
+            "pool_id": pool_of.get(ride_id),
+            "passenger_count": int(passenger_counts[idx]),
+            "distance_km": round(float(distances[idx]), 2),
+            "detour_km": round(float(detours[idx]), 2),
+            **{key: float(values[idx]) for key, values in prices.items()}
+        } for idx, ride_id in enumerate(ride_ids)]
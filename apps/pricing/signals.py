@@ -0,0 +1,26 @@
+from django.db import transaction
+from django.core.signals import setting_changed
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+
+from apps.rides.models import Cab
+from apps.pricing.demand import demand_tracker
+from apps.pricing.quote_cache import quote_cache
+
+
+@receiver(post_save, sender=Cab)
+def sync_cab_supply_on_save(sender, instance, **kwargs):
+    cab_id, status, lat, lng = instance.id, instance.status, instance.current_lat, instance.current_lng
+    transaction.on_commit(lambda: demand_tracker.sync_cab(cab_id, status, lat, lng))
+
+
+@receiver(post_delete, sender=Cab)
+def remove_cab_supply(sender, instance, **kwargs):
+    cab_id = instance.id
+    transaction.on_commit(lambda: demand_tracker.remove_cab(cab_id))
+
+
+@receiver(setting_changed)
+def invalidate_quotes_on_setting_change(sender, setting, **kwargs):
+    if setting.startswith('PRICING_'):
+        quote_cache.invalidate()
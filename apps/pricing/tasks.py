@@ -0,0 +1,15 @@
+from celery import shared_task
+import logging
+from .demand import demand_tracker
+
+logger = logging.getLogger(__name__)
+
+@shared_task
+def resync_demand_supply_task():
+    """
+    Periodic correction of the per-cell cab supply (see CELERY_BEAT_SCHEDULE)
+    for cab updates that bypassed model signals.
+    """
+    cabs = demand_tracker.resync_supply()
+    logger.info(f"resync_demand_supply_task completed. {cabs} available cabs tracked")
+    return cabs
@@ -0,0 +1,69 @@
+from decimal import Decimal
+from unittest import mock
+
+from django.core.exceptions import ImproperlyConfigured
+from django.test import TestCase, override_settings
+
+from apps.pricing.demand import DemandTracker, MemoryDemandBackend, demand_cell
+from apps.rides.models import Cab
+
+AIRPORT = (Decimal('12.949000'), Decimal('77.668000'))
+CITY = (Decimal('12.971600'), Decimal('77.594600'))
+
+
+class DemandTrackerTests(TestCase):
+
+    def setUp(self):
+        self.tracker = DemandTracker(MemoryDemandBackend(window_seconds=300, buckets=30))
+
+    def create_cabs(self, count, lat, lng):
+        for idx in range(count):
+            Cab.objects.create(driver_name=f"Driver {idx}", current_lat=lat, current_lng=lng)
+
+    def test_local_supply_is_seeded_from_the_database(self):
+        # Cabs that exist before this process ever saw a Cab signal
+        self.create_cabs(20, *AIRPORT)
+        self.tracker = DemandTracker(MemoryDemandBackend(window_seconds=300, buckets=30))
+        for _ in range(5):
+            self.tracker.record_request(*AIRPORT)
+
+        self.assertEqual(self.tracker.surge_multiplier(*AIRPORT), 1.0)
+        self.assertEqual(self.tracker.backend.supply_count(demand_cell(*AIRPORT)), 20)
+
+    def test_surge_rises_with_demand_over_supply(self):
+        self.create_cabs(2, *AIRPORT)
+        for _ in range(6):
+            self.tracker.record_request(*AIRPORT)
+
+        # 1 + 0.25 * (6 / 2 - 1)
+        self.assertEqual(self.tracker.surge_multiplier(*AIRPORT), 1.5)
+
+    @override_settings(PRICING_SUPPLY_RESYNC_SECONDS=0)
+    def test_local_supply_is_refreshed_periodically(self):
+        self.assertEqual(self.tracker.surge_multiplier(*AIRPORT), 1.0)
+        # Queryset writes bypass the supply signals
+        Cab.objects.bulk_create([
+            Cab(driver_name=f"Bulk {idx}", current_lat=AIRPORT[0], current_lng=AIRPORT[1]) for idx in range(3)
+        ])
+
+        self.tracker.surge_multiplier(*AIRPORT)
+        self.assertEqual(self.tracker.backend.supply_count(demand_cell(*AIRPORT)), 3)
+
+    def test_pings_move_available_cabs_between_cells(self):
+        self.create_cabs(1, *AIRPORT)
+        self.tracker.resync_supply()
+        cab_id = Cab.objects.get().id
+
+        self.tracker.move_cab(cab_id, *CITY)
+        self.assertEqual(self.tracker.backend.supply_count(demand_cell(*AIRPORT)), 0)
+        self.assertEqual(self.tracker.backend.supply_count(demand_cell(*CITY)), 1)
+
+        # Cabs not counted as available stay out of the supply
+        self.tracker.move_cab(cab_id + 1, *AIRPORT)
+        self.assertEqual(self.tracker.backend.supply_count(demand_cell(*AIRPORT)), 0)
+
+    @override_settings(PRICING_DEMAND_BACKEND='redis')
+    def test_redis_backend_does_not_fall_back_to_local_counters(self):
+        with mock.patch('django_redis.get_redis_connection', side_effect=ConnectionError("refused")):
+            with self.assertRaises(ImproperlyConfigured):
+                DemandTracker().backend
@@ -0,0 +1,128 @@
+from decimal import Decimal
+from unittest import mock
+
+from django.test import TestCase
+from rest_framework.test import APIClient
+
+from apps.pooling.geo import haversine
+from apps.pooling.models import Pool, PoolMember
+from apps.pricing.demand import demand_tracker
+from apps.pricing.quote_cache import quote_cache
+from apps.pricing.services import PricingEngine
+from apps.rides.models import Cab, RideRequest
+from apps.users.models import User
+
+AIRPORT = (Decimal('12.949000'), Decimal('77.668000'))
+CITY = (Decimal('12.971600'), Decimal('77.594600'))
+SUBURB = (Decimal('13.035000'), Decimal('77.597000'))
+
+
+class QuoteEndpointTests(TestCase):
+
+    def setUp(self):
+        self.client = APIClient()
+        user = User.objects.create(name="Rider", phone="+910000000000")
+        cab = Cab.objects.create(driver_name="Driver", current_lat=AIRPORT[0], current_lng=AIRPORT[1])
+        self.pool = Pool.objects.create(cab=cab)
+
+        def ride(drop):
+            return RideRequest.objects.create(
+                user=user, pickup_lat=AIRPORT[0], pickup_lng=AIRPORT[1], drop_lat=drop[0], drop_lng=drop[1]
+            )
+
+        self.pooled = [ride(CITY), ride(SUBURB)]
+        for order, pooled in enumerate(self.pooled, start=1):
+            PoolMember.objects.create(pool=self.pool, ride_request=pooled, sequence_order=order)
+        self.solo = ride(CITY)
+
+    def post(self, payload):
+        return self.client.post('/api/pricing/quote/', payload, format='json')
+
+    def test_pools_and_rides_are_quoted_in_one_batch(self):
+        response = self.post({'pool_ids': [self.pool.id], 'ride_ids': [self.solo.id, 0], 'demand_multiplier': 1.0})
+
+        self.assertEqual(response.status_code, 200)
+        quotes = {quote['ride_id']: quote for quote in response.json()['quotes']}
+        # Unknown rides are left out, pool members are added
+        self.assertEqual(set(quotes), {self.solo.id} | {ride.id for ride in self.pooled})
+        self.assertEqual(quotes[self.solo.id]['pool_id'], None)
+        self.assertEqual(quotes[self.solo.id]['passenger_count'], 1)
+        self.assertEqual(quotes[self.solo.id]['detour_km'], 0.0)
+        for ride in self.pooled:
+            self.assertEqual(quotes[ride.id]['pool_id'], self.pool.id)
+            self.assertEqual(quotes[ride.id]['passenger_count'], 2)
+
+        # The batch prices agree with the scalar formula
+        engine = PricingEngine()
+        for ride in [self.solo] + self.pooled:
+            quote = quotes[ride.id]
+            distance = haversine(ride.pickup_lat, ride.pickup_lng, ride.drop_lat, ride.drop_lng)
+            self.assertAlmostEqual(quote['distance_km'], distance, places=2)
+            expected = engine.calculate_price(distance, quote['passenger_count'], 1.0, quote['detour_km'])
+            self.assertAlmostEqual(quote['final_price'], expected['final_price'], delta=0.1)
+
+    def test_rides_listed_twice_are_quoted_once(self):
+        response = self.post({'pool_ids': [self.pool.id], 'ride_ids': [self.pooled[0].id], 'demand_multiplier': 1.0})
+        ride_ids = [quote['ride_id'] for quote in response.json()['quotes']]
+        self.assertEqual(sorted(ride_ids), sorted(ride.id for ride in self.pooled))
+
+    def test_live_surge_is_used_when_no_multiplier_is_given(self):
+        with mock.patch.object(demand_tracker, 'surge_multipliers', return_value=[1.5]) as surge:
+            response = self.post({'ride_ids': [self.solo.id]})
+
+        surge.assert_called_once()
+        quote = response.json()['quotes'][0]
+        self.assertAlmostEqual(quote['surge_amount'], quote['base_individual_price'] * 0.5, delta=0.01)
+
+    def test_rejects_empty_requests(self):
+        self.assertEqual(self.post({}).status_code, 400)
+        self.assertEqual(self.post({'ride_ids': [], 'pool_ids': []}).status_code, 400)
+        self.assertEqual(self.post({'ride_ids': [self.solo.id], 'demand_multiplier': -1}).status_code, 400)
+
+
+class FarePreviewEndpointTests(TestCase):
+
+    def setUp(self):
+        self.client = APIClient()
+        quote_cache.invalidate()
+
+    def post(self, pickup, drop, **extra):
+        return self.client.post('/api/pricing/preview/', {
+            'pickup_lat': str(pickup[0]), 'pickup_lng': str(pickup[1]),
+            'drop_lat': str(drop[0]), 'drop_lng': str(drop[1]), **extra
+        }, format='json')
+
+    def test_previews_price_the_bucketed_trip(self):
+        response = self.post(AIRPORT, CITY, passenger_count=2, demand_multiplier=1.0)
+
+        self.assertEqual(response.status_code, 200)
+        preview = response.json()
+        distance = haversine(*AIRPORT, *CITY)
+        self.assertAlmostEqual(preview['distance_km'], distance, places=2)
+        # Priced on the 0.1 km distance bucket
+        expected = PricingEngine().calculate_price(round(distance, 1), 2, 1.0)
+        self.assertEqual({key: preview[key] for key in expected}, expected)
+
+    def test_nearby_trips_share_a_cached_quote(self):
+        before = quote_cache.stats()
+        first = self.post(AIRPORT, CITY, demand_multiplier=1.0).json()
+        # ~40 m shorter, still in the same 0.1 km distance bucket
+        second = self.post(AIRPORT, (CITY[0], CITY[1] + Decimal('0.000400')), demand_multiplier=1.0).json()
+
+        self.assertNotEqual(first['distance_km'], second['distance_km'])
+        self.assertEqual(first['final_price'], second['final_price'])
+        after = quote_cache.stats()
+        self.assertEqual((after['hits'] - before['hits'], after['misses'] - before['misses']), (1, 1))
+
+    def test_live_surge_of_the_pickup_cell(self):
+        with mock.patch.object(demand_tracker, 'surge_multiplier', return_value=1.5) as surge:
+            preview = self.post(AIRPORT, CITY).json()
+
+        surge.assert_called_once_with(AIRPORT[0], AIRPORT[1])
+        self.assertEqual(preview['demand_multiplier'], 1.5)
+        self.assertGreater(preview['surge_amount'], 0)
+
+    def test_rejects_invalid_trips(self):
+        response = self.client.post('/api/pricing/preview/', {'pickup_lat': '12.9'}, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(self.post(AIRPORT, CITY, passenger_count=0).status_code, 400)
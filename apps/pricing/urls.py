@@ -1,3 +1,7 @@
 from django.urls import path
+from .views import fare_preview, quote
 
-urlpatterns = []
+urlpatterns = [
+    path('quote/', quote, name='pricing_quote'),
+    path('preview/', fare_preview, name='pricing_fare_preview'),
+]
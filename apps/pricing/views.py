@@ -0,0 +1,63 @@
+from rest_framework import status
+from rest_framework.decorators import api_view, permission_classes
+from rest_framework.permissions import AllowAny
+from rest_framework.response import Response
+from drf_yasg.utils import swagger_auto_schema
+from apps.pooling.geo import haversine
+from apps.pooling.models import PoolMember
+from .demand import demand_tracker
+from .serializers import (
+    FarePreviewInputSerializer, FarePreviewResponseSerializer, QuoteInputSerializer, QuoteResponseSerializer
+)
+from .services import PricingEngine
+
+@swagger_auto_schema(
+    method='post',
+    request_body=QuoteInputSerializer,
+    responses={200: QuoteResponseSerializer, 400: 'Bad Request'},
+    operation_description="Quote fares for every member of the given pools and/or the given rides in one call."
+)
+@api_view(['POST'])
+@permission_classes([AllowAny])
+def quote(request):
+    serializer = QuoteInputSerializer(data=request.data)
+    if not serializer.is_valid():
+        return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+    data = serializer.validated_data
+    engine = PricingEngine()
+
+    # Pool members and explicit rides are priced together in one batch
+    ride_ids = list(data.get('ride_ids', []))
+    if data.get('pool_ids'):
+        ride_ids += PoolMember.objects.filter(
+            pool_id__in=data['pool_ids']
+        ).exclude(ride_request_id__in=ride_ids).values_list('ride_request_id', flat=True)
+
+    return Response({"quotes": engine.quote_rides(ride_ids, data.get('demand_multiplier'))})
+
+@swagger_auto_schema(
+    method='post',
+    request_body=FarePreviewInputSerializer,
+    responses={200: FarePreviewResponseSerializer, 400: 'Bad Request'},
+    operation_description="Preview the fare of a trip before requesting it (served from the quote cache)."
+)
+@api_view(['POST'])
+@permission_classes([AllowAny])
+def fare_preview(request):
+    serializer = FarePreviewInputSerializer(data=request.data)
+    if not serializer.is_valid():
+        return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+    data = serializer.validated_data
+    distance_km = haversine(data['pickup_lat'], data['pickup_lng'], data['drop_lat'], data['drop_lng'])
+    demand_multiplier = data.get('demand_multiplier')
+    if demand_multiplier is None:
+        demand_multiplier = demand_tracker.surge_multiplier(data['pickup_lat'], data['pickup_lng'])
+
+    fare = PricingEngine().quote(distance_km, data['passenger_count'], demand_multiplier)
+    return Response({
+        "distance_km": round(distance_km, 2),
+        "demand_multiplier": demand_multiplier,
+        **fare
+    })
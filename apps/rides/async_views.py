@@ -0,0 +1,88 @@
+"""
+Async variants of the ride request and pool status endpoints, for serving
+under ASGI (config/asgi.py). A request parks on the event loop while it
+waits for the database or the broker instead of holding a worker thread,
+so a few processes can keep thousands of connections open during a burst.
+
+DRF function views are sync only, so these are plain Django async views
+returning the same payloads as their counterparts in views.py; pool status
+is rendered with DRF's JSONRenderer so both produce identical JSON.
+"""
+import json
+import logging
+
+from asgiref.sync import sync_to_async
+from django.http import HttpResponse, JsonResponse
+from rest_framework.renderers import JSONRenderer
+
+from apps.core.entity_cache import user_cache
+from apps.pooling.status import ride_status_cache
+from apps.pricing.demand import demand_tracker
+from .ingest import ride_ingest_buffer
+from .models import RideRequest
+from .serializers import RequestRideInputSerializer
+from .tasks import match_pool_task
+
+logger = logging.getLogger(__name__)
+
+
+def _csrf_exempt(view):
+    # django.views.decorators.csrf.csrf_exempt wraps async views in a sync
+    # function before Django 5.0, so mark the coroutine function directly
+    view.csrf_exempt = True
+    return view
+
+
+def _start_pooling(ride_request_id, pickup_lat, pickup_lng):
+    demand_tracker.record_request(pickup_lat, pickup_lng)
+    match_pool_task.delay(ride_request_id)
+
+
+def _drf_json_response(data, status=200):
+    # Same encoder and settings as the DRF views (e.g. datetimes keep
+    # microseconds, where JsonResponse truncates them to milliseconds)
+    return HttpResponse(JSONRenderer().render(data), content_type='application/json', status=status)
+
+
+# Broker publish (and Redis demand counters) run in the thread pool, off the event loop
+_start_pooling_async = sync_to_async(_start_pooling, thread_sensitive=False)
+
+
+@_csrf_exempt
+async def request_ride_async(request):
+    if request.method != 'POST':
+        return JsonResponse({"error": "Method not allowed"}, status=405)
+    try:
+        payload = json.loads(request.body or b'{}')
+    except ValueError:
+        return JsonResponse({"error": "Malformed JSON"}, status=400)
+
+    serializer = RequestRideInputSerializer(data=payload)
+    if not serializer.is_valid():
+        return JsonResponse(serializer.errors, status=400)
+
+    data = serializer.validated_data
+    user = await user_cache.aget(data.pop('user_id'))
+    if user is None:
+        return JsonResponse({"error": "User not found"}, status=404)
+
+    ride_request = await RideRequest.objects.acreate(user=user, **data)
+    await _start_pooling_async(ride_request.id, ride_request.pickup_lat, ride_request.pickup_lng)
+
+    return JsonResponse({
+        "request_id": ride_request.id,
+        "status": "Ride request received and pooling started."
+    }, status=201)
+
+
+async def pool_status_async(request, ride_id):
+    if request.method != 'GET':
+        return JsonResponse({"error": "Method not allowed"}, status=405)
+
+    payload = await ride_status_cache.aget_or_build(ride_id)
+    if payload is None:
+        queued_state = await ride_ingest_buffer.aqueued_state(ride_id)
+        if queued_state is not None:
+            return _drf_json_response({"request_id": ride_id, "status": queued_state}, status=202)
+        return _drf_json_response({"error": "Ride request not found"}, status=404)
+    return _drf_json_response(payload)
@@ -0,0 +1,79 @@
+import logging
+from typing import Dict, Iterable
+
+from django.conf import settings
+from django.core.cache import cache
+from django.utils import timezone
+
+from apps.pooling.status import ride_status_cache
+from .ingest import QUEUED_CANCELLED, ride_ingest_buffer
+from .models import RideRequest
+
+logger = logging.getLogger(__name__)
+
+CANCELLED = 'cancelled'
+ALREADY_CANCELLED = 'already_cancelled'
+NOT_FOUND = 'not_found'
+
+APPLY_FLAG_KEY = "rides:cancellations_scheduled"
+APPLY_LOCK_KEY = "rides:cancellations_running"
+
+
+def request_cancellations(ride_ids: Iterable[int]) -> Dict[int, str]:
+    """
+    Cancels rides and queues their removal from pools.
+
+    The rides are marked cancelled at once with a single UPDATE, so clients
+    and the matching engine see the new status immediately. The cancelled
+    rides that still hold a pool membership are the queue itself: one
+    coalesced apply_cancellations_task per RIDES_CANCEL_WINDOW_SECONDS removes
+    all of them set-wise and resyncs each affected pool once (see
+    apps.pooling.services.release_cancelled_rides).
+
+    Rides accepted by write-behind ingestion but not drained yet are
+    cancelled in the buffer and inserted cancelled (see RideIngestBuffer).
+
+    Returns an outcome per ride id: 'cancelled', 'already_cancelled' or 'not_found'.
+    """
+    ride_ids = list(dict.fromkeys(ride_ids))
+    # Mark queued rides before reading the table, so any ride drained after
+    # the read below still sees the mark
+    queued = ride_ingest_buffer.cancel_queued(ride_ids) if ride_ingest_buffer.enabled else {}
+    statuses = dict(RideRequest.objects.filter(id__in=ride_ids).values_list('id', 'status'))
+    to_cancel = [ride_id for ride_id, status in statuses.items() if status != RideRequest.Status.CANCELLED]
+
+    if to_cancel:
+        RideRequest.objects.filter(id__in=to_cancel).exclude(
+            status=RideRequest.Status.CANCELLED
+        ).update(status=RideRequest.Status.CANCELLED, updated_at=timezone.now())
+        ride_status_cache.invalidate(to_cancel)
+        schedule_cancellations()
+
+    outcomes = {}
+    for ride_id in ride_ids:
+        if ride_id not in statuses:
+            if ride_id not in queued:
+                outcomes[ride_id] = NOT_FOUND
+            elif queued[ride_id] == QUEUED_CANCELLED:
+                outcomes[ride_id] = ALREADY_CANCELLED
+            else:
+                outcomes[ride_id] = CANCELLED
+        elif statuses[ride_id] == RideRequest.Status.CANCELLED:
+            outcomes[ride_id] = ALREADY_CANCELLED
+        else:
+            outcomes[ride_id] = CANCELLED
+    return outcomes
+
+
+def schedule_cancellations():
+    """
+    Coalesces cancellations into one apply run per window, the same way
+    trigger_matching coalesces matching: only the first caller of a window
+    enqueues the task.
+    """
+    from .tasks import apply_cancellations_task
+
+    window = settings.RIDES_CANCEL_WINDOW_SECONDS
+    # The TTL is a safety net in case the scheduled task is lost
+    if cache.add(APPLY_FLAG_KEY, 1, timeout=window + 60):
+        apply_cancellations_task.apply_async(countdown=window)
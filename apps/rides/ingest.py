@@ -0,0 +1,377 @@
+import fcntl
+import json
+import logging
+import os
+import threading
+from collections import deque
+from decimal import Decimal
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection, transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from apps.core.entity_cache import user_cache
+from .models import RideRequest
+
+logger = logging.getLogger(__name__)
+
+# RideRequest fields carried by a stream entry besides its id
+STREAM_FIELDS = (
+    'user_id', 'pickup_lat', 'pickup_lng', 'drop_lat', 'drop_lng',
+    'seats_required', 'luggage_units', 'detour_tolerance_minutes',
+)
+DECIMAL_FIELDS = ('pickup_lat', 'pickup_lng', 'drop_lat', 'drop_lng')
+
+# States of a submitted ride that has not been drained yet
+QUEUED = 'queued'
+QUEUED_CANCELLED = 'cancelled'
+
+
+class RideIdSequence:
+    """
+    RideRequest ids for write-behind ingestion, handed out from blocks
+    reserved in the database's own id sequence.
+
+    Reserving a block is one statement per RIDES_WRITE_BEHIND_ID_BLOCK ids,
+    so the request path almost never touches the database, while ids stay
+    unique across processes and never collide with rows inserted directly
+    (dashboard, bulk endpoint, sync path).
+    """
+
+    SUPPORTED_VENDORS = ('postgresql', 'sqlite')
+
+    def __init__(self, block_size: int = None):
+        self.block_size = block_size or getattr(settings, 'RIDES_WRITE_BEHIND_ID_BLOCK', 1000)
+        self._ids = deque()
+        self._lock = threading.Lock()
+
+    def next_id(self) -> int:
+        with self._lock:
+            if not self._ids:
+                self._ids.extend(self._reserve_block(self.block_size))
+            return self._ids.popleft()
+
+    @classmethod
+    def supported(cls) -> bool:
+        return connection.vendor in cls.SUPPORTED_VENDORS
+
+    @staticmethod
+    def _reserve_block(size: int) -> List[int]:
+        table = RideRequest._meta.db_table
+        with transaction.atomic(), connection.cursor() as cursor:
+            if connection.vendor == 'postgresql':
+                cursor.execute(
+                    "SELECT nextval(pg_get_serial_sequence(%s, 'id')) FROM generate_series(1, %s)", [table, size]
+                )
+                return [row[0] for row in cursor.fetchall()]
+            if connection.vendor == 'sqlite':
+                # AUTOINCREMENT tables keep their high-water mark in sqlite_sequence
+                cursor.execute(
+                    "INSERT INTO sqlite_sequence (name, seq) SELECT %s, 0 "
+                    "WHERE NOT EXISTS (SELECT 1 FROM sqlite_sequence WHERE name = %s)", [table, table]
+                )
+                cursor.execute("UPDATE sqlite_sequence SET seq = seq + %s WHERE name = %s", [size, table])
+                cursor.execute("SELECT seq FROM sqlite_sequence WHERE name = %s", [table])
+                end = cursor.fetchone()[0]
+                return list(range(end - size + 1, end + 1))
+        raise NotImplementedError(f"Write-behind id blocks are not supported on {connection.vendor}")
+
+
+def encode_entry(ride_id: int, data: Dict, requested_at=None) -> str:
+    entry = {'id': ride_id, **{field: str(data[field]) for field in STREAM_FIELDS}}
+    if requested_at is not None:
+        entry['requested_at'] = requested_at.isoformat()
+    return json.dumps(entry)
+
+
+def decode_entry(raw) -> RideRequest:
+    entry = json.loads(raw)
+    ride = RideRequest(
+        id=entry['id'],
+        **{field: Decimal(entry[field]) if field in DECIMAL_FIELDS else int(entry[field]) for field in STREAM_FIELDS}
+    )
+    # Entries written before requested_at was carried keep the insert time
+    if entry.get('requested_at'):
+        ride.created_at = parse_datetime(entry['requested_at'])
+    return ride
+
+
+class FileRideStream:
+    """
+    Local stand-in for a durable stream: an append-only file of JSON lines and
+    a sidecar file holding the consumer's committed byte offset. Appends are
+    single O_APPEND writes, so several processes on one host can share it.
+
+    Once the committed offset passes RIDES_WRITE_BEHIND_COMPACT_BYTES, ack()
+    rewrites the file without its consumed prefix. Appenders hold a shared
+    flock and compaction an exclusive one, so no append is lost to the swap.
+    """
+
+    def __init__(self, path, compact_bytes: int = None):
+        self.path = str(path)
+        self.offset_path = f"{self.path}.offset"
+        self.fsync = getattr(settings, 'RIDES_WRITE_BEHIND_FSYNC', False)
+        self.compact_bytes = compact_bytes or getattr(settings, 'RIDES_WRITE_BEHIND_COMPACT_BYTES', 1 << 20)
+
+    def append(self, payload: str):
+        while True:
+            fd = os.open(self.path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+            try:
+                fcntl.flock(fd, fcntl.LOCK_SH)
+                try:
+                    replaced = os.fstat(fd).st_ino != os.stat(self.path).st_ino
+                except FileNotFoundError:
+                    replaced = True
+                if replaced:
+                    # Compacted while we waited for the lock: append to the new file
+                    continue
+                os.write(fd, (payload + '\n').encode())
+                if self.fsync:
+                    os.fsync(fd)
+                return
+            finally:
+                os.close(fd)
+
+    def _committed_offset(self) -> int:
+        try:
+            with open(self.offset_path) as f:
+                return int(f.read().strip() or 0)
+        except FileNotFoundError:
+            return 0
+
+    def read(self, count: int) -> Tuple[List[str], int]:
+        """Up to `count` complete entries after the committed offset, and the offset past them."""
+        offset = self._committed_offset()
+        entries = []
+        try:
+            with open(self.path, 'rb') as f:
+                f.seek(offset)
+                while len(entries) < count:
+                    line = f.readline()
+                    if not line.endswith(b'\n'):
+                        # Nothing more, or an append still in progress
+                        break
+                    offset += len(line)
+                    entries.append(line.decode())
+        except FileNotFoundError:
+            pass
+        return entries, offset
+
+    def ack(self, position: int):
+        if position >= self.compact_bytes:
+            self._compact(position)
+        else:
+            self._commit_offset(position)
+
+    def _commit_offset(self, position: int):
+        tmp_path = f"{self.offset_path}.tmp"
+        with open(tmp_path, 'w') as f:
+            f.write(str(position))
+        os.replace(tmp_path, self.offset_path)
+
+    def _compact(self, position: int):
+        tmp_path = f"{self.path}.tmp"
+        with open(self.path, 'rb') as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            f.seek(position)
+            with open(tmp_path, 'wb') as tmp:
+                tmp.write(f.read())
+                tmp.flush()
+                os.fsync(tmp.fileno())
+            # Offset first: a crash before the swap replays the old file from
+            # the start, which drain() tolerates (ids are fixed, inserts skip conflicts)
+            self._commit_offset(0)
+            os.replace(tmp_path, self.path)
+
+
+class RedisRideStream:
+    """Redis stream with a consumer group; entries are acknowledged once inserted."""
+
+    def __init__(self, client, key: str = 'rides:ingest', group: str = 'ride-writers', consumer: str = 'drain'):
+        self.client = client
+        self.key = key
+        self.group = group
+        # Drains are serialized, so one stable consumer name lets a restarted
+        # drainer pick up the entries its predecessor never acknowledged
+        self.consumer = consumer
+        self._group_ready = False
+
+    def append(self, payload: str):
+        self.client.xadd(self.key, {'data': payload})
+
+    def _ensure_group(self):
+        if self._group_ready:
+            return
+        try:
+            self.client.xgroup_create(self.key, self.group, id='0', mkstream=True)
+        except Exception as e:
+            if 'BUSYGROUP' not in str(e):
+                raise
+        self._group_ready = True
+
+    def read(self, count: int) -> Tuple[List[str], List]:
+        self._ensure_group()
+        # Redeliver this consumer's unacknowledged entries first (crash recovery), then new ones
+        for start in ('0', '>'):
+            response = self.client.xreadgroup(self.group, self.consumer, {self.key: start}, count=count)
+            messages = response[0][1] if response else []
+            if messages:
+                return [fields[b'data'].decode() for _, fields in messages], [msg_id for msg_id, _ in messages]
+        return [], []
+
+    def ack(self, position: List):
+        if position:
+            pipe = self.client.pipeline()
+            pipe.xack(self.key, self.group, *position)
+            pipe.xdel(self.key, *position)
+            pipe.execute()
+
+
+class RideIngestBuffer:
+    """
+    Write-behind ingestion of ride requests (RIDES_WRITE_BEHIND).
+
+    The request path validates, takes an id from RideIdSequence and appends
+    the request to a durable stream (RIDES_WRITE_BEHIND_BACKEND: a Redis
+    stream, or a local append-only file), so its latency doesn't depend on
+    the database. drain() moves the stream into the database in chunks of
+    RIDES_WRITE_BEHIND_CHUNK with one bulk_create each and hands every chunk
+    straight to batch matching.
+
+    Ids are fixed before the insert, so replaying a chunk after a crash is
+    idempotent (conflicting rows are skipped). Rides keep the time they were
+    requested as created_at, not the time they were drained.
+
+    Until its chunk is drained, a ride has a marker in the shared cache:
+    pool_status reports it as queued, and cancelling it flips the marker so
+    drain() inserts the ride cancelled instead of matching it. Cancellation
+    writes the marker before reading the table and drain() reads markers
+    after inserting, so every cancel is seen by one side or the other.
+
+    Only active on databases RideIdSequence can reserve ids from (PostgreSQL,
+    SQLite); elsewhere request_ride keeps inserting directly.
+    """
+
+    def __init__(self, stream=None, sequence: RideIdSequence = None):
+        self._stream = stream
+        self.sequence = sequence or RideIdSequence()
+        self._lock = threading.Lock()
+        self._warned_unsupported = False
+
+    @property
+    def enabled(self) -> bool:
+        """Whether request_ride should buffer: RIDES_WRITE_BEHIND on a supported database."""
+        if not getattr(settings, 'RIDES_WRITE_BEHIND', False):
+            return False
+        if not RideIdSequence.supported():
+            if not self._warned_unsupported:
+                self._warned_unsupported = True
+                logger.warning(
+                    f"RIDES_WRITE_BEHIND is not supported on {connection.vendor}; inserting ride requests directly"
+                )
+            return False
+        return True
+
+    @property
+    def stream(self):
+        if self._stream is None:
+            with self._lock:
+                if self._stream is None:
+                    self._stream = self._default_stream()
+        return self._stream
+
+    @staticmethod
+    def _default_stream():
+        if getattr(settings, 'RIDES_WRITE_BEHIND_BACKEND', 'file') == 'redis':
+            from django_redis import get_redis_connection
+            return RedisRideStream(get_redis_connection('default'))
+        return FileRideStream(settings.RIDES_WRITE_BEHIND_PATH)
+
+    @staticmethod
+    def _marker_key(ride_id) -> str:
+        return f"rides:queued:{ride_id}"
+
+    def submit(self, data: Dict) -> int:
+        """Appends a validated request (RequestRideInputSerializer data) and returns its ride id."""
+        ride_id = self.sequence.next_id()
+        self.stream.append(encode_entry(ride_id, data, requested_at=timezone.now()))
+        cache.set(self._marker_key(ride_id), QUEUED, timeout=settings.RIDES_WRITE_BEHIND_QUEUED_TTL_SECONDS)
+        return ride_id
+
+    def queued_state(self, ride_id) -> Optional[str]:
+        """QUEUED or QUEUED_CANCELLED for a submitted ride not drained yet, else None."""
+        return cache.get(self._marker_key(ride_id))
+
+    async def aqueued_state(self, ride_id) -> Optional[str]:
+        return await cache.aget(self._marker_key(ride_id))
+
+    def cancel_queued(self, ride_ids: Iterable[int]) -> Dict[int, str]:
+        """
+        Marks the rides that are still queued as cancelled. Returns the state
+        each of them had before, keyed by ride id; other ids are omitted.
+        """
+        keys = {self._marker_key(ride_id): ride_id for ride_id in ride_ids}
+        states = cache.get_many(list(keys))
+        if states:
+            cache.set_many(
+                {key: QUEUED_CANCELLED for key in states}, timeout=settings.RIDES_WRITE_BEHIND_QUEUED_TTL_SECONDS
+            )
+        return {keys[key]: state for key, state in states.items()}
+
+    def _settle_markers(self, ride_ids: List[int]) -> List[int]:
+        """Drops the markers of inserted rides; returns the ones cancelled while queued."""
+        keys = {self._marker_key(ride_id): ride_id for ride_id in ride_ids}
+        states = cache.get_many(list(keys))
+        cache.delete_many(list(keys))
+        return [keys[key] for key, state in states.items() if state == QUEUED_CANCELLED]
+
+    def drain(self, max_chunks: int = None) -> Dict[str, int]:
+        """
+        Inserts buffered requests chunk by chunk and batch-matches each chunk.
+        Callers must not drain concurrently (see drain_ride_stream_task).
+        """
+        from apps.pooling.services import PoolingEngine
+
+        chunk_size = getattr(settings, 'RIDES_WRITE_BEHIND_CHUNK', 500)
+        results = {"inserted": 0, "dropped": 0, "cancelled": 0, "chunks": 0}
+        while max_chunks is None or results["chunks"] < max_chunks:
+            entries, position = self.stream.read(chunk_size)
+            if not entries:
+                break
+
+            rides = [decode_entry(raw) for raw in entries]
+            known_users = set(user_cache.get_many(ride.user_id for ride in rides))
+            valid = [ride for ride in rides if ride.user_id in known_users]
+            if len(valid) < len(rides):
+                dropped = [ride.id for ride in rides if ride.user_id not in known_users]
+                logger.warning(f"Dropping buffered ride requests with unknown users: {dropped}")
+
+            # bulk_create stamps created_at with the insert time; restore the request time
+            requested_at = {ride.id: ride.created_at for ride in valid if ride.created_at}
+            RideRequest.objects.bulk_create(valid, batch_size=500, ignore_conflicts=True)
+            stamped = [ride for ride in valid if ride.id in requested_at]
+            for ride in stamped:
+                ride.created_at = requested_at[ride.id]
+            if stamped:
+                RideRequest.objects.bulk_update(stamped, ['created_at'], batch_size=500)
+
+            cancelled = set(self._settle_markers([ride.id for ride in rides]))
+            if cancelled:
+                results["cancelled"] += RideRequest.objects.filter(id__in=cancelled).update(
+                    status=RideRequest.Status.CANCELLED, updated_at=timezone.now()
+                )
+            self.stream.ack(position)
+
+            to_match = [ride.id for ride in valid if ride.id not in cancelled]
+            if to_match:
+                PoolingEngine().process_request_batch(to_match)
+            results["inserted"] += len(valid)
+            results["dropped"] += len(rides) - len(valid)
+            results["chunks"] += 1
+        return results
+
+
+ride_ingest_buffer = RideIngestBuffer()
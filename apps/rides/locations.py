@@ -0,0 +1,213 @@
+import logging
+import threading
+import time
+from decimal import Decimal
+from typing import Dict, Iterable, Optional, Tuple
+
+from django.conf import settings
+from django.utils import timezone
+
+from .models import Cab
+
+logger = logging.getLogger(__name__)
+
+
+class MemoryLocationBackend:
+    """Process-local latest position per cab plus the set of cabs not yet persisted."""
+
+    def __init__(self):
+        self._positions: Dict[int, Tuple[float, float]] = {}
+        self._dirty = set()
+        self._lock = threading.Lock()
+
+    def update(self, cab_id: int, lat: float, lng: float):
+        with self._lock:
+            self._positions[cab_id] = (lat, lng)
+            self._dirty.add(cab_id)
+
+    def positions(self, cab_ids: Iterable[int]) -> Dict[int, Tuple[float, float]]:
+        positions = self._positions
+        return {cab_id: positions[cab_id] for cab_id in cab_ids if cab_id in positions}
+
+    def take_dirty(self) -> Dict[int, Tuple[float, float]]:
+        with self._lock:
+            dirty, self._dirty = self._dirty, set()
+            return {cab_id: self._positions[cab_id] for cab_id in dirty}
+
+    def mark_dirty(self, cab_ids: Iterable[int]):
+        with self._lock:
+            self._dirty.update(cab_ids)
+
+    def clear(self):
+        with self._lock:
+            self._positions.clear()
+            self._dirty.clear()
+
+
+class RedisLocationBackend:
+    """
+    Latest positions shared by all web processes: one hash of "lat,lng" per
+    cab and a set of cabs changed since the last flush. A ping is a single
+    pipelined HSET + SADD.
+    """
+
+    def __init__(self, client, prefix: str = 'cabs:location'):
+        self.client = client
+        self.prefix = prefix
+
+    def update(self, cab_id: int, lat: float, lng: float):
+        pipe = self.client.pipeline(transaction=False)
+        pipe.hset(self.prefix, cab_id, f"{lat},{lng}")
+        pipe.sadd(f"{self.prefix}:dirty", cab_id)
+        pipe.execute()
+
+    def positions(self, cab_ids: Iterable[int]) -> Dict[int, Tuple[float, float]]:
+        cab_ids = list(cab_ids)
+        if not cab_ids:
+            return {}
+        values = self.client.hmget(self.prefix, cab_ids)
+        return {
+            cab_id: tuple(map(float, value.decode().split(',')))
+            for cab_id, value in zip(cab_ids, values) if value is not None
+        }
+
+    def take_dirty(self) -> Dict[int, Tuple[float, float]]:
+        # Read and reset the dirty set atomically; a ping landing right after
+        # re-marks its cab for the next flush
+        pipe = self.client.pipeline()
+        pipe.smembers(f"{self.prefix}:dirty")
+        pipe.delete(f"{self.prefix}:dirty")
+        dirty, _ = pipe.execute()
+        return self.positions(int(cab_id) for cab_id in dirty)
+
+    def mark_dirty(self, cab_ids: Iterable[int]):
+        cab_ids = list(cab_ids)
+        if cab_ids:
+            self.client.sadd(f"{self.prefix}:dirty", *cab_ids)
+
+    def clear(self):
+        self.client.delete(self.prefix, f"{self.prefix}:dirty")
+
+
+class CabLocationStore:
+    """
+    Latest cab positions from driver pings (CAB_LOCATION_BACKEND: 'memory' or
+    'redis').
+
+    A ping is an O(1) store update plus a move in the available cab index and
+    the surge supply counts, so matching and pricing see it at once; the
+    pooling engine overlays these positions on the cab rows it loads (see
+    apply()). Positions reach the Cab table only in periodic flush() batches,
+    one bulk_update per CAB_LOCATION_FLUSH_BATCH cabs, never one UPDATE per
+    ping. The memory backend is flushed by a
+    background thread of the process receiving the pings; the Redis backend by
+    flush_cab_locations_task.
+
+    The memory backend is per process: Celery workers (and other web
+    processes) only see a ping once it has been flushed to the Cab table, up
+    to CAB_LOCATION_FLUSH_SECONDS later. Use the Redis backend whenever tasks
+    don't run eagerly in the web process (CELERY_TASK_ALWAYS_EAGER).
+    """
+
+    def __init__(self, backend=None):
+        self._backend = backend
+        self._lock = threading.Lock()
+        self._flusher: Optional[threading.Thread] = None
+
+    @property
+    def backend(self):
+        if self._backend is None:
+            with self._lock:
+                if self._backend is None:
+                    self._backend = self._default_backend()
+        return self._backend
+
+    @staticmethod
+    def _default_backend():
+        if getattr(settings, 'CAB_LOCATION_BACKEND', 'memory') == 'redis':
+            try:
+                from django_redis import get_redis_connection
+                return RedisLocationBackend(get_redis_connection('default'))
+            except Exception as e:
+                logger.warning(f"Redis location backend unavailable, using in-memory positions: {e}")
+        if not getattr(settings, 'CELERY_TASK_ALWAYS_EAGER', False):
+            logger.warning(
+                "Cab positions are kept in process memory: Celery workers see pings only after they are "
+                "flushed to the database. Set CAB_LOCATION_BACKEND=redis when workers run separately."
+            )
+        return MemoryLocationBackend()
+
+    def record(self, cab_id: int, lat: float, lng: float):
+        from apps.pooling.spatial import available_cab_index
+        from apps.pricing.demand import demand_tracker
+
+        lat, lng = float(lat), float(lng)
+        self.backend.update(cab_id, lat, lng)
+        available_cab_index.move_cab(cab_id, lat, lng)
+        demand_tracker.move_cab(cab_id, lat, lng)
+        if isinstance(self.backend, MemoryLocationBackend):
+            self._ensure_flusher()
+
+    def positions(self, cab_ids: Iterable[int]) -> Dict[int, Tuple[float, float]]:
+        try:
+            return self.backend.positions(cab_ids)
+        except Exception as e:
+            # Matching falls back to the persisted positions
+            logger.warning(f"Failed to read live cab positions: {e}")
+            return {}
+
+    def apply(self, cabs: Iterable[Cab]):
+        """Overwrites the (in-memory) positions of loaded Cab rows with their latest pings."""
+        cabs = [cab for cab in cabs if cab is not None]
+        latest = self.positions(cab.id for cab in cabs)
+        for cab in cabs:
+            position = latest.get(cab.id)
+            if position is not None:
+                cab.current_lat, cab.current_lng = position
+
+    def flush(self) -> int:
+        """Persists every position changed since the last flush. Returns the number of cabs written."""
+        dirty = self.backend.take_dirty()
+        if not dirty:
+            return 0
+        now = timezone.now()
+        cabs = [
+            Cab(id=cab_id, current_lat=Decimal(f"{lat:.6f}"), current_lng=Decimal(f"{lng:.6f}"), updated_at=now)
+            for cab_id, (lat, lng) in dirty.items()
+        ]
+        try:
+            Cab.objects.bulk_update(
+                cabs, ['current_lat', 'current_lng', 'updated_at'],
+                batch_size=getattr(settings, 'CAB_LOCATION_FLUSH_BATCH', 1000)
+            )
+        except Exception:
+            # Retried by the next flush with whatever position is latest by then
+            self.backend.mark_dirty(dirty)
+            raise
+        return len(cabs)
+
+    def _ensure_flusher(self):
+        if self._flusher is not None:
+            return
+        with self._lock:
+            if self._flusher is None:
+                self._flusher = threading.Thread(target=self._flush_loop, name='cab-location-flusher', daemon=True)
+                self._flusher.start()
+
+    def _flush_loop(self):
+        from django.db import close_old_connections
+
+        interval = getattr(settings, 'CAB_LOCATION_FLUSH_SECONDS', 5.0)
+        while True:
+            time.sleep(interval)
+            try:
+                flushed = self.flush()
+                if flushed:
+                    logger.debug(f"Flushed {flushed} cab positions")
+            except Exception as e:
+                logger.error(f"Cab position flush failed: {e}")
+            finally:
+                close_old_connections()
+
+
+cab_locations = CabLocationStore()
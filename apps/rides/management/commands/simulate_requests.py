@@ -5,17 +5,32 @@ from apps.users.models import User
 from apps.rides.models import RideRequest, Cab
 from apps.pooling.models import Pool, PoolMember
 from apps.pooling.services import PoolingEngine
+from apps.pooling.spatial import available_cab_index
 from django.db import transaction
 
 class Command(BaseCommand):
     help = 'Simulates a large number of ride requests and runs the pooling engine'
 
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch',
+            action='store_true',
+            help='Use the snapshot-based batch matcher instead of the per-request sweep'
+        )
+        parser.add_argument(
+            '--assignment',
+            choices=PoolingEngine.ASSIGNMENT_MODES,
+            default=None,
+            help='Cab assignment strategy for --batch (defaults to POOLING_ASSIGNMENT_MODE)'
+        )
+
     def handle(self, *args, **options):
         self.stdout.write("Starting simulation...")
         
-        # Cleanup
-        PoolMember.objects.all().delete()
-        Pool.objects.all().delete()
+        # Cleanup; the pools go too, so skip releasing their seats row by row
+        with Pool.usage_managed():
+            PoolMember.objects.all().delete()
+            Pool.objects.all().delete()
         RideRequest.objects.all().delete()
         
         # Ensure we have users and cabs
@@ -38,6 +53,8 @@ class Command(BaseCommand):
         else:
             # Reset cabs to available
             Cab.objects.all().update(status=Cab.Status.AVAILABLE)
+            # Queryset updates bypass model signals, so rebuild the cab index
+            available_cab_index.invalidate()
 
         count = 500
         lat_base, lng_base = 12.97, 77.59
@@ -64,8 +81,11 @@ class Command(BaseCommand):
         creation_latency = mid_time - start_time
         
         # Run Pooling Engine
-        engine = PoolingEngine()
-        results = engine.process_pending_requests()
+        engine = PoolingEngine(assignment_mode=options['assignment'])
+        if options['batch']:
+            results = engine.process_pending_batch()
+        else:
+            results = engine.process_pending_requests()
         
         end_time = time.perf_counter()
         total_latency = end_time - start_time
@@ -89,3 +109,5 @@ class Command(BaseCommand):
         self.stdout.write(f"Avg Price: ${avg_price:.2f}")
         self.stdout.write(f"Avg Detour: {avg_detour} min")
         self.stdout.write(f"Batch Processing Time: {end_time - mid_time:.2f}s")
+        if 'assignment_solve_ms' in results:
+            self.stdout.write(f"Assignment Solve Time: {results['assignment_solve_ms']:.1f}ms")
@@ -0,0 +1,38 @@
+# Generated by Django 4.2.30 on 2026-10-16 22:58
+
+from django.db import migrations, models
+
+from apps.pooling.spatial import zone_for
+
+
+def backfill_pickup_zone(apps, schema_editor):
+    RideRequest = apps.get_model('rides', 'RideRequest')
+    batch = []
+    for ride in RideRequest.objects.only('id', 'pickup_lat', 'pickup_lng').iterator(chunk_size=2000):
+        ride.pickup_zone = zone_for(ride.pickup_lat, ride.pickup_lng)
+        batch.append(ride)
+        if len(batch) >= 2000:
+            RideRequest.objects.bulk_update(batch, ['pickup_zone'], batch_size=500)
+            batch = []
+    if batch:
+        RideRequest.objects.bulk_update(batch, ['pickup_zone'], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('rides', '0002_cab'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='riderequest',
+            name='pickup_zone',
+            field=models.CharField(blank=True, default='', editable=False, max_length=32),
+        ),
+        migrations.RunPython(backfill_pickup_zone, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='riderequest',
+            index=models.Index(fields=['status', 'pickup_zone', 'id'], name='rides_status_zone_idx'),
+        ),
+    ]
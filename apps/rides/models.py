@@ -1,7 +1,18 @@
 from django.db import models
 from apps.core.models import BaseModel
+from apps.pooling.spatial import zone_for
 from apps.users.models import User
 
+
+class RideRequestQuerySet(models.QuerySet):
+    def bulk_create(self, objs, *args, **kwargs):
+        # bulk_create skips save(), so stamp the pickup zone here
+        objs = list(objs)
+        for obj in objs:
+            obj.assign_pickup_zone()
+        return super().bulk_create(objs, *args, **kwargs)
+
+
 class RideRequest(BaseModel):
     class Status(models.TextChoices):
         PENDING = 'pending', 'Pending'
@@ -34,6 +45,21 @@ class RideRequest(BaseModel):
         default=Status.PENDING,
         db_index=True
     )
+    # Matching partition of the pickup (apps.pooling.spatial.zone_for), so
+    # zone sweeps select their pending requests in SQL
+    pickup_zone = models.CharField(max_length=32, blank=True, default='', editable=False)
+
+    objects = RideRequestQuerySet.as_manager()
+
+    def assign_pickup_zone(self):
+        self.pickup_zone = zone_for(self.pickup_lat, self.pickup_lng)
+
+    def save(self, *args, **kwargs):
+        self.assign_pickup_zone()
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and {'pickup_lat', 'pickup_lng'} & set(update_fields):
+            kwargs['update_fields'] = {*update_fields, 'pickup_zone'}
+        super().save(*args, **kwargs)
 
     def __str__(self):
         return f"RideRequest {self.id} - {self.user.name} ({self.status})"
@@ -42,6 +68,10 @@ class RideRequest(BaseModel):
         verbose_name = "Ride Request"
         verbose_name_plural = "Ride Requests"
         ordering = ['-created_at']
+        indexes = [
+            # Zone sweeps: pending requests of one zone in arrival order
+            models.Index(fields=['status', 'pickup_zone', 'id'], name='rides_status_zone_idx'),
+        ]
 
 
 class Cab(BaseModel):
@@ -1,3 +1,4 @@
+from django.conf import settings
 from rest_framework import serializers
 from .models import RideRequest
 
@@ -19,3 +20,23 @@ class RequestRideInputSerializer(serializers.Serializer):
     luggage_units = serializers.IntegerField(min_value=0, default=1)
     detour_tolerance_minutes = serializers.IntegerField(min_value=0, default=15)
     user_id = serializers.IntegerField() # Temporary for now since we don't have auth fully setup
+
+class BulkRequestRideInputSerializer(serializers.Serializer):
+    # Items are validated one by one with RequestRideInputSerializer so that
+    # a bad item is reported without rejecting the whole batch
+    requests = serializers.ListField(
+        child=serializers.DictField(),
+        allow_empty=False,
+        max_length=getattr(settings, 'RIDES_BULK_MAX_REQUESTS', 1000)
+    )
+
+class CabLocationPingSerializer(serializers.Serializer):
+    lat = serializers.FloatField(min_value=-90.0, max_value=90.0)
+    lng = serializers.FloatField(min_value=-180.0, max_value=180.0)
+
+class BulkCancelRidesInputSerializer(serializers.Serializer):
+    ride_ids = serializers.ListField(
+        child=serializers.IntegerField(),
+        allow_empty=False,
+        max_length=getattr(settings, 'RIDES_BULK_MAX_REQUESTS', 1000)
+    )
@@ -1,8 +1,9 @@
 from celery import shared_task
+from django.conf import settings
+from django.core.cache import cache
 import logging
 from apps.rides.models import RideRequest
-from apps.pooling.models import Pool, PoolMember
-from apps.pooling.services import PoolingEngine, RouteOptimizer
+from apps.pooling.services import PoolingEngine, release_cancelled_rides, sync_pool_routes
 
 logger = logging.getLogger(__name__)
 
@@ -10,16 +11,124 @@ logger = logging.getLogger(__name__)
 def match_pool_task(self, ride_request_id):
     """
     Task to find a pool or cab for a specific ride request.
+    Matches only this request; if it stays pending, the zone's coalesced
+    sweep retries it together with its neighbours.
     """
     logger.info(f"Starting match_pool_task for request {ride_request_id}")
     try:
         engine = PoolingEngine()
-        results = engine.process_pending_requests()
+        results = engine.match_request(ride_request_id)
         logger.info(f"match_pool_task completed. Results: {results}")
     except Exception as exc:
         logger.error(f"Error in match_pool_task: {exc}")
         raise self.retry(exc=exc, countdown=5)
 
+    if results["remained_pending"]:
+        ride_request = RideRequest.objects.filter(id=ride_request_id).only('pickup_zone').first()
+        if ride_request:
+            trigger_matching(ride_request)
+
+@shared_task(bind=True, max_retries=3)
+def match_requests_task(self, ride_request_ids):
+    """
+    One batch matching run over a set of requests ingested together
+    (see the bulk request endpoint), instead of one task per request.
+    """
+    logger.info(f"Starting match_requests_task for {len(ride_request_ids)} requests")
+    try:
+        results = PoolingEngine().process_request_batch(ride_request_ids)
+        logger.info(f"match_requests_task completed. Results: {results}")
+        return results
+    except Exception as exc:
+        logger.error(f"Error in match_requests_task: {exc}")
+        raise self.retry(exc=exc, countdown=5)
+
+@shared_task
+def drain_ride_stream_task():
+    """
+    Periodic consumer of the write-behind ride stream (RIDES_WRITE_BEHIND):
+    bulk inserts buffered requests and batch-matches them chunk by chunk.
+    """
+    from .ingest import ride_ingest_buffer
+
+    # One drainer at a time; the TTL frees the flag if a worker dies mid-drain
+    if not cache.add("rides:stream_drain", 1, timeout=300):
+        return {}
+    try:
+        results = ride_ingest_buffer.drain()
+    finally:
+        cache.delete("rides:stream_drain")
+    if results["chunks"]:
+        logger.info(f"drain_ride_stream_task completed. Results: {results}")
+    return results
+
+@shared_task
+def flush_cab_locations_task():
+    """
+    Periodic batched persistence of driver pings (CAB_LOCATION_BACKEND=redis):
+    one bulk_update per CAB_LOCATION_FLUSH_BATCH changed cabs.
+    """
+    from .locations import cab_locations
+
+    flushed = cab_locations.flush()
+    if flushed:
+        logger.info(f"flush_cab_locations_task persisted {flushed} cab positions")
+    return flushed
+
+@shared_task
+def sweep_pending_requests_task():
+    """
+    Periodic safety net (see CELERY_BEAT_SCHEDULE): batch-matches every
+    pending request across all zones, skipping zones another worker holds.
+    """
+    results = PoolingEngine().process_pending_batch()
+    logger.info(f"sweep_pending_requests_task completed. Results: {results}")
+    return results
+
+def _sweep_flag_key(zone):
+    return f"pooling:sweep_scheduled:{zone}"
+
+def trigger_matching(ride_request):
+    """
+    Coalesces matching triggers into micro-batches per pickup zone.
+
+    The first trigger in a zone schedules one `match_zone_task` after the
+    batch window; every request arriving while that sweep is queued is
+    simply picked up by it instead of enqueueing another one.
+    """
+    # The stored zone, which is what the sweep selects on
+    zone = ride_request.pickup_zone
+    window = settings.POOLING_BATCH_WINDOW_SECONDS
+
+    # cache.add is atomic: only one caller per zone wins until the flag is cleared.
+    # The TTL is a safety net in case the scheduled task is lost.
+    if cache.add(_sweep_flag_key(zone), 1, timeout=window + 60):
+        match_zone_task.apply_async((zone,), countdown=window)
+
+@shared_task(bind=True, max_retries=3)
+def match_zone_task(self, zone, after_id=None):
+    """
+    Micro-batch sweep of one pickup zone, capped at POOLING_MAX_BATCH_SIZE
+    requests. Larger backlogs are drained in chained chunks.
+    """
+    # Requests arriving from now on are not in this snapshot, so let them
+    # schedule the next sweep
+    cache.delete(_sweep_flag_key(zone))
+
+    logger.info(f"Starting match_zone_task for zone {zone}")
+    try:
+        engine = PoolingEngine()
+        results = engine.process_pending_batch(
+            zone=zone, limit=settings.POOLING_MAX_BATCH_SIZE, after_id=after_id
+        )
+        logger.info(f"match_zone_task completed for zone {zone}. Results: {results}")
+    except Exception as exc:
+        logger.error(f"Error in match_zone_task: {exc}")
+        raise self.retry(exc=exc, countdown=5)
+
+    if results.get("cursor"):
+        match_zone_task.delay(zone, after_id=results["cursor"])
+
 @shared_task(bind=True, max_retries=3)
 def sync_pool_route_task(self, pool_id):
     """
@@ -27,54 +136,49 @@ def sync_pool_route_task(self, pool_id):
     """
     logger.info(f"Starting sync_pool_route_task for pool {pool_id}")
     try:
-        pool = Pool.objects.get(id=pool_id)
-        members = pool.members.select_related('ride_request').all()
-        
-        if not members.exists():
-            pool.status = Pool.Status.CANCELLED
-            pool.save()
-            return "Pool emptied and cancelled."
-
-        optimizer = RouteOptimizer()
-        
-        # Prepare data for optimizer
-        members_data = []
-        for m in members:
-            members_data.append({
-                'id': m.ride_request_id,
-                'pickup': (float(m.ride_request.pickup_lat), float(m.ride_request.pickup_lng)),
-                'drop': (float(m.ride_request.drop_lat), float(m.ride_request.drop_lng)),
-                'tolerance': m.ride_request.detour_tolerance_minutes
-            })
-
-        optimized_stops = optimizer.optimize_route(
-            float(pool.cab.current_lat), 
-            float(pool.cab.current_lng), 
-            members_data
-        )
-
-        # Update sequence orders based on optimized stops
-        # For simplicity in this dummy engine, we just update the Member sequence
-        for idx, stop in enumerate(optimized_stops):
-            if stop['type'] == 'PICKUP':
-                member = members.get(ride_request_id=stop['id'])
-                member.sequence_order = idx + 1
-                member.save()
-
-        logger.info(f"Route optimized for pool {pool_id}")
-        
-    except Pool.DoesNotExist:
-        logger.error(f"Pool {pool_id} not found")
+        # Skips unchanged routes, cancels emptied pools and writes sequence
+        # positions and ETAs in one bulk_update
+        results = sync_pool_routes([pool_id])
+        logger.info(f"Route sync for pool {pool_id} completed. Results: {results}")
+        return results
     except Exception as exc:
         logger.error(f"Error in sync_pool_route_task: {exc}")
         raise self.retry(exc=exc, countdown=5)
 
+@shared_task(bind=True, max_retries=3)
+def apply_cancellations_task(self):
+    """
+    Coalesced cancellation run (see apps.rides.cancellation): releases every
+    cancelled ride's pool seats set-wise and resyncs each affected pool once.
+    Also scheduled on beat as a safety net for lost triggers.
+    """
+    from .cancellation import APPLY_FLAG_KEY, APPLY_LOCK_KEY, schedule_cancellations
+
+    # One run at a time (triggered and beat runs can overlap); the TTL frees
+    # the lock if a worker dies mid-run
+    if not cache.add(APPLY_LOCK_KEY, 1, timeout=300):
+        # The running pass may miss what triggered this one, so queue another
+        cache.delete(APPLY_FLAG_KEY)
+        schedule_cancellations()
+        return {"rides_released": 0, "pools_resynced": 0}
+
+    # Cancellations arriving from now on may miss this run, so let them schedule the next one
+    cache.delete(APPLY_FLAG_KEY)
+    try:
+        results = release_cancelled_rides()
+    except Exception as exc:
+        logger.error(f"Error in apply_cancellations_task: {exc}")
+        raise self.retry(exc=exc, countdown=5)
+    finally:
+        cache.delete(APPLY_LOCK_KEY)
+    if results["rides_released"]:
+        logger.info(f"apply_cancellations_task completed. Results: {results}")
+    return results
+
 @shared_task
 def handle_cancel_task(ride_request_id):
     """
-    Handles logic after a ride is cancelled: cleanup and route updates.
+    No longer enqueued: cancellations are applied by apply_cancellations_task.
+    Kept so that messages already in the broker are still consumed.
     """
-    logger.info(f"Cleaning up after cancellation of request {ride_request_id}")
-    # Logic is largely handled via the view, but we ensure route sync happens
-    # This acts as a secondary safety check or for additional cleanup (metering, etc)
-    pass
+    logger.info(f"Ignoring legacy handle_cancel_task for request {ride_request_id}")
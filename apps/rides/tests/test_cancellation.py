@@ -0,0 +1,74 @@
+from decimal import Decimal
+from unittest import mock
+
+from django.core.cache import cache
+from django.test import TestCase
+from rest_framework.test import APIClient
+
+from apps.pooling.models import Pool, PoolMember
+from apps.pooling.services import release_cancelled_rides, remove_rides_from_pools
+from apps.rides.cancellation import ALREADY_CANCELLED, CANCELLED, NOT_FOUND, request_cancellations
+from apps.rides.models import Cab, RideRequest
+from apps.users.models import User
+
+AIRPORT = (Decimal('12.949000'), Decimal('77.668000'))
+CITY = (Decimal('12.971600'), Decimal('77.594600'))
+
+
+@mock.patch('apps.rides.tasks.apply_cancellations_task.apply_async')
+class CancellationReleaseTests(TestCase):
+    """A cancelled rider's seats are released exactly once."""
+
+    def setUp(self):
+        cache.clear()
+        user = User.objects.create(name="Rider", phone="+910000000000")
+        cab = Cab.objects.create(
+            driver_name="Driver", current_lat=AIRPORT[0], current_lng=AIRPORT[1], status=Cab.Status.BUSY
+        )
+        self.pool = Pool.objects.create(cab=cab)
+        self.rides = []
+        for seats in (2, 1):
+            ride = RideRequest.objects.create(
+                user=user, pickup_lat=AIRPORT[0], pickup_lng=AIRPORT[1], drop_lat=CITY[0], drop_lng=CITY[1],
+                seats_required=seats, status=RideRequest.Status.POOLED
+            )
+            PoolMember.objects.create(pool=self.pool, ride_request=ride)
+            self.rides.append(ride)
+
+    def usage(self):
+        return Pool.objects.filter(id=self.pool.id).values_list('seats_used', 'luggage_used').get()
+
+    def test_repeated_cancellations_release_seats_once(self, apply_async):
+        ride_id = self.rides[0].id
+        self.assertEqual(request_cancellations([ride_id, ride_id, 0]), {ride_id: CANCELLED, 0: NOT_FOUND})
+        self.assertEqual(request_cancellations([ride_id]), {ride_id: ALREADY_CANCELLED})
+        # Coalesced into one scheduled run
+        self.assertEqual(apply_async.call_count, 1)
+
+        self.assertEqual(release_cancelled_rides()["rides_released"], 1)
+        self.assertEqual(release_cancelled_rides()["rides_released"], 0)
+        self.assertEqual(self.usage(), (1, 1))
+        self.assertEqual(list(self.pool.members.values_list('ride_request_id', flat=True)), [self.rides[1].id])
+
+    def test_removing_rides_twice_releases_nothing_the_second_time(self, apply_async):
+        ride_ids = [ride.id for ride in self.rides]
+
+        self.assertEqual(remove_rides_from_pools(ride_ids), [self.pool.id])
+        self.assertEqual(remove_rides_from_pools(ride_ids), [])
+        self.assertEqual(self.usage(), (0, 0))
+
+    def test_cancel_endpoint_then_release(self, apply_async):
+        client = APIClient()
+        ride_id = self.rides[1].id
+
+        self.assertEqual(client.post(f'/api/rides/cancel-ride/{ride_id}/').status_code, 200)
+        self.assertEqual(client.post(f'/api/rides/cancel-ride/{ride_id}/').status_code, 400)
+        response = client.post(
+            '/api/rides/cancel-rides/bulk/', {'ride_ids': [ride_id, self.rides[0].id]}, format='json'
+        )
+        self.assertEqual(response.json()['cancelled'], 1)
+
+        release_cancelled_rides()
+        release_cancelled_rides()
+        self.assertEqual(self.usage(), (0, 0))
+        self.assertFalse(PoolMember.objects.exists())
@@ -0,0 +1,73 @@
+import tempfile
+from datetime import timedelta
+from pathlib import Path
+from unittest import mock
+
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from apps.rides.ingest import FileRideStream, ride_ingest_buffer
+from apps.rides.models import RideRequest
+from apps.users.models import User
+
+RIDE = {
+    'pickup_lat': '12.949000', 'pickup_lng': '77.668000', 'drop_lat': '12.971600', 'drop_lng': '77.594600',
+}
+
+
+@override_settings(RIDES_WRITE_BEHIND=True)
+class WriteBehindVisibilityTests(TestCase):
+    """Rides are visible between submit() and drain(), not only after it."""
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.user = User.objects.create(name="Rider", phone="+910000000000")
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        patcher = mock.patch.object(ride_ingest_buffer, '_stream', FileRideStream(Path(tmp.name) / 'rides.log'))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def submit(self):
+        response = self.client.post('/api/rides/request-ride/', {'user_id': self.user.id, **RIDE}, format='json')
+        self.assertEqual(response.status_code, 201)
+        return response.json()['request_id']
+
+    def test_pool_status_reports_queued_rides(self):
+        ride_id = self.submit()
+        self.assertFalse(RideRequest.objects.filter(id=ride_id).exists())
+
+        for url in (f'/api/rides/pool-status/{ride_id}/', f'/api/rides/async/pool-status/{ride_id}/'):
+            with self.subTest(url=url):
+                response = self.client.get(url)
+                self.assertEqual(response.status_code, 202)
+                self.assertEqual(response.json(), {'request_id': ride_id, 'status': 'queued'})
+
+        ride_ingest_buffer.drain()
+        self.assertEqual(self.client.get(f'/api/rides/pool-status/{ride_id}/').status_code, 200)
+        self.assertEqual(self.client.get(f'/api/rides/pool-status/{ride_id + 1000}/').status_code, 404)
+
+    def test_drained_rides_keep_their_request_time(self):
+        submitted_at = timezone.now() - timedelta(minutes=5)
+        with mock.patch('apps.rides.ingest.timezone.now', return_value=submitted_at):
+            ride_id = self.submit()
+
+        ride_ingest_buffer.drain()
+        self.assertEqual(RideRequest.objects.get(id=ride_id).created_at, submitted_at)
+
+    def test_cancelling_a_queued_ride_applies_on_drain(self):
+        ride_id, kept_id = self.submit(), self.submit()
+
+        response = self.client.post(f'/api/rides/cancel-ride/{ride_id}/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.client.post(f'/api/rides/cancel-ride/{ride_id}/').status_code, 400)
+        self.assertEqual(self.client.get(f'/api/rides/pool-status/{ride_id}/').json()['status'], 'cancelled')
+
+        results = ride_ingest_buffer.drain()
+        self.assertEqual(results['inserted'], 2)
+        self.assertEqual(results['cancelled'], 1)
+        self.assertEqual(RideRequest.objects.get(id=ride_id).status, RideRequest.Status.CANCELLED)
+        self.assertEqual(RideRequest.objects.get(id=kept_id).status, RideRequest.Status.PENDING)
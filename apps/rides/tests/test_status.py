@@ -0,0 +1,42 @@
+from datetime import timedelta
+from decimal import Decimal
+
+from django.core.cache import cache
+from django.test import TestCase
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from apps.pooling.models import Pool, PoolMember
+from apps.rides.models import Cab, RideRequest
+from apps.users.models import User
+
+AIRPORT = (Decimal('12.949000'), Decimal('77.668000'))
+CITY = (Decimal('12.971600'), Decimal('77.594600'))
+
+
+class PoolStatusFormatTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        user = User.objects.create(name="Rider", phone="+910000000000")
+        cab = Cab.objects.create(driver_name="Driver", current_lat=AIRPORT[0], current_lng=AIRPORT[1])
+        self.ride = RideRequest.objects.create(
+            user=user, pickup_lat=AIRPORT[0], pickup_lng=AIRPORT[1], drop_lat=CITY[0], drop_lng=CITY[1],
+            status=RideRequest.Status.POOLED
+        )
+        pickup_eta = timezone.now().replace(microsecond=123456)
+        PoolMember.objects.create(
+            pool=Pool.objects.create(cab=cab), ride_request=self.ride,
+            pickup_eta=pickup_eta, drop_eta=pickup_eta + timedelta(minutes=40)
+        )
+
+    def test_async_view_renders_the_same_json_as_the_drf_view(self):
+        sync_response = self.client.get(f'/api/rides/pool-status/{self.ride.id}/')
+        async_response = self.client.get(f'/api/rides/async/pool-status/{self.ride.id}/')
+
+        self.assertEqual(sync_response.status_code, 200)
+        self.assertEqual(async_response.status_code, 200)
+        self.assertIn('.123456', sync_response.json()['pickup_eta'])
+        self.assertEqual(async_response.content, sync_response.content)
+        self.assertEqual(async_response['Content-Type'], 'application/json')
@@ -1,8 +1,16 @@
 from django.urls import path
-from .views import request_ride, cancel_ride, pool_status
+from .views import request_ride, request_rides_bulk, cancel_ride, cancel_rides_bulk, pool_status, cab_location_ping
+from .async_views import request_ride_async, pool_status_async
 
 urlpatterns = [
     path('request-ride/', request_ride, name='request_ride'),
+    path('request-rides/bulk/', request_rides_bulk, name='request_rides_bulk'),
     path('cancel-ride/<int:ride_id>/', cancel_ride, name='cancel_ride'),
+    path('cancel-rides/bulk/', cancel_rides_bulk, name='cancel_rides_bulk'),
     path('pool-status/<int:ride_id>/', pool_status, name='pool_status'),
+    path('cabs/<int:cab_id>/location/', cab_location_ping, name='cab_location_ping'),
+
+    # Async variants, for serving under ASGI
+    path('async/request-ride/', request_ride_async, name='request_ride_async'),
+    path('async/pool-status/<int:ride_id>/', pool_status_async, name='pool_status_async'),
 ]
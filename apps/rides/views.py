@@ -4,15 +4,46 @@ from rest_framework.permissions import AllowAny
 from rest_framework.response import Response
 from drf_yasg.utils import swagger_auto_schema
 from drf_yasg import openapi
-from .serializers import RequestRideInputSerializer
+from django.db import connection, transaction
+from .serializers import (
+    BulkCancelRidesInputSerializer, BulkRequestRideInputSerializer, CabLocationPingSerializer, RequestRideInputSerializer
+)
 from .models import RideRequest
-from apps.users.models import User
-from .tasks import match_pool_task, sync_pool_route_task, handle_cancel_task
+from .ingest import ride_ingest_buffer
+from .locations import cab_locations
+from apps.core.entity_cache import cab_cache, user_cache
+from .tasks import match_pool_task, match_requests_task
+from .cancellation import ALREADY_CANCELLED, CANCELLED, NOT_FOUND, request_cancellations
+from apps.pooling.status import ride_status_cache
+from apps.pricing.demand import demand_tracker
 
 class RideRequestResponseSerializer(serializers.Serializer):
     request_id = serializers.IntegerField()
     status = serializers.CharField()
 
+class BulkRideResultSerializer(serializers.Serializer):
+    index = serializers.IntegerField()
+    request_id = serializers.IntegerField(allow_null=True)
+    status = serializers.CharField()
+    errors = serializers.DictField(required=False)
+
+class BulkRideResponseSerializer(serializers.Serializer):
+    created = serializers.IntegerField()
+    failed = serializers.IntegerField()
+    results = BulkRideResultSerializer(many=True)
+
+class BulkCancelResultSerializer(serializers.Serializer):
+    request_id = serializers.IntegerField()
+    status = serializers.ChoiceField(choices=[CANCELLED, ALREADY_CANCELLED, NOT_FOUND])
+
+class BulkCancelResponseSerializer(serializers.Serializer):
+    cancelled = serializers.IntegerField()
+    results = BulkCancelResultSerializer(many=True)
+
+class CabLocationResponseSerializer(serializers.Serializer):
+    cab_id = serializers.IntegerField()
+    status = serializers.CharField()
+
 class PoolStatusResponseSerializer(serializers.Serializer):
     pool_id = serializers.IntegerField()
     cab_id = serializers.IntegerField()
@@ -34,27 +65,95 @@ def request_ride(request):
     serializer = RequestRideInputSerializer(data=request.data)
     if serializer.is_valid():
         data = serializer.validated_data
-        try:
-            user = User.objects.get(id=data.pop('user_id'))
-            
-            ride_request = RideRequest.objects.create(
-                user=user,
-                **data
-            )
-            
-            # Trigger async pooling task
-            match_pool_task.delay(ride_request.id)
-            
+        # Hot users are served from the two-tier entity cache
+        user = user_cache.get(data.pop('user_id'))
+        if user is None:
+            return Response({"error": "User not found"}, status=status.HTTP_404_NOT_FOUND)
+
+        if ride_ingest_buffer.enabled:
+            # Buffered: inserted and matched by drain_ride_stream_task
+            ride_id = ride_ingest_buffer.submit({**data, 'user_id': user.id})
+            demand_tracker.record_request(data['pickup_lat'], data['pickup_lng'])
             return Response({
-                "request_id": ride_request.id,
+                "request_id": ride_id,
                 "status": "Ride request received and pooling started."
             }, status=status.HTTP_201_CREATED)
-            
-        except User.DoesNotExist:
-            return Response({"error": "User not found"}, status=status.HTTP_404_NOT_FOUND)
+
+        ride_request = RideRequest.objects.create(
+            user=user,
+            **data
+        )
+
+        # Feeds the per-cell surge multiplier used by pricing
+        demand_tracker.record_request(ride_request.pickup_lat, ride_request.pickup_lng)
+
+        # Trigger async pooling for just this request
+        match_pool_task.delay(ride_request.id)
+
+        return Response({
+            "request_id": ride_request.id,
+            "status": "Ride request received and pooling started."
+        }, status=status.HTTP_201_CREATED)
             
     return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
+@swagger_auto_schema(
+    method='post',
+    request_body=BulkRequestRideInputSerializer,
+    responses={201: BulkRideResponseSerializer, 400: BulkRideResponseSerializer},
+    operation_description="Submit many ride requests at once (partner feeds); returns one result per item."
+)
+@api_view(['POST'])
+@permission_classes([AllowAny])
+def request_rides_bulk(request):
+    envelope = BulkRequestRideInputSerializer(data=request.data)
+    if not envelope.is_valid():
+        return Response(envelope.errors, status=status.HTTP_400_BAD_REQUEST)
+    items = envelope.validated_data['requests']
+
+    # One validation pass; invalid items get their errors, the rest go on
+    results = [{"index": idx, "request_id": None} for idx in range(len(items))]
+    item_serializer = RequestRideInputSerializer()
+    valid = []
+    for idx, item in enumerate(items):
+        try:
+            valid.append((idx, item_serializer.run_validation(item)))
+        except serializers.ValidationError as e:
+            results[idx].update(status="invalid", errors=e.detail)
+
+    # Users for every valid item, at most one query for the cache misses
+    users = user_cache.get_many(data['user_id'] for _, data in valid)
+    rides, ride_indexes = [], []
+    for idx, data in valid:
+        user = users.get(data.pop('user_id'))
+        if user is None:
+            results[idx].update(status="invalid", errors={"user_id": ["User not found"]})
+            continue
+        rides.append(RideRequest(user=user, **data))
+        ride_indexes.append(idx)
+
+    if rides:
+        with transaction.atomic():
+            if connection.features.can_return_rows_from_bulk_insert:
+                RideRequest.objects.bulk_create(rides, batch_size=500)
+            else:
+                # Backends without RETURNING can't hand back ids from a bulk insert
+                for ride in rides:
+                    ride.save()
+
+        for idx, ride in zip(ride_indexes, rides):
+            results[idx].update(request_id=ride.id, status="created")
+            demand_tracker.record_request(ride.pickup_lat, ride.pickup_lng)
+
+        # A single matching run for the whole batch
+        match_requests_task.delay([ride.id for ride in rides])
+
+    return Response({
+        "created": len(rides),
+        "failed": len(items) - len(rides),
+        "results": results
+    }, status=status.HTTP_201_CREATED if rides else status.HTTP_400_BAD_REQUEST)
+
 @swagger_auto_schema(
     method='post',
     responses={200: RideRequestResponseSerializer, 400: 'Bad Request', 404: 'Ride Request Not Found'},
@@ -63,74 +162,74 @@ def request_ride(request):
 @api_view(['POST'])
 @permission_classes([AllowAny])
 def cancel_ride(request, ride_id):
-    try:
-        ride_request = RideRequest.objects.get(id=ride_id)
-        
-        # Check if already cancelled
-        if ride_request.status == RideRequest.Status.CANCELLED:
-            return Response({"error": "Ride already cancelled"}, status=status.HTTP_400_BAD_REQUEST)
-        
-        # Update status
-        ride_request.status = RideRequest.Status.CANCELLED
-        ride_request.save()
-
-        # Handle Pool memberships
-        from apps.pooling.models import PoolMember
-        memberships = PoolMember.objects.filter(ride_request=ride_request)
-        
-        pool_ids_to_recalculate = list(memberships.values_list('pool_id', flat=True))
-        
-        # Remove from pools
-        memberships.delete()
-        
-        # Trigger route recalculation for affected pools
-        for pool_id in pool_ids_to_recalculate:
-            sync_pool_route_task.delay(pool_id)
-        
-        handle_cancel_task.delay(ride_id)
-            
-        return Response({
-            "request_id": ride_id,
-            "status": "Ride cancelled and pools updated."
-        })
-        
-    except RideRequest.DoesNotExist:
+    outcome = request_cancellations([ride_id])[ride_id]
+    if outcome == NOT_FOUND:
         return Response({"error": "Ride request not found"}, status=status.HTTP_404_NOT_FOUND)
+    if outcome == ALREADY_CANCELLED:
+        return Response({"error": "Ride already cancelled"}, status=status.HTTP_400_BAD_REQUEST)
+
+    # Pool seats and routes are updated by the next coalesced cancellation run
+    return Response({
+        "request_id": ride_id,
+        "status": "Ride cancelled; pool update queued."
+    })
+
+@swagger_auto_schema(
+    method='post',
+    request_body=BulkCancelRidesInputSerializer,
+    responses={200: BulkCancelResponseSerializer, 400: 'Bad Request'},
+    operation_description="Cancel many ride requests at once (e.g. a delayed flight); returns one outcome per ride."
+)
+@api_view(['POST'])
+@permission_classes([AllowAny])
+def cancel_rides_bulk(request):
+    serializer = BulkCancelRidesInputSerializer(data=request.data)
+    if not serializer.is_valid():
+        return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+    outcomes = request_cancellations(serializer.validated_data['ride_ids'])
+    return Response({
+        "cancelled": sum(1 for outcome in outcomes.values() if outcome == CANCELLED),
+        "results": [{"request_id": ride_id, "status": outcome} for ride_id, outcome in outcomes.items()]
+    })
 
 @swagger_auto_schema(
     method='get',
-    responses={200: PoolStatusResponseSerializer, 404: 'Ride Request Not Found'},
-    operation_description="Get the current status of a ride request including its pool assignment."
+    responses={200: PoolStatusResponseSerializer, 202: RideRequestResponseSerializer, 404: 'Ride Request Not Found'},
+    operation_description=(
+        "Get the current status of a ride request including its pool assignment. "
+        "Rides accepted by write-behind ingestion but not stored yet return 202 with status 'queued'."
+    )
 )
 @api_view(['GET'])
 @permission_classes([AllowAny])
 def pool_status(request, ride_id):
-    try:
-        ride_request = RideRequest.objects.get(id=ride_id)
-        
-        # Find the pool membership for this ride
-        from apps.pooling.models import PoolMember
-        membership = PoolMember.objects.filter(ride_request=ride_request).first()
-        
-        if not membership:
-            return Response({
-                "status": ride_request.status,
-                "message": "Ride is not currently assigned to a pool."
-            })
-
-        pool = membership.pool
-        
-        # Construct response
-        # Note: 'price' is a placeholder for now as pricing app is empty
-        return Response({
-            "pool_id": pool.id,
-            "cab_id": pool.cab.id,
-            "pickup_eta": membership.pickup_eta,
-            "drop_eta": membership.drop_eta,
-            "price": 0.0, # Placeholder
-            "passenger_count": pool.members.count(),
-            "status": ride_request.status
-        })
-        
-    except RideRequest.DoesNotExist:
+    # Served from the per-ride read model: no queries on a cache hit
+    payload = ride_status_cache.get_or_build(ride_id)
+    if payload is None:
+        queued_state = ride_ingest_buffer.queued_state(ride_id)
+        if queued_state is not None:
+            # Accepted, but its write-behind chunk hasn't been drained yet
+            return Response({"request_id": ride_id, "status": queued_state}, status=status.HTTP_202_ACCEPTED)
         return Response({"error": "Ride request not found"}, status=status.HTTP_404_NOT_FOUND)
+    return Response(payload)
+
+@swagger_auto_schema(
+    method='post',
+    request_body=CabLocationPingSerializer,
+    responses={202: CabLocationResponseSerializer, 400: 'Bad Request', 404: 'Cab Not Found'},
+    operation_description="Report a cab's current position (driver device ping, every few seconds)."
+)
+@api_view(['POST'])
+@permission_classes([AllowAny])
+def cab_location_ping(request, cab_id):
+    serializer = CabLocationPingSerializer(data=request.data)
+    if not serializer.is_valid():
+        return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+    # Existence check from the entity cache; the ping itself touches no table
+    if cab_cache.get(cab_id) is None:
+        return Response({"error": "Cab not found"}, status=status.HTTP_404_NOT_FOUND)
+
+    cab_locations.record(cab_id, serializer.validated_data['lat'], serializer.validated_data['lng'])
+    return Response({"cab_id": cab_id, "status": "accepted"}, status=status.HTTP_202_ACCEPTED)
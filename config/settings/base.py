@@ -1,4 +1,5 @@
 import os
+import sys
 from pathlib import Path
 import environ
 
@@ -15,6 +16,8 @@ environ.Env.read_env(os.path.join(BASE_DIR, '.env'))
 SECRET_KEY = env('SECRET_KEY', default='django-insecure-smart-airport-pooling-key')
 
 DEBUG = env('DEBUG')
+# Running under `manage.py test`
+TESTING = len(sys.argv) > 1 and sys.argv[1] == 'test'
 
 ALLOWED_HOSTS = env.list('ALLOWED_HOSTS', default=['*'])
 
@@ -170,6 +173,131 @@ CELERY_TIMEZONE = TIME_ZONE
 CELERY_TASK_ALWAYS_EAGER = env.bool('CELERY_TASK_ALWAYS_EAGER', default=DEBUG)
 CELERY_TASK_EAGER_PROPAGATES = True
 
+# Pooling engine
+# Cell size of the in-memory spatial grid and how often it is rebuilt from the DB
+POOLING_GRID_CELL_KM = env.float('POOLING_GRID_CELL_KM', default=1.0)
+POOLING_INDEX_REFRESH_SECONDS = env.float('POOLING_INDEX_REFRESH_SECONDS', default=30)
+# Size of a matching partition; each zone is matched under its own lock.
+# Requests store their zone when created, so only change it with no requests pending
+POOLING_ZONE_SIZE_KM = env.float('POOLING_ZONE_SIZE_KM', default=5.0)
+# Matching triggers in a zone are coalesced into one sweep per window,
+# each sweep taking at most POOLING_MAX_BATCH_SIZE requests
+POOLING_BATCH_WINDOW_SECONDS = env.float('POOLING_BATCH_WINDOW_SECONDS', default=1.0)
+POOLING_MAX_BATCH_SIZE = env.int('POOLING_MAX_BATCH_SIZE', default=500)
+# Cab assignment in batch matching: 'greedy' (arrival order) or 'optimal' (min-cost
+# assignment of one seed request per pickup cluster; the rest join their pools)
+POOLING_ASSIGNMENT_MODE = env('POOLING_ASSIGNMENT_MODE', default='greedy')
+# Full sweep of all pending requests, kept as a periodic safety net
+POOLING_SWEEP_INTERVAL_SECONDS = env.float('POOLING_SWEEP_INTERVAL_SECONDS', default=30)
+
+# Average driving speed (km/h) per hour of day 0-23, used for pickup/drop ETAs
+POOLING_SPEED_PROFILE_KMH = env.list('POOLING_SPEED_PROFILE_KMH', cast=float, default=[
+    40, 40, 40, 40, 40, 36,      # 00-05
+    30, 22, 18, 18, 22, 26,      # 06-11
+    26, 26, 26, 24, 22, 16,      # 12-17
+    16, 16, 20, 28, 32, 36,      # 18-23
+])
+
+# Largest accepted payload of the bulk ride request endpoint
+RIDES_BULK_MAX_REQUESTS = env.int('RIDES_BULK_MAX_REQUESTS', default=1000)
+
+# Cancellations are applied set-wise once per window, with one route resync per affected pool
+RIDES_CANCEL_WINDOW_SECONDS = env.float('RIDES_CANCEL_WINDOW_SECONDS', default=1.0)
+
+# Write-behind ingestion: request_ride appends to a durable stream ('file' or
+# 'redis') and drain_ride_stream_task bulk inserts and matches it in chunks
+RIDES_WRITE_BEHIND = env.bool('RIDES_WRITE_BEHIND', default=False)
+RIDES_WRITE_BEHIND_BACKEND = env('RIDES_WRITE_BEHIND_BACKEND', default='file')
+RIDES_WRITE_BEHIND_PATH = env('RIDES_WRITE_BEHIND_PATH', default=str(BASE_DIR / 'ride_stream.log'))
+RIDES_WRITE_BEHIND_FSYNC = env.bool('RIDES_WRITE_BEHIND_FSYNC', default=False)
+# The file stream drops its consumed prefix once the drain offset passes this size
+RIDES_WRITE_BEHIND_COMPACT_BYTES = env.int('RIDES_WRITE_BEHIND_COMPACT_BYTES', default=1 << 20)
+RIDES_WRITE_BEHIND_CHUNK = env.int('RIDES_WRITE_BEHIND_CHUNK', default=500)
+RIDES_WRITE_BEHIND_ID_BLOCK = env.int('RIDES_WRITE_BEHIND_ID_BLOCK', default=1000)
+RIDES_WRITE_BEHIND_DRAIN_SECONDS = env.float('RIDES_WRITE_BEHIND_DRAIN_SECONDS', default=1.0)
+# How long a submitted ride is reported as queued (and cancellable) before its
+# chunk is drained; keep it well above the worst expected drain backlog
+RIDES_WRITE_BEHIND_QUEUED_TTL_SECONDS = env.int('RIDES_WRITE_BEHIND_QUEUED_TTL_SECONDS', default=86400)
+
+# Driver location pings: latest position per cab ('memory' or 'redis'),
+# persisted to the Cab table in bulk every CAB_LOCATION_FLUSH_SECONDS.
+# 'memory' is per process, so Celery workers only see flushed positions;
+# use 'redis' unless CELERY_TASK_ALWAYS_EAGER
+CAB_LOCATION_BACKEND = env('CAB_LOCATION_BACKEND', default='memory')
+CAB_LOCATION_FLUSH_SECONDS = env.float('CAB_LOCATION_FLUSH_SECONDS', default=5.0)
+CAB_LOCATION_FLUSH_BATCH = env.int('CAB_LOCATION_FLUSH_BATCH', default=1000)
+
+# Route optimizer local search limits (per pool)
+ROUTE_OPTIMIZER_TIME_BUDGET_MS = env.float('ROUTE_OPTIMIZER_TIME_BUDGET_MS', default=20)
+ROUTE_OPTIMIZER_MAX_PASSES = env.int('ROUTE_OPTIMIZER_MAX_PASSES', default=50)
+# Pools with at most this many stops are solved exactly and memoized by
+# their stop set quantized to ROUTE_MEMO_PRECISION decimal places
+ROUTE_EXACT_MAX_STOPS = env.int('ROUTE_EXACT_MAX_STOPS', default=8)
+ROUTE_MEMO_PRECISION = env.int('ROUTE_MEMO_PRECISION', default=4)
+ROUTE_MEMO_SIZE = env.int('ROUTE_MEMO_SIZE', default=10000)
+# Per-pool route cache (Django cache), keyed by member set + cab position bucket
+ROUTE_CACHE_TTL_SECONDS = env.int('ROUTE_CACHE_TTL_SECONDS', default=3600)
+ROUTE_CACHE_CAB_BUCKET_DECIMALS = env.int('ROUTE_CACHE_CAB_BUCKET_DECIMALS', default=3)
+# pool_status read model per ride (Django cache), rebuilt on route syncs
+RIDE_STATUS_CACHE_TTL_SECONDS = env.int('RIDE_STATUS_CACHE_TTL_SECONDS', default=300)
+
+# Surge pricing from streaming demand: requests per pickup cell over a sliding
+# window vs. available cabs in the cell ('memory' or 'redis' counters).
+# Demand is recorded by the web process and read by Celery workers, so the
+# per-process 'memory' counters are only the default for DEBUG and tests
+PRICING_DEMAND_BACKEND = env('PRICING_DEMAND_BACKEND', default='memory' if DEBUG or TESTING else 'redis')
+PRICING_DEMAND_CELL_KM = env.float('PRICING_DEMAND_CELL_KM', default=1.0)
+PRICING_DEMAND_WINDOW_SECONDS = env.float('PRICING_DEMAND_WINDOW_SECONDS', default=300)
+PRICING_DEMAND_BUCKETS = env.int('PRICING_DEMAND_BUCKETS', default=30)
+PRICING_SURGE_THRESHOLD = env.float('PRICING_SURGE_THRESHOLD', default=1.0)
+PRICING_SURGE_STEP = env.float('PRICING_SURGE_STEP', default=0.25)
+PRICING_SURGE_MAX = env.float('PRICING_SURGE_MAX', default=2.0)
+PRICING_SUPPLY_RESYNC_SECONDS = env.float('PRICING_SUPPLY_RESYNC_SECONDS', default=60)
+
+# Fare configuration; changing any of these invalidates the quote cache
+PRICING_BASE_FARE = env.float('PRICING_BASE_FARE', default=50.0)
+PRICING_RATE_PER_KM = env.float('PRICING_RATE_PER_KM', default=12.0)
+PRICING_DETOUR_PENALTY = env.float('PRICING_DETOUR_PENALTY', default=0.8)
+# Fare previews are memoized (LRU) on inputs quantized to these buckets
+PRICING_QUOTE_CACHE_SIZE = env.int('PRICING_QUOTE_CACHE_SIZE', default=10000)
+PRICING_QUOTE_DISTANCE_BUCKET_KM = env.float('PRICING_QUOTE_DISTANCE_BUCKET_KM', default=0.1)
+PRICING_QUOTE_SURGE_BUCKET = env.float('PRICING_QUOTE_SURGE_BUCKET', default=0.05)
+PRICING_QUOTE_DETOUR_BUCKET_KM = env.float('PRICING_QUOTE_DETOUR_BUCKET_KM', default=0.1)
+
+CELERY_BEAT_SCHEDULE = {
+    'sweep-pending-requests': {
+        'task': 'apps.rides.tasks.sweep_pending_requests_task',
+        'schedule': POOLING_SWEEP_INTERVAL_SECONDS,
+    },
+    'apply-cancellations': {
+        'task': 'apps.rides.tasks.apply_cancellations_task',
+        'schedule': POOLING_SWEEP_INTERVAL_SECONDS,
+    },
+    'resync-demand-supply': {
+        'task': 'apps.pricing.tasks.resync_demand_supply_task',
+        'schedule': PRICING_SUPPLY_RESYNC_SECONDS,
+    },
+}
+
+if CAB_LOCATION_BACKEND == 'redis':
+    # The memory backend is flushed by a thread of the process receiving pings
+    CELERY_BEAT_SCHEDULE['flush-cab-locations'] = {
+        'task': 'apps.rides.tasks.flush_cab_locations_task',
+        'schedule': CAB_LOCATION_FLUSH_SECONDS,
+    }
+
+if RIDES_WRITE_BEHIND:
+    CELERY_BEAT_SCHEDULE['drain-ride-stream'] = {
+        'task': 'apps.rides.tasks.drain_ride_stream_task',
+        'schedule': RIDES_WRITE_BEHIND_DRAIN_SECONDS,
+    }
+
+# Two-tier User/Cab entity cache: process-local LRU entries are revalidated
+# against the shared cache's version stamps after ENTITY_CACHE_LOCAL_TTL_SECONDS
+ENTITY_CACHE_LOCAL_SIZE = env.int('ENTITY_CACHE_LOCAL_SIZE', default=10000)
+ENTITY_CACHE_LOCAL_TTL_SECONDS = env.float('ENTITY_CACHE_LOCAL_TTL_SECONDS', default=5.0)
+ENTITY_CACHE_SHARED_TTL_SECONDS = env.int('ENTITY_CACHE_SHARED_TTL_SECONDS', default=3600)
+
 # Cache configuration with Redis fallback to LocMem
 CACHES = {
     'default': {
@@ -30,5 +30,5 @@ urlpatterns = [
     path('api/rides/', include('apps.rides.urls')),
     # path('api/users/', include('apps.users.urls')),
     # path('api/pooling/', include('apps.pooling.urls')),
-    # path('api/pricing/', include('apps.pricing.urls')),
+    path('api/pricing/', include('apps.pricing.urls')),
 ]
@@ -1,3 +1,4 @@
+import argparse
 import asyncio
 import aiohttp
 import time
@@ -14,7 +15,11 @@ logging.basicConfig(
 logger = logging.getLogger(__name__)
 
 # Configuration
-BASE_URL = "http://localhost:8000/api/rides/request-ride/"
+# Sync DRF view (WSGI or ASGI) vs. the async view (ASGI only, see apps/rides/async_views.py)
+ENDPOINTS = {
+    "sync": "http://localhost:8000/api/rides/request-ride/",
+    "async": "http://localhost:8000/api/rides/async/request-ride/",
+}
 TOTAL_REQUESTS = 10000
 CONCURRENCY_LIMIT = 100  # Target requests per second
 TIMEOUT_SECONDS = 30
@@ -34,11 +39,11 @@ def generate_ride_data():
         "detour_tolerance_minutes": random.choice([15, 20, 30])
     }
 
-async def send_request(session, request_id, latencies):
+async def send_request(session, base_url, request_id, latencies):
     data = generate_ride_data()
     start_time = time.perf_counter()
     try:
-        async with session.post(BASE_URL, json=data, timeout=TIMEOUT_SECONDS) as response:
+        async with session.post(base_url, json=data, timeout=TIMEOUT_SECONDS) as response:
             end_time = time.perf_counter()
             latency = (end_time - start_time) * 1000 # to ms
             
@@ -52,16 +57,17 @@ async def send_request(session, request_id, latencies):
     except Exception as e:
         logger.error(f"Request {request_id} encountered an error: {e}")
 
-async def run_simulation():
+async def run_simulation(mode="sync"):
+    base_url = ENDPOINTS[mode]
     latencies = []
-    logger.info(f"Starting simulation: {TOTAL_REQUESTS} total requests at ~{CONCURRENCY_LIMIT} RPS")
+    logger.info(f"Starting {mode} simulation: {TOTAL_REQUESTS} total requests at ~{CONCURRENCY_LIMIT} RPS")
     
     start_sim = time.perf_counter()
     
     async with aiohttp.ClientSession() as session:
         tasks = []
         for i in range(1, TOTAL_REQUESTS + 1):
-            tasks.append(send_request(session, i, latencies))
+            tasks.append(send_request(session, base_url, i, latencies))
             
             # Simple rate limiting logic
             if i % CONCURRENCY_LIMIT == 0:
@@ -83,16 +89,32 @@ async def run_simulation():
         p95_latency = statistics.quantiles(latencies, n=20)[18]  # 95th percentile
         p99_latency = statistics.quantiles(latencies, n=100)[98] # 99th percentile
         
-        logger.info("=== Simulation Results ===")
+        logger.info(f"=== Simulation Results ({mode}) ===")
         logger.info(f"Total Requests Processed: {len(latencies)}")
         logger.info(f"Total Time Taken: {total_time:.2f} seconds")
         logger.info(f"Actual Throughput: {len(latencies)/total_time:.2f} requests/sec")
         logger.info(f"Average Latency: {avg_latency:.2f} ms")
         logger.info(f"P95 Latency: {p95_latency:.2f} ms")
         logger.info(f"P99 Latency: {p99_latency:.2f} ms")
+        return {"throughput": len(latencies) / total_time, "p99": p99_latency}
     else:
         logger.error("No successful requests recorded.")
 
+async def compare():
+    results = {mode: await run_simulation(mode) for mode in ENDPOINTS}
+    if all(results.values()):
+        logger.info("=== Sync vs. Async ===")
+        for mode, stats in results.items():
+            logger.info(f"{mode:>5}: {stats['throughput']:.2f} requests/sec, P99 {stats['p99']:.2f} ms")
+
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Ride request load test")
+    parser.add_argument("--mode", choices=["sync", "async", "both"], default="sync",
+                        help="endpoint to hit; 'both' runs them back to back and compares")
+    parser.add_argument("--requests", type=int, default=TOTAL_REQUESTS)
+    parser.add_argument("--concurrency", type=int, default=CONCURRENCY_LIMIT)
+    args = parser.parse_args()
+    TOTAL_REQUESTS, CONCURRENCY_LIMIT = args.requests, args.concurrency
+
     if TOTAL_REQUESTS > 0:
-        asyncio.run(run_simulation())
+        asyncio.run(compare() if args.mode == "both" else run_simulation(args.mode))